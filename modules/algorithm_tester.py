@@ -2,17 +2,27 @@
 from typing import Optional
 from typing import Tuple
 from map import Map
-from typing import List
+from typing import List, Dict, Sequence
 from location import Location
 from geopy.distance import geodesic
+from compiled_map import CompiledMap
+from spatial_index import SpatialIndex
+from heuristics import vincenty
+from search import SearchCancelled, SearchStats, get_search_algorithm, uniform
 import numpy as np
 
-import matplotlib.pyplot as plt
-
 
 from data_loader import get_map
 
+import argparse
+import json
+import math
+import os
+import platform
 import random
+import sys
+import time
+import tracemalloc
 
 def main():
     
@@ -52,6 +62,9 @@ def main():
     visualize_map(city_map, path, start_location, end_location)
 
 def visualize_map(city_map: Map, path: Optional[List[Tuple[float, float]]], start_name: str, end_name: str, path_on = True, text_on= True):
+    # Imported here so the benchmark can run without a display or matplotlib installed
+    import matplotlib.pyplot as plt
+
     # Create a plot
     plt.figure(figsize=(12, 8))
     ax = plt.gca()
@@ -99,5 +112,277 @@ def visualize_map(city_map: Map, path: Optional[List[Tuple[float, float]]], star
     # Show the plot
     plt.show()
 
+# Algorithms that blow up on larger graphs are only benchmarked up to this many nodes
+BENCHMARK_MAX_NODES = {"iterative deepening DFS": 20000, "iterative deepening a star": 5000}
+
+# Where benchmark_main saves its results by default, kept out of version control
+BENCHMARK_OUTPUT = os.path.join("results", "benchmark_results.json")
+
+# An algorithm is dropped from a graph after this many timed out queries
+BENCHMARK_MAX_TIMEOUTS = 3
+
+
+def random_geometric_map(n_nodes: int, seed: int = 0, k: int = 3, spacing: float = 0.0003) -> Map:
+    """
+    Builds a seeded random geometric graph around the campus, each location joined to its k nearest neighbours.
+
+    Args:
+        n_nodes (int): The number of locations.
+        seed (int): The random seed, the same seed always gives the same map.
+        k (int): The number of nearest neighbours each location is connected to.
+        spacing (float): The average distance between neighbouring locations, in degrees.
+
+    Returns:
+        Map: The generated map, every location is marked important and named by its id.
+    """
+    rng = np.random.default_rng(seed)
+    side = math.sqrt(n_nodes) * spacing
+    latitudes = 2.83 + rng.uniform(0, side, n_nodes)
+    longitudes = 101.70 + rng.uniform(0, side, n_nodes)
+
+    index = SpatialIndex.from_points((i, lat, lon) for i, (lat, lon) in enumerate(zip(latitudes.tolist(), longitudes.tolist())))
+    pairs = []
+    for i in range(n_nodes):
+        for j, _ in index.k_nearest((latitudes[i], longitudes[i]), k + 1):
+            if j != i:
+                pairs.append((min(i, j), max(i, j)))
+    pairs = np.unique(np.array(pairs, dtype=np.int64).reshape(-1, 2), axis=0)
+    sources, targets = pairs[:, 0], pairs[:, 1]
+
+    ids = [str(i) for i in range(n_nodes)]
+    graph = CompiledMap.from_edges(ids, ids, latitudes, longitudes, np.ones(n_nodes, dtype=bool), sources, targets,
+                                   vincenty(latitudes[sources], longitudes[sources], latitudes[targets], longitudes[targets]))
+    return Map.from_compiled(graph)
+
+
+def largest_component(graph: CompiledMap) -> List[int]:
+    """returns the node indices of the largest connected component, ignoring edge direction"""
+    offsets, targets, _ = graph.get_adjacency()
+    r_offsets, r_targets, _ = graph.get_reverse_adjacency()
+    component = [-1] * graph.get_num_nodes()
+    best = []
+    for root in range(graph.get_num_nodes()):
+        if component[root] != -1:
+            continue
+        component[root] = root
+        members, stack = [root], [root]
+        while stack:
+            node = stack.pop()
+            for e in range(offsets[node], offsets[node + 1]):
+                child = targets[e]
+                if component[child] == -1:
+                    component[child] = root
+                    members.append(child)
+                    stack.append(child)
+            for e in range(r_offsets[node], r_offsets[node + 1]):
+                child = r_targets[e]
+                if component[child] == -1:
+                    component[child] = root
+                    members.append(child)
+                    stack.append(child)
+        if len(members) > len(best):
+            best = members
+    return best
+
+
+def _time_limited_stats(seconds: Optional[float]) -> SearchStats:
+    """returns a SearchStats whose search raises SearchCancelled after the given time, on any platform and thread"""
+    stats = SearchStats()
+    if seconds is not None:
+        stats.set_deadline(time.monotonic() + seconds)
+    return stats
+
+
+def _percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50": None, "p90": None, "p99": None, "mean": None}
+    return {"p50": float(np.percentile(values, 50)), "p90": float(np.percentile(values, 90)),
+            "p99": float(np.percentile(values, 99)), "mean": float(np.mean(values))}
+
+
+def benchmark_graph(name: str, city_map: Map, pairs: List[Tuple[int, int]], heuristic: str = "precomputed",
+                    query_timeout: Optional[float] = 5.0) -> List[Dict]:
+    """
+    Benchmarks every search algorithm of the map on the given node index pairs.
+
+    Each query is run twice: once plainly for the latency, and once under tracemalloc with a SearchStats for the
+    peak memory and the number of nodes expanded. The distances are compared with a reference Dijkstra (uniform cost
+    search) to measure optimality.
+
+    Args:
+        name (str): The name of the graph in the results.
+        city_map (Map): The map to benchmark.
+        pairs (List[Tuple[int, int]]): The (initial, goal) node indices of the compiled map to query.
+        heuristic (str): The heuristic backend for the informed searches.
+        query_timeout (Optional[float]): Seconds after which the search of a query gives up, None for no limit.
+
+    Returns:
+        List[Dict]: One result record per algorithm.
+    """
+    graph = city_map.compile()
+    heuristic_fn = city_map.get_heuristic(heuristic)
+    reference = [uniform(graph, initial, goal)[1] for initial, goal in pairs]
+
+    records = []
+    for algorithm in city_map.get_all_search_algorithm():
+        record = {"graph": name, "nodes": graph.get_num_nodes(), "edges": graph.get_num_edges(), "algorithm": algorithm,
+                  "heuristic": heuristic, "queries": 0, "timeouts": 0, "skipped": False}
+        if graph.get_num_nodes() > BENCHMARK_MAX_NODES.get(algorithm, float('inf')):
+            record["skipped"] = True
+            records.append(record)
+            continue
+
+        search = get_search_algorithm(algorithm)
+        if search.__name__ == "contraction_hierarchies":
+            # The hierarchy is cached per compiled map, so it is built before timing
+            city_map.get_contraction_hierarchy()
+
+        latencies, expansions, peaks, ratios = [], [], [], []
+        for (initial, goal), best in zip(pairs, reference):
+            if record["timeouts"] >= BENCHMARK_MAX_TIMEOUTS:
+                break
+            try:
+                deadline_stats = _time_limited_stats(query_timeout)
+                start = time.perf_counter()
+                _, distance = search(graph, initial, goal, heuristic_fn, stats=deadline_stats)
+                latency = (time.perf_counter() - start) * 1000
+
+                stats = _time_limited_stats(query_timeout)
+                tracemalloc.start()
+                search(graph, initial, goal, heuristic_fn, stats=stats)
+                peak = tracemalloc.get_traced_memory()[1] / 1024
+            except SearchCancelled:
+                record["timeouts"] += 1
+                continue
+            finally:
+                tracemalloc.stop()
+
+            record["queries"] += 1
+            latencies.append(latency)
+            peaks.append(peak)
+            expansions.append(stats.get_nodes_expanded())
+            ratios.append(distance / best if best > 0 else 1.0)
+
+        record["latency_ms"] = _percentiles(latencies)
+        record["nodes_expanded"] = _percentiles(expansions)
+        record["peak_memory_kb"] = _percentiles(peaks)
+        record["optimality"] = {
+            "optimal_fraction": float(np.mean([ratio <= 1 + 1e-9 for ratio in ratios])) if ratios else None,
+            "mean_ratio": float(np.mean(ratios)) if ratios else None,
+            "max_ratio": float(np.max(ratios)) if ratios else None,
+        }
+        records.append(record)
+        print(f"{name:>14} {algorithm:>28}: p50 {record['latency_ms']['p50']} ms, {record['queries']} queries, {record['timeouts']} timeouts")
+    return records
+
+
+def run_benchmark(sizes: Sequence[int] = (100, 1000, 10000), n_queries: int = 20, seed: int = 0, include_xmum: bool = True,
+                  heuristic: str = "precomputed", query_timeout: Optional[float] = 5.0) -> Dict:
+    """
+    Runs the benchmark on seeded random geometric graphs of the given sizes and on the XMUM map.
+
+    Args:
+        sizes (Sequence[int]): The numbers of nodes of the random graphs.
+        n_queries (int): The number of random queries per graph, drawn from its largest connected component
+                         (between important locations for the XMUM map).
+        seed (int): The seed of the graphs and queries.
+        include_xmum (bool): Whether to benchmark the real campus map as well.
+        heuristic (str): The heuristic backend for the informed searches.
+        query_timeout (Optional[float]): Seconds after which the search of a query gives up, None for no limit.
+
+    Returns:
+        Dict: The run metadata and the result records, ready to be saved as JSON.
+    """
+    rng = random.Random(seed)
+    graphs = [(f"random-{n}", random_geometric_map(n, seed=seed)) for n in sizes]
+    if include_xmum:
+        graphs.append(("xmum", get_map()))
+
+    results = []
+    for name, city_map in graphs:
+        graph = city_map.compile()
+        if name == "xmum":
+            component = set(largest_component(graph))
+            nodes = [graph.get_index(loc.get_id()) for loc in city_map.get_important_loc()]
+            nodes = [node for node in nodes if node in component]
+        else:
+            nodes = largest_component(graph)
+        pairs = [tuple(rng.sample(nodes, 2)) for _ in range(n_queries)]
+        results.extend(benchmark_graph(name, city_map, pairs, heuristic, query_timeout))
+
+    return {
+        "meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(), "platform": platform.platform(),
+                 "seed": seed, "sizes": list(sizes), "queries": n_queries, "heuristic": heuristic, "query_timeout": query_timeout},
+        "results": results,
+    }
+
+
+def compare_benchmarks(baseline: Dict, current: Dict, tolerance: float = 0.25) -> List[str]:
+    """
+    Compares two benchmark runs and lists the regressions of the current one.
+
+    Args:
+        baseline (Dict): The earlier run, as saved by run_benchmark.
+        current (Dict): The new run.
+        tolerance (float): The relative increase of median latency or expansions that counts as a regression.
+
+    Returns:
+        List[str]: One message per regression, empty if there is none.
+    """
+    def key(record):
+        return (record["graph"], record["algorithm"], record.get("heuristic"))
+
+    old = {key(record): record for record in baseline["results"]}
+    regressions = []
+    for record in current["results"]:
+        before = old.get(key(record))
+        if before is None or record["skipped"] or before["skipped"]:
+            continue
+        label = f"{record['graph']} / {record['algorithm']}"
+        for metric in ("latency_ms", "nodes_expanded"):
+            if not record.get(metric) or not before.get(metric) or record[metric]["p50"] is None or before[metric]["p50"] is None:
+                continue
+            if record[metric]["p50"] > before[metric]["p50"] * (1 + tolerance):
+                regressions.append(f"{label}: median {metric} {before[metric]['p50']:.3f} -> {record[metric]['p50']:.3f}")
+        old_ratio, new_ratio = before["optimality"]["mean_ratio"], record["optimality"]["mean_ratio"]
+        if old_ratio is not None and new_ratio is not None and new_ratio > old_ratio + 1e-9:
+            regressions.append(f"{label}: mean path length ratio {old_ratio:.4f} -> {new_ratio:.4f}")
+        if record["timeouts"] > before["timeouts"]:
+            regressions.append(f"{label}: timeouts {before['timeouts']} -> {record['timeouts']}")
+    return regressions
+
+
+def benchmark_main(argv: Optional[List[str]] = None) -> int:
+    """command line entry point of the benchmark, returns 1 when regressions against --compare are found"""
+    parser = argparse.ArgumentParser(description="Benchmark the search algorithms of Map.")
+    parser.add_argument("--benchmark", action="store_true", help="run the benchmark instead of the visual test")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[100, 1000, 10000], help="node counts of the random graphs")
+    parser.add_argument("--queries", type=int, default=20, help="queries per graph")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--heuristic", default="precomputed")
+    parser.add_argument("--timeout", type=float, default=5.0, help="seconds before a query is abandoned")
+    parser.add_argument("--no-xmum", action="store_true", help="skip the real campus map")
+    parser.add_argument("--output", default=BENCHMARK_OUTPUT, help="where to save the results")
+    parser.add_argument("--compare", help="an earlier results file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.sizes, args.queries, args.seed, not args.no_xmum, args.heuristic, args.timeout)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare_benchmarks(json.load(f), results, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
 if __name__ == "__main__":
-        main()
\ No newline at end of file
+    if "--benchmark" in sys.argv[1:]:
+        sys.exit(benchmark_main())
+    main()
\ No newline at end of file
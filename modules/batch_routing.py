@@ -0,0 +1,126 @@
+from typing import Dict, Iterator, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from compiled_map import CompiledMap
+from search import PathNotFoundException, OPTIMAL_SEARCH_ALGORITHMS, dijkstra_tree, get_search_algorithm
+from heuristics import get_heuristic
+
+# One batch result: the position of the pair in the input, the node path (None if there is none) and its length
+BatchResult = Tuple[int, Optional[List[int]], float]
+
+# A task routes a group of pairs that share their origin (by_origin=True) or their destination
+Task = Tuple[bool, int, List[Tuple[int, int, int]]]
+
+# State of a worker process, set once by the pool initializer instead of being sent with every task
+_worker_graph : Optional[CompiledMap] = None
+_worker_heuristics : Dict[str, object] = {}
+
+
+def _init_worker(graph : CompiledMap):
+    global _worker_graph, _worker_heuristics
+    _worker_graph = graph
+    _worker_heuristics = {}
+
+
+def _route_tasks(tasks : List[Task], search_algorithm : str, heuristic : str) -> List[BatchResult]:
+    """routes the groups of a chunk on the worker's graph"""
+    graph = _worker_graph
+    search = get_search_algorithm(search_algorithm)
+    if heuristic not in _worker_heuristics:
+        _worker_heuristics[heuristic] = get_heuristic(graph, heuristic)
+
+    results = []
+    for by_origin, root, pairs in tasks:
+        if search in OPTIMAL_SEARCH_ALGORITHMS and len(pairs) > 1:
+            results.extend(_route_with_tree(graph, by_origin, root, pairs))
+            continue
+        for position, initial, goal in pairs:
+            try:
+                path, distance = search(graph, initial, goal, _worker_heuristics[heuristic])
+                results.append((position, path, distance))
+            except PathNotFoundException:
+                results.append((position, None, float('inf')))
+    return results
+
+
+def _route_with_tree(graph : CompiledMap, by_origin : bool, root : int, pairs : List[Tuple[int, int, int]]) -> List[BatchResult]:
+    """answers every pair of a group with one Dijkstra from the shared origin (or to the shared destination)"""
+    others = {goal if by_origin else initial for _, initial, goal in pairs}
+    distance, parent = dijkstra_tree(graph, root, reverse=not by_origin, stop_at=others)
+
+    results = []
+    for position, initial, goal in pairs:
+        other = goal if by_origin else initial
+        if distance[other] == float('inf'):
+            results.append((position, None, float('inf')))
+            continue
+        path = [other]
+        while path[-1] != root:
+            path.append(parent[path[-1]])
+        if by_origin:
+            path.reverse()
+        results.append((position, path, distance[other]))
+    return results
+
+
+def _make_tasks(pairs : List[Tuple[int, int]]) -> List[Task]:
+    """groups the pairs by origin or by destination, whichever gives fewer groups"""
+    by_origin = len({initial for initial, _ in pairs}) <= len({goal for _, goal in pairs})
+    groups : Dict[int, List[Tuple[int, int, int]]] = {}
+    for position, (initial, goal) in enumerate(pairs):
+        groups.setdefault(initial if by_origin else goal, []).append((position, initial, goal))
+    return [(by_origin, root, group) for root, group in groups.items()]
+
+
+def _chunk_tasks(tasks : List[Task], chunk_size : int) -> List[List[Task]]:
+    """packs groups into chunks of about chunk_size pairs so small groups do not each pay for a round trip"""
+    chunks, chunk, size = [], [], 0
+    for task in tasks:
+        chunk.append(task)
+        size += len(task[2])
+        if size >= chunk_size:
+            chunks.append(chunk)
+            chunk, size = [], 0
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def route_batch(graph : CompiledMap, pairs : List[Tuple[int, int]], search_algorithm : str = "uniform", heuristic : str = "precomputed",
+                max_workers : Optional[int] = None, chunk_size : int = 64) -> Iterator[BatchResult]:
+    """
+    Routes many (initial, goal) node index pairs, yielding results as soon as they are ready.
+
+    Pairs are grouped by their origin or destination. With an optimal search algorithm a group of several pairs is
+    answered by a single Dijkstra from (or to) the shared node, which stops once all of the group's other ends are
+    settled. The groups are spread over a process pool whose workers receive the compiled map once, through the
+    pool initializer.
+
+    Args:
+        graph (CompiledMap): The compiled map to route on.
+        pairs (List[Tuple[int, int]]): The (initial, goal) node indices.
+        search_algorithm (str): Any name accepted by Map.shortest_path.
+        heuristic (str): The heuristic backend for informed searches.
+        max_workers (Optional[int]): The number of worker processes, None for one per CPU and 0 to route in this process.
+        chunk_size (int): The approximate number of pairs sent to a worker at a time.
+
+    Yields:
+        BatchResult: (position of the pair in the input, node path or None if unreachable, distance), in completion order.
+    """
+    get_search_algorithm(search_algorithm) # Fail early on an invalid name
+    chunks = _chunk_tasks(_make_tasks(list(pairs)), chunk_size)
+
+    if max_workers == 0:
+        _init_worker(graph)
+        for chunk in chunks:
+            yield from _route_tasks(chunk, search_algorithm, heuristic)
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(graph,)) as executor:
+        futures = [executor.submit(_route_tasks, chunk, search_algorithm, heuristic) for chunk in chunks]
+        try:
+            for future in as_completed(futures):
+                yield from future.result()
+        finally:
+            # Stop queued chunks if the caller stops consuming early
+            for future in futures:
+                future.cancel()
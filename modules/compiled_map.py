@@ -0,0 +1,180 @@
+from typing import Dict, List, Optional, Tuple, Hashable
+from location import Location
+import numpy as np
+
+
+class CompiledMap:
+    """
+    this class represents an immutable compressed-sparse-row (CSR) snapshot of a Map
+
+    Nodes are renumbered to integers 0..n-1. The outgoing edges of node i are stored in
+    targets[offsets[i]:offsets[i + 1]] with the matching weights in the same slice of weights.
+    """
+    def __init__(self, ids : List[Hashable], names : List[str], latitudes : np.ndarray, longitudes : np.ndarray,
+                 important : np.ndarray, offsets : np.ndarray, targets : np.ndarray, weights : np.ndarray):
+        self.__ids = list(ids)
+        self.__names = list(names)
+        self.__latitudes = np.asarray(latitudes, dtype=np.float64)
+        self.__longitudes = np.asarray(longitudes, dtype=np.float64)
+        self.__important = np.asarray(important, dtype=bool)
+        self.__offsets = np.asarray(offsets, dtype=np.int64)
+        self.__targets = np.asarray(targets, dtype=np.int64)
+        self.__weights = np.asarray(weights, dtype=np.float64)
+
+        for array in (self.__latitudes, self.__longitudes, self.__important, self.__offsets, self.__targets, self.__weights):
+            array.setflags(write=False)
+
+        self.__index : Dict[Hashable, int] = {id : i for i, id in enumerate(self.__ids)}
+
+        # Plain list views of the arrays, indexing numpy scalars one by one is slow in the search loops
+        self.__offsets_list : List[int] = self.__offsets.tolist()
+        self.__targets_list : List[int] = self.__targets.tolist()
+        self.__weights_list : List[float] = self.__weights.tolist()
+        self.__coordinates_list : List[Tuple[float, float]] = list(zip(self.__latitudes.tolist(), self.__longitudes.tolist()))
+        self.__reverse_adjacency : Optional[Tuple[List[int], List[int], List[float]]] = None
+
+    def __reduce__(self):
+        # Pickle only the arrays, the lookup tables and list views are rebuilt on unpickling
+        return (CompiledMap, (self.__ids, self.__names, self.__latitudes, self.__longitudes, self.__important,
+                              self.__offsets, self.__targets, self.__weights))
+
+    @staticmethod
+    def from_locations(locations : List[Location]) -> "CompiledMap":
+        """this function compiles a list of locations and their neighbouring paths into CSR form"""
+        ids = [loc.get_id() for loc in locations]
+        index = {id : i for i, id in enumerate(ids)}
+
+        offsets = [0]
+        targets = []
+        weights = []
+        for loc in locations:
+            for path in loc.get_neighbouring_path():
+                # Skip paths to locations that have been deleted from the map
+                target = index.get(path.get_end_loc().get_id())
+                if target is None:
+                    continue
+                targets.append(target)
+                weights.append(path.get_distance())
+            offsets.append(len(targets))
+
+        return CompiledMap(
+            ids=ids,
+            names=[loc.get_name() for loc in locations],
+            latitudes=np.array([loc.get_latitude() for loc in locations], dtype=np.float64),
+            longitudes=np.array([loc.get_longitude() for loc in locations], dtype=np.float64),
+            important=np.array([loc.is_important() for loc in locations], dtype=bool),
+            offsets=np.array(offsets, dtype=np.int64),
+            targets=np.array(targets, dtype=np.int64),
+            weights=np.array(weights, dtype=np.float64),
+        )
+
+    @staticmethod
+    def from_edges(ids : List[Hashable], names : List[str], latitudes : np.ndarray, longitudes : np.ndarray, important : np.ndarray,
+                   sources : np.ndarray, targets : np.ndarray, weights : np.ndarray) -> "CompiledMap":
+        """
+        this function builds the CSR form directly from undirected edges given as arrays of node indices, each edge is
+        stored in both directions and the neighbours of a node keep the order in which their edges were given
+        """
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        weights = np.asarray(weights, dtype=np.float64)
+
+        # Interleave both directions (u->v, v->u, ...) the same way add_path adds them, then group by source
+        directed_sources = np.column_stack((sources, targets)).ravel()
+        directed_targets = np.column_stack((targets, sources)).ravel()
+        directed_weights = np.repeat(weights, 2)
+        order = np.argsort(directed_sources, kind="stable")
+
+        offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(directed_sources, minlength=len(ids)), out=offsets[1:])
+
+        return CompiledMap(ids=ids, names=names, latitudes=latitudes, longitudes=longitudes, important=important,
+                           offsets=offsets, targets=directed_targets[order], weights=directed_weights[order])
+
+    def get_num_nodes(self) -> int:
+        return len(self.__ids)
+
+    def get_num_edges(self) -> int:
+        return len(self.__targets_list)
+
+    def get_index(self, id : Hashable) -> int:
+        return self.__index[id]
+
+    def get_id(self, index : int) -> Hashable:
+        return self.__ids[index]
+
+    def get_ids(self) -> List[Hashable]:
+        return list(self.__ids)
+
+    def get_name(self, index : int) -> str:
+        return self.__names[index]
+
+    def get_names(self) -> List[str]:
+        return list(self.__names)
+
+    def is_important(self, index : int) -> bool:
+        return bool(self.__important[index])
+
+    def get_coordinate(self, index : int) -> Tuple[float, float]:
+        return self.__coordinates_list[index]
+
+    def get_latitudes(self) -> np.ndarray:
+        return self.__latitudes
+
+    def get_longitudes(self) -> np.ndarray:
+        return self.__longitudes
+
+    def get_important(self) -> np.ndarray:
+        return self.__important
+
+    def get_offsets(self) -> np.ndarray:
+        return self.__offsets
+
+    def get_targets(self) -> np.ndarray:
+        return self.__targets
+
+    def get_weights(self) -> np.ndarray:
+        return self.__weights
+
+    def get_adjacency(self) -> Tuple[List[int], List[int], List[float]]:
+        """returns the offsets, targets and weights as plain lists for use in search loops"""
+        return self.__offsets_list, self.__targets_list, self.__weights_list
+
+    def get_reverse_adjacency(self) -> Tuple[List[int], List[int], List[float]]:
+        """
+        returns the incoming edges in the same CSR list layout as get_adjacency, the slice of node i lists the
+        nodes with an edge into i, it is computed on first use
+        """
+        if self.__reverse_adjacency is None:
+            sources = np.repeat(np.arange(self.get_num_nodes(), dtype=np.int64), np.diff(self.__offsets))
+            order = np.argsort(self.__targets, kind="stable")
+            offsets = np.zeros(self.get_num_nodes() + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.__targets, minlength=self.get_num_nodes()), out=offsets[1:])
+            self.__reverse_adjacency = (offsets.tolist(), sources[order].tolist(), self.__weights[order].tolist())
+        return self.__reverse_adjacency
+
+    def get_neighbours(self, index : int) -> List[Tuple[int, float]]:
+        start, end = self.__offsets_list[index], self.__offsets_list[index + 1]
+        return list(zip(self.__targets_list[start:end], self.__weights_list[start:end]))
+
+    def get_edge_positions(self, source : int, target : int) -> List[int]:
+        """returns the positions in targets and weights of the edges from source to target, parallel edges included"""
+        return [e for e in range(self.__offsets_list[source], self.__offsets_list[source + 1]) if self.__targets_list[e] == target]
+
+    def get_edge_weight(self, source : int, target : int) -> float:
+        """returns the weight of the shortest edge from source to target, infinite if there is none"""
+        return min((self.__weights_list[e] for e in self.get_edge_positions(source, target)), default=float('inf'))
+
+    def with_weights(self, weights : np.ndarray) -> "CompiledMap":
+        """
+        this function returns a compiled map with the same nodes and edges but the given weight for every edge, in the
+        order of get_weights, edges with an infinite weight are left out
+        """
+        weights = np.asarray(weights, dtype=np.float64)
+        kept = np.isfinite(weights)
+        offsets = np.concatenate(([0], np.cumsum(kept)))[self.__offsets]
+        return CompiledMap(ids=self.__ids, names=self.__names, latitudes=self.__latitudes, longitudes=self.__longitudes,
+                           important=self.__important, offsets=offsets, targets=self.__targets[kept], weights=weights[kept])
+
+    def __repr__(self):
+        return f"CompiledMap(nodes={self.get_num_nodes()}, edges={self.get_num_edges()})"
@@ -0,0 +1,234 @@
+from typing import Dict, List, Optional, Tuple
+from compiled_map import CompiledMap
+from search import PathNotFoundException, SearchStats
+import heapq
+import weakref
+
+# Settled-node limits of the local witness searches, a search that gives up early only adds an unneeded shortcut
+WITNESS_SETTLE_LIMIT = 500
+SIMULATION_SETTLE_LIMIT = 60
+
+
+class ContractionHierarchy:
+    """
+    this class represents a Contraction Hierarchy over a compiled map
+
+    Preprocessing contracts the nodes one by one in order of importance (edge difference plus the number of already
+    contracted neighbours). When a node is removed, a shortcut edge is added between each pair of its neighbours whose
+    shortest connection ran through it, unless a local witness search finds another path that is at least as short.
+    A query is then a bidirectional Dijkstra that only follows edges towards more important nodes, and shortcuts are
+    unpacked back into the original nodes through the node they bypass.
+    """
+    def __init__(self, graph : CompiledMap):
+        self.__graph = graph
+        n = graph.get_num_nodes()
+        offsets, targets, weights = graph.get_adjacency()
+
+        # Remaining (not yet contracted) graph, keeping only the lightest of any parallel edges
+        out_edges : List[Dict[int, float]] = [{} for _ in range(n)]
+        in_edges : List[Dict[int, float]] = [{} for _ in range(n)]
+        for u in range(n):
+            for e in range(offsets[u], offsets[u + 1]):
+                v, w = targets[e], weights[e]
+                if u != v and w < out_edges[u].get(v, float('inf')):
+                    out_edges[u][v] = w
+                    in_edges[v][u] = w
+
+        self.__middle : Dict[Tuple[int, int], int] = {}
+        self.__rank = [0] * n
+        self.__num_shortcuts = 0
+        upward : List[List[Tuple[int, float]]] = [[] for _ in range(n)]
+        downward : List[List[Tuple[int, float]]] = [[] for _ in range(n)]
+        contracted_neighbours = [0] * n
+
+        queue = [(self.__priority(v, out_edges, in_edges, contracted_neighbours), v) for v in range(n)]
+        heapq.heapify(queue)
+        rank = 0
+        while queue:
+            _, v = heapq.heappop(queue)
+
+            # Lazy update, contract v only if it is still the least important node
+            priority = self.__priority(v, out_edges, in_edges, contracted_neighbours)
+            if queue and priority > queue[0][0]:
+                heapq.heappush(queue, (priority, v))
+                continue
+
+            for u, w_in, w, w_out in self.__shortcuts(v, out_edges, in_edges, WITNESS_SETTLE_LIMIT):
+                if w_in + w_out >= out_edges[u].get(w, float('inf')):
+                    continue
+                out_edges[u][w] = w_in + w_out
+                in_edges[w][u] = w_in + w_out
+                self.__middle[(u, w)] = v
+                self.__num_shortcuts += 1
+
+            # The remaining edges of v all lead to more important nodes
+            for w, weight in out_edges[v].items():
+                upward[v].append((w, weight))
+                del in_edges[w][v]
+                contracted_neighbours[w] += 1
+            for u, weight in in_edges[v].items():
+                downward[v].append((u, weight))
+                del out_edges[u][v]
+                contracted_neighbours[u] += 1
+            out_edges[v] = {}
+            in_edges[v] = {}
+
+            self.__rank[v] = rank
+            rank += 1
+
+        self.__upward = self.__to_csr(upward)
+        self.__downward = self.__to_csr(downward)
+
+    @staticmethod
+    def __to_csr(edges : List[List[Tuple[int, float]]]) -> Tuple[List[int], List[int], List[float]]:
+        offsets, targets, weights = [0], [], []
+        for node_edges in edges:
+            for target, weight in node_edges:
+                targets.append(target)
+                weights.append(weight)
+            offsets.append(len(targets))
+        return offsets, targets, weights
+
+    @staticmethod
+    def __witness_search(source : int, excluded : int, max_cost : float, limit : int, out_edges : List[Dict[int, float]]) -> Dict[int, float]:
+        """local Dijkstra from source that avoids the node being contracted, stops past max_cost or after limit settled nodes"""
+        distance = {source : 0.0}
+        frontier = [(0.0, source)]
+        settled = 0
+        while frontier:
+            d, node = heapq.heappop(frontier)
+            if d > distance[node]:
+                continue
+            if d > max_cost or settled >= limit:
+                break
+            settled += 1
+            for child, weight in out_edges[node].items():
+                if child == excluded:
+                    continue
+                path_cost_to_child = d + weight
+                if path_cost_to_child < distance.get(child, float('inf')):
+                    distance[child] = path_cost_to_child
+                    heapq.heappush(frontier, (path_cost_to_child, child))
+        return distance
+
+    def __shortcuts(self, v : int, out_edges : List[Dict[int, float]], in_edges : List[Dict[int, float]],
+                    limit : int) -> List[Tuple[int, float, int, float]]:
+        """returns the (u, weight u->v, w, weight v->w) pairs that need a shortcut u->w when v is contracted"""
+        shortcuts = []
+        if not out_edges[v] or not in_edges[v]:
+            return shortcuts
+        max_out = max(out_edges[v].values())
+        for u, w_in in in_edges[v].items():
+            witness = self.__witness_search(u, v, w_in + max_out, limit, out_edges)
+            for w, w_out in out_edges[v].items():
+                if w == u:
+                    continue
+                if witness.get(w, float('inf')) > w_in + w_out:
+                    shortcuts.append((u, w_in, w, w_out))
+        return shortcuts
+
+    def __priority(self, v : int, out_edges : List[Dict[int, float]], in_edges : List[Dict[int, float]],
+                   contracted_neighbours : List[int]) -> int:
+        """edge difference of contracting v plus the number of its neighbours already contracted"""
+        n_shortcuts = len(self.__shortcuts(v, out_edges, in_edges, SIMULATION_SETTLE_LIMIT))
+        return n_shortcuts - len(out_edges[v]) - len(in_edges[v]) + contracted_neighbours[v]
+
+    def get_graph(self) -> CompiledMap:
+        return self.__graph
+
+    def get_rank(self, index : int) -> int:
+        return self.__rank[index]
+
+    def get_num_shortcuts(self) -> int:
+        return self.__num_shortcuts
+
+    def query(self, initial : int, goal : int, stats : Optional[SearchStats] = None) -> Tuple[List[int], float]:
+        """this function finds the shortest path with a bidirectional search over the upward edges and unpacks its shortcuts"""
+        if initial == goal:
+            if stats is not None:
+                stats.add_search(0, 0, 0, 0)
+            return [initial], 0.0
+
+        distance = ({initial : 0.0}, {goal : 0.0})
+        parent = ({initial : None}, {goal : None})
+        frontier = ([(0.0, initial)], [(0.0, goal)])
+        edges = (self.__upward, self.__downward)
+        best, meeting = float('inf'), None
+        expanded, pushes, pops, peak = 0, 2, 0, 2
+
+        while frontier[0] or frontier[1]:
+            peak = max(peak, len(frontier[0]) + len(frontier[1]))
+            # Alternate by always advancing the direction with the smaller key
+            side = 0 if frontier[0] and (not frontier[1] or frontier[0][0][0] <= frontier[1][0][0]) else 1
+            d, node = heapq.heappop(frontier[side])
+            pops += 1
+            if d > distance[side][node]:
+                continue
+            if d >= best:
+                # Nothing left in this direction can improve the best path
+                frontier[side].clear()
+                continue
+            expanded += 1
+
+            other = distance[1 - side].get(node)
+            if other is not None and d + other < best:
+                best, meeting = d + other, node
+
+            offsets, targets, weights = edges[side]
+            for e in range(offsets[node], offsets[node + 1]):
+                child = targets[e]
+                path_cost_to_child = d + weights[e]
+                if path_cost_to_child < distance[side].get(child, float('inf')):
+                    distance[side][child] = path_cost_to_child
+                    parent[side][child] = node
+                    heapq.heappush(frontier[side], (path_cost_to_child, child))
+                    pushes += 1
+
+        if stats is not None:
+            stats.add_search(expanded, pushes, pops, peak)
+        if meeting is None:
+            raise PathNotFoundException("No path found from initial to goal.")
+
+        # Hierarchy path: initial ... meeting from the forward parents, meeting ... goal from the backward parents
+        nodes = []
+        n = meeting
+        while n is not None:
+            nodes.append(n)
+            n = parent[0][n]
+        nodes.reverse()
+        n = parent[1][meeting]
+        while n is not None:
+            nodes.append(n)
+            n = parent[1][n]
+
+        path = [nodes[0]]
+        for u, w in zip(nodes, nodes[1:]):
+            path.extend(self.__unpack(u, w))
+        return path, best
+
+    def __unpack(self, u : int, w : int) -> List[int]:
+        """returns the original nodes after u on the edge u->w, replacing shortcuts by the nodes they bypass"""
+        path = []
+        stack = [(u, w)]
+        while stack:
+            a, b = stack.pop()
+            middle = self.__middle.get((a, b))
+            if middle is None:
+                path.append(b)
+            else:
+                # Unpack the first half before the second
+                stack.append((middle, b))
+                stack.append((a, middle))
+        return path
+
+
+_hierarchies : "weakref.WeakKeyDictionary[CompiledMap, ContractionHierarchy]" = weakref.WeakKeyDictionary()
+
+
+def get_contraction_hierarchy(graph : CompiledMap) -> ContractionHierarchy:
+    """returns the hierarchy of a compiled map, preprocessing it on first use, it is freed along with the compiled map"""
+    hierarchy = _hierarchies.get(graph)
+    if hierarchy is None:
+        hierarchy = ContractionHierarchy(graph)
+        _hierarchies[graph] = hierarchy
+    return hierarchy
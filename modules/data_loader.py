@@ -1,36 +1,108 @@
 import xml.etree.ElementTree as ET
-import pandas as pd
+from typing import TYPE_CHECKING, Dict, Iterator, Tuple
 import numpy as np
+import os
 from map import Map
-from location import Location
-from geopy.distance import geodesic
+from compiled_map import CompiledMap
+from heuristics import vincenty
+from spatial_index import SpatialIndex
+from map_cache import fingerprint, get_cache_path, load_compiled_map, save_compiled_map
 
 from map import find_nearest_location
 
-def parse_path(file_path: str) -> pd.DataFrame:
+#pandas is only needed to parse a KML file, not to load a cached snapshot, so it is imported on first parse
+if TYPE_CHECKING:
+    import pandas as pd
+
+KML_PATH = os.path.join("data", "AI shortest path project.kml")
+
+#Namespace for KML
+NAMESPACE = {'kml': 'http://www.opengis.net/kml/2.2', 'gx': 'http://www.google.com/kml/ext/2.2'}
+PLACEMARK_TAG = '{http://www.opengis.net/kml/2.2}Placemark'
+NOT_IMPORTANT_STYLE = '#__managed_style_0D431BAC7434B0BBDE51'
+
+
+def iter_placemarks(file_path: str) -> Iterator[Dict]:
     """
-    Parses a KML file and extracts path segments as individual points with distances between them.
+    Streams the Placemarks of a KML file with iterparse, clearing each element once it has been read so only
+    one Placemark is held in memory at a time.
 
     Args:
-        file_path (str): The path to the KML file containing path data.
+        file_path (str): The path to the KML file.
 
-    Returns:
-        pd.DataFrame: A DataFrame containing the start and end points of each path segment, 
-                      along with the distance between them in meters.
+    Yields:
+        dict: The 1-based index of the Placemark in the document, its name, styleUrl, and the raw text of its
+              first Point and LineString coordinates (None when the Placemark has no such geometry).
     """
-    #Namespace for KML
-    namespace = {'kml': 'http://www.opengis.net/kml/2.2', 'gx': 'http://www.google.com/kml/ext/2.2'}
-    tree = ET.parse(file_path)
-    root = tree.getroot()
+    stack = []
+    index = 0
+    for event, elem in ET.iterparse(file_path, events=('start', 'end')):
+        if event == 'start':
+            stack.append(elem)
+            continue
+
+        stack.pop()
+        if elem.tag != PLACEMARK_TAG:
+            continue
+
+        index += 1
+        name = elem.find('kml:name', namespaces=NAMESPACE)
+        style_url = elem.find('kml:styleUrl', namespaces=NAMESPACE)
+        point = elem.find('.//kml:Point/kml:coordinates', namespaces=NAMESPACE)
+        line_string = elem.find('.//kml:LineString/kml:coordinates', namespaces=NAMESPACE)
+        yield {
+            'index': index,
+            'name': name.text if name is not None else None,
+            'style_url': style_url.text if style_url is not None else None,
+            'point': point.text if point is not None else None,
+            'line_string': line_string.text if line_string is not None else None,
+        }
+
+        #Free the Placemark and detach it from its parent so the tree does not grow
+        elem.clear()
+        if stack:
+            stack[-1].remove(elem)
+
+
+def parse_kml(file_path: str) -> "Tuple[pd.DataFrame, pd.DataFrame, Dict[str, int]]":
+    """
+    Parses a KML file in a single streaming pass and extracts both locations and path segments.
 
+    Args:
+        file_path (str): The path to the KML file containing location and path data.
+
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame, Dict[str, int]]: 
+            - The locations, with the location ID, name, latitude, longitude and importance status.
+            - The path segments, with the start and end points of each segment and the distance between them in meters.
+            - The number of Point locations and LineString segments found in the file, for validate_kml.
+    """
+    locations = []
     paths = []
+    counts = {'locations': 0, 'segments': 0}
+
+    for placemark in iter_placemarks(file_path):
+        loc_id = placemark['index']
 
-    for placemark in root.findall('.//kml:Placemark', namespaces=namespace):
-        #Find LineString elements
-        line_string = placemark.find('.//kml:LineString/kml:coordinates', namespaces=namespace)
-        if line_string is not None:
-            # print(f"Processing LineString: {line_string.text.strip()}")
-            coords = line_string.text.strip().split()
+        if placemark['point'] is not None:
+            counts['locations'] += 1
+            lon, lat, *_ = map(float, placemark['point'].strip().split(','))
+
+            #Check the <styleUrl> tag to determine if the location is important
+            is_important = (placemark['style_url'] or '') != NOT_IMPORTANT_STYLE  #Important if not matching the "not important" style
+
+            locations.append({
+                'id': loc_id,
+                'loc_name': placemark['name'] if placemark['name'] is not None else f"Location_{loc_id}",
+                'latitude': lat,
+                'longitude': lon,
+                'is_important': is_important
+            })
+
+        if placemark['line_string'] is not None:
+            coords = placemark['line_string'].strip().split()
+            #A single coordinate still counts as one (degenerate) segment in the file
+            counts['segments'] += max(len(coords) - 1, 1)
 
             if len(coords) < 2:
                 print(f"Skipped path due to insufficient coordinates: {coords}")
@@ -48,72 +120,51 @@ def parse_path(file_path: str) -> pd.DataFrame:
 
             #Split the path into segments of consecutive points
             for i in range(len(points) - 1):
-                start_point = points[i]
-                end_point = points[i + 1]
-                distance = geodesic(start_point, end_point).meters
-                # print(f"Start Point: {start_point}, End Point: {end_point}, Distance: {distance}")
                 paths.append({
-                    'start_point': start_point,
-                    'end_point': end_point,
-                    'distance': distance
+                    'start_point': points[i],
+                    'end_point': points[i + 1]
                 })
 
-    #Return the DataFrame with the individual segments
-    return pd.DataFrame(paths)
+    #Compute all segment distances in one vectorized pass
+    if paths:
+        starts = np.array([path['start_point'] for path in paths], dtype=np.float64)
+        ends = np.array([path['end_point'] for path in paths], dtype=np.float64)
+        for path, distance in zip(paths, vincenty(starts[:, 0], starts[:, 1], ends[:, 0], ends[:, 1]).tolist()):
+            path['distance'] = distance
 
+    import pandas as pd
+    return pd.DataFrame(locations), pd.DataFrame(paths), counts
 
-def parse_location(file_path: str) -> pd.DataFrame:
+
+def parse_path(file_path: str) -> "pd.DataFrame":
     """
-    Parses a KML file and extracts location data, including coordinates and importance status.
+    Parses a KML file and extracts path segments as individual points with distances between them.
 
     Args:
-        file_path (str): The path to the KML file containing location data.
+        file_path (str): The path to the KML file containing path data.
 
     Returns:
-        pd.DataFrame: A DataFrame containing the location ID, name, latitude, longitude, 
-                      and importance status for each location.
+        pd.DataFrame: A DataFrame containing the start and end points of each path segment, 
+                      along with the distance between them in meters.
     """
-    #id, loc_name, latitude, longitude, is_important
-    namespace = {'kml': 'http://www.opengis.net/kml/2.2', 'gx': 'http://www.google.com/kml/ext/2.2'}
-    tree = ET.parse(file_path)
-    root = tree.getroot()
-
-    locations = []
-
-    for idx, placemark in enumerate(root.findall('.//kml:Placemark', namespaces=namespace)):
-        #Extract id
-        loc_id = idx + 1
-
-        #Extract name
-        name = placemark.find('kml:name', namespaces=namespace)
-        loc_name = name.text if name is not None else f"Location_{loc_id}"
+    return parse_kml(file_path)[1]
 
-        #Extract coordinates
-        point = placemark.find('.//kml:Point/kml:coordinates', namespaces=namespace)
-        if point is not None:
-            coordinates = point.text.strip()
-            lon, lat, *_ = map(float, coordinates.split(','))
-
-            #Check the <styleUrl> tag to determine if the location is important
-            style_url = placemark.find('kml:styleUrl', namespaces=namespace)
-            style_url_text = style_url.text if style_url is not None else ''
 
-            is_important = style_url_text != '#__managed_style_0D431BAC7434B0BBDE51'  #Important if not matching the "not important" style
-
-
-            locations.append({
-                'id': loc_id,
-                'loc_name': loc_name,
-                'latitude': lat,
-                'longitude': lon,
-                'is_important': is_important
-            })
+def parse_location(file_path: str) -> "pd.DataFrame":
+    """
+    Parses a KML file and extracts location data, including coordinates and importance status.
 
-    return pd.DataFrame(locations)
+    Args:
+        file_path (str): The path to the KML file containing location data.
 
+    Returns:
+        pd.DataFrame: A DataFrame containing the location ID, name, latitude, longitude, 
+                      and importance status for each location.
+    """
+    return parse_kml(file_path)[0]
 
 
-def validate_kml(file_path: str, location_df: pd.DataFrame, path_df: pd.DataFrame):
+def validate_kml(file_path: str, location_df: "pd.DataFrame", path_df: "pd.DataFrame", counts: Dict[str, int] = None):
     """
     Validates the KML file by comparing the location and path data in the file with the provided DataFrames.
 
@@ -121,90 +172,122 @@ def validate_kml(file_path: str, location_df: pd.DataFrame, path_df: pd.DataFram
         file_path (str): The path to the KML file containing the location and path data.
         location_df (pd.DataFrame): A DataFrame containing the expected location data.
         path_df (pd.DataFrame): A DataFrame containing the expected path segment data.
+        counts (Dict[str, int]): The counts collected by parse_kml. If omitted the file is streamed again to count them.
 
     Raises:
         AssertionError: If the number of locations or path segments in the KML does not match the DataFrame.
     """
-    namespace = {'kml': 'http://www.opengis.net/kml/2.2', 'gx': 'http://www.google.com/kml/ext/2.2'}
-    tree = ET.parse(file_path)
-    root = tree.getroot()
+    if counts is None:
+        counts = {'locations': 0, 'segments': 0}
+        for placemark in iter_placemarks(file_path):
+            if placemark['point'] is not None:
+                counts['locations'] += 1
+            if placemark['line_string'] is not None:
+                counts['segments'] += max(len(placemark['line_string'].split()) - 1, 1)
 
     #Validate locations
-    kml_locations = []
-    for placemark in root.findall('.//kml:Placemark', namespaces=namespace):
-        point = placemark.find('.//kml:Point/kml:coordinates', namespaces=namespace)
-        if point is not None:
-            kml_locations.append(point.text.strip())
-
-    assert len(kml_locations) == len(location_df), "Mismatch in number of locations"
+    assert counts['locations'] == len(location_df), "Mismatch in number of locations"
     print("Location validation passed!")
 
     #Validate paths
-    kml_segments = []  #List to store individual path segments
-
-    for placemark in root.findall('.//kml:Placemark', namespaces=namespace):
-        line_string = placemark.find('.//kml:LineString/kml:coordinates', namespaces=namespace)
-        if line_string is not None:
-            coords = line_string.text.strip().split()
-
-            #If there are multiple coordinates, divide them into segments
-            if len(coords) > 1:
-                for i in range(len(coords) - 1):
-                    #Split each pair of coordinates and append to kml_segments
-                    start_coords = coords[i].split(',')
-                    end_coords = coords[i + 1].split(',')
-                    start_point = (float(start_coords[1]), float(start_coords[0]))  #(lat, lon)
-                    end_point = (float(end_coords[1]), float(end_coords[0]))  #(lat, lon)
-                    kml_segments.append((start_point, end_point))
-            else:
-                #Single point path, append as a segment if needed
-                start_coords = coords[0].split(',')
-                start_point = (float(start_coords[1]), float(start_coords[0]))  #(lat, lon)
-                kml_segments.append((start_point, start_point))  #Single point segment
-
-    #Now compare the number of segments in the KML with the number of rows in the DataFrame
-    assert len(kml_segments) == len(path_df), f"Mismatch in number of segments: KML={len(kml_segments)}, DataFrame={len(path_df)}"
+    assert counts['segments'] == len(path_df), f"Mismatch in number of segments: KML={counts['segments']}, DataFrame={len(path_df)}"
     print("Path validation passed!")
 
 
-def get_map() -> Map:
+def get_map(file_path: str = KML_PATH, use_cache: bool = True, cache_dir: str = None) -> Map:
     """
     Generates a map by parsing location and path data from a KML file and adding locations and paths to the map.
 
+    The built graph is saved as a binary snapshot next to the data, keyed by the content hash of the KML file.
+    Later calls load the snapshot instead of parsing the KML, and rebuild it when the KML has changed.
+
+    Args:
+        file_path (str): The path to the KML file containing location and path data.
+        use_cache (bool): Whether to read and write the compiled map snapshot.
+        cache_dir (str): The directory for snapshots, defaults to data/.cache.
+
     Returns:
         Map: A Map object containing all the locations and paths parsed from the KML file.
     """
-    file_path = r"data\AI shortest path project.kml"
-    location_df = parse_location(file_path)
-    path_df = parse_path(file_path)
-
-    XMUM_map = Map()
-    
-    for _, row in location_df.iterrows():
-        loc = Location(
-            name=row['loc_name'].strip(),
-            latitude=row['latitude'],
-            longitude=row['longitude'],
-            id=row['id'],
-            is_important=row['is_important']
-        )
-        XMUM_map.add_loc(loc)
-
-    locs_coor = np.array([[loc.get_latitude(), loc.get_longitude()] for loc in XMUM_map.get_all_loc()])
-    for _, row in path_df.iterrows():
-        start_coords = row['start_point']
-        end_coords = row['end_point']
-
-        start_loc : Location = find_nearest_location(start_coords, XMUM_map, locs_coor)
-        end_loc : Location = find_nearest_location(end_coords, XMUM_map, locs_coor)
-
-        distance = geodesic(start_loc.get_coordinate(), end_loc.get_coordinate()).meters
-
-        XMUM_map.add_path(start_loc.get_id(), end_loc.get_id(), distance)
-        
+    if not use_cache:
+        return build_map(file_path)
+
+    kml_fingerprint = fingerprint(file_path)
+    cache_path = get_cache_path(file_path, cache_dir)
+    graph = load_compiled_map(cache_path, kml_fingerprint)
+    if graph is not None:
+        return Map.from_compiled(graph)
+
+    XMUM_map = build_map(file_path)
+    try:
+        save_compiled_map(XMUM_map.compile(), cache_path, kml_fingerprint)
+    except OSError as e:
+        print(f"Could not save map cache: {e}")
     return XMUM_map
 
 
+def build_map(file_path: str = KML_PATH) -> Map:
+    """
+    Builds a map by parsing location and path data from a KML file, without using the snapshot cache.
+
+    Args:
+        file_path (str): The path to the KML file containing location and path data.
+
+    Returns:
+        Map: A Map object containing all the locations and paths parsed from the KML file.
+    """
+    location_df, path_df, _ = parse_kml(file_path)
+    return assemble_map(location_df, path_df)
+
+
+def assemble_map(location_df: "pd.DataFrame", path_df: "pd.DataFrame") -> Map:
+    """
+    Builds a map from parsed locations and path segments in bulk.
+
+    Every distinct segment endpoint is snapped to its nearest location once, the segments are turned into
+    deduplicated undirected edges between location indices, their geodesic lengths are computed in one vectorized
+    pass, and the compiled graph is assembled directly from those arrays.
+
+    Args:
+        location_df (pd.DataFrame): The locations, as returned by parse_kml.
+        path_df (pd.DataFrame): The path segments, as returned by parse_kml.
+
+    Returns:
+        Map: A Map object containing the locations and the paths between them.
+    """
+    ids = location_df['id'].tolist() if len(location_df) else []
+    names = [name.strip() for name in location_df['loc_name']] if len(location_df) else []
+    latitudes = location_df['latitude'].to_numpy(dtype=np.float64) if len(location_df) else np.empty(0)
+    longitudes = location_df['longitude'].to_numpy(dtype=np.float64) if len(location_df) else np.empty(0)
+    important = location_df['is_important'].to_numpy(dtype=bool) if len(location_df) else np.empty(0, dtype=bool)
+
+    sources = np.empty(0, dtype=np.int64)
+    targets = np.empty(0, dtype=np.int64)
+    if len(path_df) and len(ids):
+        #Snap each distinct endpoint once, consecutive segments share their endpoints
+        index = SpatialIndex.from_points((i, lat, lon) for i, (lat, lon) in enumerate(zip(latitudes.tolist(), longitudes.tolist())))
+        endpoints = list(path_df['start_point']) + list(path_df['end_point'])
+        snapped = {}
+        for point in endpoints:
+            if point not in snapped:
+                snapped[point] = index.nearest(point)
+        n_segments = len(path_df)
+        snapped_endpoints = np.array([snapped[point] for point in endpoints], dtype=np.int64)
+        sources, targets = snapped_endpoints[:n_segments], snapped_endpoints[n_segments:]
+
+        #Drop segments that collapse onto one location and keep the first occurrence of each undirected edge
+        keep = sources != targets
+        sources, targets = sources[keep], targets[keep]
+        pairs = np.column_stack((np.minimum(sources, targets), np.maximum(sources, targets)))
+        _, first = np.unique(pairs, axis=0, return_index=True)
+        first.sort()
+        sources, targets = sources[first], targets[first]
+
+    distances = vincenty(latitudes[sources], longitudes[sources], latitudes[targets], longitudes[targets])
+    graph = CompiledMap.from_edges(ids, names, latitudes, longitudes, important, sources, targets, distances)
+    return Map.from_compiled(graph)
+
+
 def main():
     """
     The main entry point for the script. It parses location and path data from a KML file, validates the data, 
@@ -213,14 +296,13 @@ def main():
     Runs the KML file parsing, validation, and map creation, then prints the sorted list of important locations 
     and the number of locations and paths.
     """
-    file_path = r"data\AI shortest path project.kml"
-    location_df = parse_location(file_path)
-    path_df = parse_path(file_path)
+    file_path = KML_PATH
+    location_df, path_df, counts = parse_kml(file_path)
     print("Location DataFrame: ")
     #print(location_df.head())
     #print("Path DataFrame: ")
     #print(path_df.head())
-    validate_kml(file_path, location_df, path_df)
+    validate_kml(file_path, location_df, path_df, counts)
     
     xmum : Map = get_map()
     #print([x.get_name() for x in xmum.get_important_loc()])
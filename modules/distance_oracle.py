@@ -0,0 +1,100 @@
+from typing import Dict, List, Tuple
+from compiled_map import CompiledMap
+from search import PathNotFoundException, dijkstra_tree
+import numpy as np
+
+
+class DistanceOracle:
+    """
+    this class represents precomputed shortest routes between every pair of a fixed set of nodes (the important
+    locations), answering a query with a table lookup and a walk along next-hop pointers
+
+    For every destination k the oracle keeps one row of next hops, next_hop[k][v] is the node after v on a shortest
+    path from v to destination k (-1 at the destination itself or when it cannot be reached). Together with the k x k
+    distance matrix this takes 4n + 8k bytes per destination.
+    """
+    def __init__(self, graph : CompiledMap, nodes : List[int]):
+        self.__graph = graph
+        self.__nodes = list(nodes)
+        self.__position : Dict[int, int] = {node : k for k, node in enumerate(self.__nodes)}
+        self.__distances = np.full((len(self.__nodes), len(self.__nodes)), np.inf, dtype=np.float64)
+        self.__next_hop = np.full((len(self.__nodes), graph.get_num_nodes()), -1, dtype=np.int32)
+
+        # One reverse Dijkstra per destination gives the next hop of every node towards it
+        for k in range(len(self.__nodes)):
+            self.__build_row(k)
+
+        self.__next_hop.setflags(write=False)
+        self.__distances.setflags(write=False)
+
+    def __build_row(self, k : int):
+        distance, parent = dijkstra_tree(self.__graph, self.__nodes[k], reverse=True)
+        self.__next_hop[k] = parent
+        self.__distances[:, k] = [distance[node] for node in self.__nodes]
+
+    def __distance_to(self, node : int, k : int) -> float:
+        """the length of the route from node to destination k, walking its next hops"""
+        next_hop = self.__next_hop[k]
+        total = 0.0
+        while node != self.__nodes[k]:
+            following = int(next_hop[node])
+            if following < 0:
+                return float('inf')
+            total += self.__graph.get_edge_weight(node, following)
+            node = following
+        return total
+
+    def repair(self, graph : CompiledMap, changed : List[Tuple[int, int, float, float]]) -> int:
+        """
+        updates the oracle to the graph after the given (source, target, old weight, new weight) edge changes, only the
+        destinations whose routes can change are recomputed: those with a lengthened or closed edge on their tree, and
+        those an edge that got shorter or reopened now gives a shorter route, returns the number recomputed
+        """
+        stale = []
+        for k in range(len(self.__nodes)):
+            next_hop = self.__next_hop[k]
+            for source, target, old_weight, new_weight in changed:
+                if new_weight >= old_weight:
+                    if next_hop[source] == target:
+                        stale.append(k)
+                        break
+                elif new_weight + self.__distance_to(target, k) < self.__distance_to(source, k):
+                    stale.append(k)
+                    break
+
+        self.__graph = graph
+        if stale:
+            self.__next_hop = self.__next_hop.copy()
+            self.__distances = self.__distances.copy()
+            for k in stale:
+                self.__build_row(k)
+            self.__next_hop.setflags(write=False)
+            self.__distances.setflags(write=False)
+        return len(stale)
+
+    def get_nodes(self) -> List[int]:
+        return list(self.__nodes)
+
+    def has_route(self, initial : int, goal : int) -> bool:
+        """returns whether the pair is covered by the oracle"""
+        return initial in self.__position and goal in self.__position
+
+    def get_distance(self, initial : int, goal : int) -> float:
+        return float(self.__distances[self.__position[initial], self.__position[goal]])
+
+    def get_path(self, initial : int, goal : int) -> List[int]:
+        """returns the node indices of a shortest path by following the next hops towards the goal"""
+        distance = self.get_distance(initial, goal)
+        if distance == float('inf'):
+            raise PathNotFoundException("No path found from initial to goal.")
+
+        next_hop = self.__next_hop[self.__position[goal]]
+        path = [initial]
+        node = initial
+        while node != goal:
+            node = int(next_hop[node])
+            path.append(node)
+        return path
+
+    def get_nbytes(self) -> int:
+        return self.__next_hop.nbytes + self.__distances.nbytes
@@ -0,0 +1,63 @@
+from typing import Dict, FrozenSet, Hashable, List, Optional, Tuple
+from compiled_map import CompiledMap
+
+# Weight of a closed path
+CLOSED = float('inf')
+
+
+class EdgeOverlay:
+    """
+    this class represents versioned changes to the paths of a map that leave the map itself untouched, a path between
+    two locations is either closed or given a new distance, in both directions and for all parallel paths at once
+
+    Every change bumps the version and is kept in a log, so a client holding results from an older version can ask for
+    the changes made since then. Changes are keyed by location ids, so they survive rebuilding the compiled map.
+    """
+    def __init__(self):
+        self.__weights : Dict[FrozenSet[Hashable], Tuple[Hashable, Hashable, float]] = {}
+        self.__version = 0
+        self.__log : List[Tuple[int, Hashable, Hashable, Optional[float]]] = []
+
+    def __len__(self):
+        return len(self.__weights)
+
+    def get_version(self) -> int:
+        return self.__version
+
+    def get_weight(self, id1 : Hashable, id2 : Hashable) -> Optional[float]:
+        """returns the overridden distance of the paths between two locations, CLOSED if closed, None if unchanged"""
+        change = self.__weights.get(frozenset((id1, id2)))
+        return None if change is None else change[2]
+
+    def is_closed(self, id1 : Hashable, id2 : Hashable) -> bool:
+        return self.get_weight(id1, id2) == CLOSED
+
+    def get_changes(self) -> List[Tuple[Hashable, Hashable, float]]:
+        """returns the current (id1, id2, distance) overrides, CLOSED as the distance of closed paths"""
+        return list(self.__weights.values())
+
+    def get_changes_since(self, version : int) -> List[Tuple[int, Hashable, Hashable, Optional[float]]]:
+        """returns the (version, id1, id2, distance) changes made after the given version, a None distance is a reset"""
+        return [change for change in self.__log if change[0] > version]
+
+    def set_weight(self, id1 : Hashable, id2 : Hashable, weight : Optional[float]) -> int:
+        """overrides the distance of the paths between two locations, None resets them, returns the new version"""
+        key = frozenset((id1, id2))
+        if weight is None:
+            self.__weights.pop(key, None)
+        else:
+            self.__weights[key] = (id1, id2, float(weight))
+        self.__version += 1
+        self.__log.append((self.__version, id1, id2, weight))
+        return self.__version
+
+    def apply(self, graph : CompiledMap) -> CompiledMap:
+        """returns the graph with the overrides applied, overrides of locations or paths it does not have are skipped"""
+        weights = graph.get_weights().copy()
+        for id1, id2, weight in self.__weights.values():
+            try:
+                u, v = graph.get_index(id1), graph.get_index(id2)
+            except KeyError:
+                continue
+            weights[graph.get_edge_positions(u, v) + graph.get_edge_positions(v, u)] = weight
+        return graph.with_weights(weights)
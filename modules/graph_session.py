@@ -0,0 +1,150 @@
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
+import os
+import threading
+import time
+
+if TYPE_CHECKING:
+    from map import Map
+
+
+class GraphSession:
+    """
+    this class represents the map of one KML file shared by everything in the process that routes on it (the desktop
+    UI and map_with_shortest.play), loaded once and warmed up on a background thread
+
+    Warming up loads the map, then builds what the first route request would otherwise pay for: the compiled graph,
+    the spatial index used to snap the current position and the heuristic tables of the important locations. It
+    does not enable the route trees or the important route table, which would answer the optimal searches without
+    running the algorithm the user picked. The map is not thread-safe, so every step of the warm up and every query
+    holds the session lock, a query arriving mid warm up only waits for the current step. The names the UI lists are
+    kept apart from the map, so reading them never waits for the lock.
+
+    Nothing heavier than the standard library is imported until the map is loaded, so creating a session on the
+    import path of the app costs nothing and numpy, pandas and the map modules are imported by the warm up thread.
+    """
+    def __init__(self, file_path : Optional[str] = None, heuristic : str = "precomputed"):
+        self.__file_path = file_path
+        self.__heuristic = heuristic
+        self.__map : Optional["Map"] = None
+        self.__lock = threading.RLock()
+        self.__loaded = threading.Event()
+        self.__warmed = threading.Event()
+        self.__thread : Optional[threading.Thread] = None
+        self.__error : Optional[BaseException] = None
+        self.__phase_times : Dict[str, float] = {}
+        self.__important_names : Optional[List[str]] = None
+        self.__search_algorithms : Optional[List[str]] = None
+
+    def get_file_path(self) -> str:
+        """returns the KML file of the session, the campus map (data_loader.KML_PATH) when none was given"""
+        if self.__file_path is None:
+            from data_loader import KML_PATH
+            return KML_PATH
+        return self.__file_path
+
+    def get_lock(self) -> threading.RLock:
+        """returns the lock to hold while using the map from more than one thread"""
+        return self.__lock
+
+    def is_loaded(self) -> bool:
+        return self.__loaded.is_set()
+
+    def is_warm(self) -> bool:
+        return self.__warmed.is_set()
+
+    def get_important_names(self) -> Optional[List[str]]:
+        """returns the sorted names of the important locations, None until the map is loaded, it never blocks"""
+        return self.__important_names
+
+    def get_search_algorithms(self) -> Optional[List[str]]:
+        """returns the search algorithms of the map, None until the map is loaded, it never blocks"""
+        return self.__search_algorithms
+
+    def get_phase_times(self) -> Dict[str, float]:
+        """returns the seconds each warm up step took"""
+        return dict(self.__phase_times)
+
+    def start_prewarm(self) -> threading.Thread:
+        """starts loading and warming up the map on a daemon thread, later calls return the same thread"""
+        with self.__lock:
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.__prewarm, name="graph-session-prewarm", daemon=True)
+                self.__thread.start()
+            return self.__thread
+
+    def __step(self, phase : str, function):
+        start = time.perf_counter()
+        with self.__lock:
+            result = function()
+        self.__phase_times[phase] = time.perf_counter() - start
+        return result
+
+    def __prewarm(self):
+        try:
+            self.__load()
+            city_map = self.__map
+            graph = self.__step("compile", city_map.compile)
+            self.__step("spatial index", city_map.get_spatial_index)
+            destinations = self.__step("destinations", lambda: [graph.get_index(loc.get_id()) for loc in city_map.get_important_loc()])
+
+            heuristic = self.__step("heuristic", lambda: city_map.get_heuristic(self.__heuristic))
+            if hasattr(heuristic, "get_table"):
+                self.__step("heuristic tables", lambda: [heuristic.get_table(destination) for destination in destinations])
+        except BaseException as e:
+            self.__error = e
+            self.__loaded.set()
+        finally:
+            self.__warmed.set()
+
+    def __load(self):
+        with self.__lock:
+            if self.__map is None:
+                start = time.perf_counter()
+                from data_loader import get_map
+                city_map = get_map(self.get_file_path())
+                self.__important_names = sorted(loc.get_name() for loc in city_map.get_important_loc())
+                self.__search_algorithms = city_map.get_all_search_algorithm()
+                self.__map = city_map
+                self.__phase_times["load"] = time.perf_counter() - start
+            self.__loaded.set()
+
+    def get_map(self, timeout : Optional[float] = None) -> "Map":
+        """
+        returns the map, waiting for the warm up thread to load it or loading it right away if no warm up was started,
+        raises TimeoutError if it is not loaded within the timeout and re-raises an error of the warm up thread
+        """
+        if self.__thread is None:
+            self.__load()
+        elif not self.__loaded.wait(timeout):
+            raise TimeoutError("The map is still loading.")
+        if self.__map is None and self.__error is not None:
+            raise self.__error
+        return self.__map
+
+    def wait_until_warm(self, timeout : Optional[float] = None) -> bool:
+        """waits for the warm up to finish, returns False on timeout"""
+        return self.__warmed.wait(timeout)
+
+    def shortest_path(self, from_loc : Union[str, list], to_loc : str, search_algorithm = "a star", heuristic = None,
+                      **kwargs) -> Tuple[List[Tuple[float, float]], float]:
+        """Map.shortest_path on the shared map, holding the session lock, the heuristic defaults to the warmed one"""
+        city_map = self.get_map()
+        with self.__lock:
+            return city_map.shortest_path(from_loc, to_loc, search_algorithm, heuristic or self.__heuristic, **kwargs)
+
+
+_sessions : Dict[Optional[str], GraphSession] = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(file_path : Optional[str] = None) -> GraphSession:
+    """
+    returns the session of the given KML file, or of the campus map when none is given, creating it on first use,
+    every caller gets the same session
+    """
+    key = os.path.abspath(file_path) if file_path is not None else None
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _sessions[key] = GraphSession(file_path)
+        return session
@@ -0,0 +1,258 @@
+from typing import Callable, Dict, List
+from collections import OrderedDict
+from compiled_map import CompiledMap
+from search import dijkstra_tree
+import numpy as np
+import math
+
+# Smallest radius of curvature of the WGS-84 ellipsoid (b^2 / a, the meridional radius at the equator).
+# A sphere of this radius is everywhere "smaller" than the ellipsoid, so great-circle distances on it
+# never exceed the geodesic distances used as edge weights, which keeps the heuristics admissible.
+EARTH_RADIUS_LOWER_BOUND = 6335439.0
+
+# Extra latitude band (radians) allowed around the map for the equirectangular bound, geodesic edges
+# between two nodes can bulge slightly towards the pole
+EQUIRECTANGULAR_MARGIN = math.radians(0.5)
+
+# WGS-84 ellipsoid
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = (1 - WGS84_F) * WGS84_A
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """
+    Computes the great-circle distance in meters on a sphere of radius EARTH_RADIUS_LOWER_BOUND.
+
+    Args:
+        lat1, lon1, lat2, lon2: Coordinates in radians, either floats or NumPy arrays that broadcast together.
+
+    Returns:
+        The distance in meters, a lower bound of the ellipsoidal geodesic distance.
+    """
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_LOWER_BOUND * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def equirectangular(lat1, lon1, lat2, lon2, cos_lat : float):
+    """
+    Computes the flat-earth distance in meters with a fixed longitude scale.
+
+    Args:
+        lat1, lon1, lat2, lon2: Coordinates in radians, either floats or NumPy arrays that broadcast together.
+        cos_lat (float): Cosine of the most poleward latitude the path can reach. Using the smallest scale
+                         in the area keeps the distance a lower bound of the length of any path inside it.
+
+    Returns:
+        The distance in meters.
+    """
+    d_lon = np.abs(lon2 - lon1)
+    d_lon = np.minimum(d_lon, 2 * math.pi - d_lon)
+    return EARTH_RADIUS_LOWER_BOUND * np.hypot(lat2 - lat1, cos_lat * d_lon)
+
+
+def vincenty(lat1, lon1, lat2, lon2, max_iterations : int = 200, tolerance : float = 1e-12) -> np.ndarray:
+    """
+    Computes ellipsoidal geodesic distances for many coordinate pairs at once with Vincenty's inverse formula.
+
+    Args:
+        lat1, lon1, lat2, lon2: Coordinates in degrees, NumPy arrays that broadcast together.
+        max_iterations (int): The iteration limit of the formula.
+        tolerance (float): The convergence threshold on lambda, in radians.
+
+    Returns:
+        np.ndarray: The distances in meters. They agree with geopy's geodesic to well under a millimetre;
+                    the rare nearly antipodal pairs where the formula does not converge are solved with geopy.
+    """
+    lat1, lon1, lat2, lon2 = np.broadcast_arrays(*(np.asarray(x, dtype=np.float64) for x in (lat1, lon1, lat2, lon2)))
+    shape = lat1.shape
+    lat1, lon1, lat2, lon2 = (x.ravel() for x in (lat1, lon1, lat2, lon2))
+    L = np.radians(lon2 - lon1)
+    U1 = np.arctan((1 - WGS84_F) * np.tan(np.radians(lat1)))
+    U2 = np.arctan((1 - WGS84_F) * np.tan(np.radians(lat2)))
+    sin_U1, cos_U1 = np.sin(U1), np.cos(U1)
+    sin_U2, cos_U2 = np.sin(U2), np.cos(U2)
+
+    lam = L.copy()
+    converged = np.zeros(L.shape, dtype=bool)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for _ in range(max_iterations):
+            sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+            sin_sigma = np.hypot(cos_U2 * sin_lam, cos_U1 * sin_U2 - sin_U1 * cos_U2 * cos_lam)
+            cos_sigma = sin_U1 * sin_U2 + cos_U1 * cos_U2 * cos_lam
+            sigma = np.arctan2(sin_sigma, cos_sigma)
+            sin_alpha = np.where(sin_sigma == 0, 0.0, cos_U1 * cos_U2 * sin_lam / sin_sigma)
+            cos2_alpha = 1 - sin_alpha ** 2
+            cos_2sigma_m = np.where(cos2_alpha == 0, 0.0, cos_sigma - 2 * sin_U1 * sin_U2 / cos2_alpha)
+            C = WGS84_F / 16 * cos2_alpha * (4 + WGS84_F * (4 - 3 * cos2_alpha))
+            lam_prev = lam
+            lam = L + (1 - C) * WGS84_F * sin_alpha * (
+                sigma + C * sin_sigma * (cos_2sigma_m + C * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)))
+            converged = np.abs(lam - lam_prev) < tolerance
+            if converged.all():
+                break
+
+        u2 = cos2_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+        A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+        B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+        delta_sigma = B * sin_sigma * (cos_2sigma_m + B / 4 * (
+            cos_sigma * (-1 + 2 * cos_2sigma_m ** 2) - B / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)))
+        distances = WGS84_B * A * (sigma - delta_sigma)
+
+    distances = np.where(sin_sigma == 0, 0.0, distances)
+    for i in np.flatnonzero(~converged | ~np.isfinite(distances)):
+        #geopy is slow to import and only needed for the rare pairs the iteration does not converge on
+        from geopy.distance import geodesic
+        distances[i] = geodesic((lat1[i], lon1[i]), (lat2[i], lon2[i])).meters
+    return distances.reshape(shape)
+
+
+class GeodesicHeuristic:
+    """this heuristic solves the exact ellipsoidal geodesic for every call, it is the slowest backend"""
+    def __init__(self, graph : CompiledMap):
+        from geopy.distance import geodesic
+        self.__graph = graph
+        self.__geodesic = geodesic
+
+    def __call__(self, from_index : int, to_index : int) -> float:
+        return self.__geodesic(self.__graph.get_coordinate(from_index), self.__graph.get_coordinate(to_index)).meters
+
+
+class HaversineHeuristic:
+    """this heuristic computes the great-circle distance on a lower-bound sphere for every call"""
+    def __init__(self, graph : CompiledMap):
+        self.__lat : List[float] = np.radians(graph.get_latitudes()).tolist()
+        self.__lon : List[float] = np.radians(graph.get_longitudes()).tolist()
+        self.__cos_lat : List[float] = np.cos(np.radians(graph.get_latitudes())).tolist()
+
+    def __call__(self, from_index : int, to_index : int) -> float:
+        lat1, lat2 = self.__lat[from_index], self.__lat[to_index]
+        a = (math.sin((lat2 - lat1) / 2) ** 2
+             + self.__cos_lat[from_index] * self.__cos_lat[to_index] * math.sin((self.__lon[to_index] - self.__lon[from_index]) / 2) ** 2)
+        return 2 * EARTH_RADIUS_LOWER_BOUND * math.asin(math.sqrt(min(a, 1.0)))
+
+
+class EquirectangularHeuristic:
+    """this heuristic uses a flat projection scaled to the most poleward latitude of the map, it is the cheapest per call"""
+    def __init__(self, graph : CompiledMap):
+        latitudes = np.radians(graph.get_latitudes())
+        self.__lat : List[float] = latitudes.tolist()
+        self.__lon : List[float] = np.radians(graph.get_longitudes()).tolist()
+        max_abs_lat = float(np.max(np.abs(latitudes))) if len(latitudes) else 0.0
+        self.__cos_lat = math.cos(min(max_abs_lat + EQUIRECTANGULAR_MARGIN, math.pi / 2))
+
+    def __call__(self, from_index : int, to_index : int) -> float:
+        d_lon = abs(self.__lon[to_index] - self.__lon[from_index])
+        d_lon = min(d_lon, 2 * math.pi - d_lon)
+        return EARTH_RADIUS_LOWER_BOUND * math.hypot(self.__lat[to_index] - self.__lat[from_index], self.__cos_lat * d_lon)
+
+
+class PrecomputedHeuristic:
+    """
+    this heuristic computes the haversine distance from every node to a target in one vectorized pass the first
+    time the target is asked for, after that every call is a list lookup
+    """
+    def __init__(self, graph : CompiledMap, max_targets : int = 64):
+        self.__lat = np.radians(graph.get_latitudes())
+        self.__lon = np.radians(graph.get_longitudes())
+        self.__max_targets = max_targets
+        self.__tables : "OrderedDict[int, List[float]]" = OrderedDict()
+
+    def get_table(self, to_index : int) -> List[float]:
+        """returns the distances from every node to the target, computing them if needed"""
+        table = self.__tables.get(to_index)
+        if table is None:
+            table = haversine(self.__lat, self.__lon, self.__lat[to_index], self.__lon[to_index]).tolist()
+            self.__tables[to_index] = table
+            if len(self.__tables) > self.__max_targets:
+                self.__tables.popitem(last=False)
+        else:
+            self.__tables.move_to_end(to_index)
+        return table
+
+    def __call__(self, from_index : int, to_index : int) -> float:
+        return self.get_table(to_index)[from_index]
+
+
+class LandmarkHeuristic:
+    """
+    this heuristic implements ALT (A*, landmarks, triangle inequality)
+
+    A few landmarks are picked far apart from each other and the shortest distances from and to each of them are
+    stored for every node. By the triangle inequality d(v, t) >= d(L, t) - d(L, v) and d(v, t) >= d(v, L) - d(t, L)
+    for every landmark L, so the largest of these bounds is admissible. Unlike the straight-line distance it knows
+    about detours around lakes and buildings. The result is combined with the haversine bound by taking the larger
+    of the two, and is computed for all nodes at once per target like PrecomputedHeuristic.
+    """
+    def __init__(self, graph : CompiledMap, num_landmarks : int = 8, max_targets : int = 64):
+        n = graph.get_num_nodes()
+        self.__landmarks : List[int] = []
+        self.__from_landmark = np.empty((0, n), dtype=np.float64)
+        self.__to_landmark = np.empty((0, n), dtype=np.float64)
+        self.__geographic = PrecomputedHeuristic(graph, max_targets)
+        self.__max_targets = max_targets
+        self.__tables : "OrderedDict[int, List[float]]" = OrderedDict()
+
+        if n == 0:
+            return
+
+        # Farthest-point selection: start from the node farthest from the best connected node, then repeatedly take
+        # the node farthest from all landmarks chosen so far. Nodes the landmarks cannot reach are skipped, landmarks
+        # in small disconnected pieces of the map would bound nothing.
+        from_rows, to_rows = [], []
+        hub = int(np.argmax(np.diff(graph.get_offsets())))
+        nearest = np.array(dijkstra_tree(graph, hub)[0], dtype=np.float64)
+        for _ in range(min(num_landmarks, n)):
+            candidate = int(np.argmax(np.where(np.isinf(nearest), -1.0, nearest)))
+            if nearest[candidate] <= 0 or np.isinf(nearest[candidate]):
+                break
+            self.__landmarks.append(candidate)
+            from_rows.append(np.array(dijkstra_tree(graph, candidate)[0], dtype=np.float64))
+            to_rows.append(np.array(dijkstra_tree(graph, candidate, reverse=True)[0], dtype=np.float64))
+            nearest = from_rows[-1] if len(from_rows) == 1 else np.minimum(nearest, from_rows[-1])
+
+        if not from_rows:
+            return
+        self.__from_landmark = np.vstack(from_rows)
+        self.__to_landmark = np.vstack(to_rows)
+
+    def get_landmarks(self) -> List[int]:
+        return list(self.__landmarks)
+
+    def get_table(self, to_index : int) -> List[float]:
+        """returns the lower bounds from every node to the target, computing them if needed"""
+        table = self.__tables.get(to_index)
+        if table is None:
+            with np.errstate(invalid="ignore"):
+                # d(L, t) - d(L, v) and d(v, L) - d(t, L) for every landmark L and node v, inf - inf gives nan and
+                # carries no information
+                bounds = np.concatenate((self.__from_landmark[:, to_index, None] - self.__from_landmark,
+                                         self.__to_landmark - self.__to_landmark[:, to_index, None]))
+            bounds = np.fmax.reduce(bounds, axis=0, initial=0.0)
+            bounds = np.maximum(bounds, self.__geographic.get_table(to_index))
+            table = bounds.tolist()
+            self.__tables[to_index] = table
+            if len(self.__tables) > self.__max_targets:
+                self.__tables.popitem(last=False)
+        else:
+            self.__tables.move_to_end(to_index)
+        return table
+
+    def __call__(self, from_index : int, to_index : int) -> float:
+        return self.get_table(to_index)[from_index]
+
+
+HEURISTICS : Dict[str, Callable[[CompiledMap], Callable[[int, int], float]]] = {
+    "precomputed" : PrecomputedHeuristic,
+    "haversine" : HaversineHeuristic,
+    "equirectangular" : EquirectangularHeuristic,
+    "geodesic" : GeodesicHeuristic,
+    "alt" : LandmarkHeuristic,
+}
+
+
+def get_heuristic(graph : CompiledMap, heuristic : str = "precomputed") -> Callable[[int, int], float]:
+    """returns a heuristic backend of the given name bound to the compiled map"""
+    if heuristic.lower() not in HEURISTICS:
+        raise ValueError("Invalid heuristic.")
+    return HEURISTICS[heuristic.lower()](graph)
@@ -0,0 +1,176 @@
+from typing import Dict, List, Optional, Tuple
+from compiled_map import CompiledMap
+from search import Heuristic, PathNotFoundException, SearchStats
+import heapq
+
+Key = Tuple[float, float]
+
+
+class DStarLite:
+    """
+    this class represents the search state of one moving user heading to a fixed goal, kept between position updates
+    with D* Lite (Koenig and Likhachev)
+
+    The search runs backwards from the goal, g(v) is the distance from v to the goal as far as it has been settled and
+    rhs(v) the one-step lookahead min(c(v, w) + g(w)) over the edges v->w. Nodes where the two differ are queued by
+    [min(g, rhs) + h(start, v) + k_m, min(g, rhs)], and the search stops as soon as the start is settled. Distances to
+    the goal do not depend on the start, so when the user moves only k_m grows by h(old start, new start) and the
+    search goes on from where it stopped: a move along the route costs next to nothing, a move off it only settles the
+    nodes between the new start and the region already searched. Changed edge weights are repaired the same way, by
+    requeueing the nodes whose lookahead they change. The heuristic must be consistent, like every backend in heuristics.
+    The maps are undirected, so h(v, start) stands in for h(start, v), which lets the table-based backends build one
+    table per start instead of one per node.
+    """
+    def __init__(self, graph : CompiledMap, goal : int, heuristic : Heuristic):
+        self.__graph = graph
+        self.__goal = goal
+        self.__heuristic = heuristic
+        self.__g : Dict[int, float] = {}
+        self.__rhs : Dict[int, float] = {goal : 0.0}
+        self.__queue : List[Tuple[float, float, int]] = []
+        self.__keys : Dict[int, Key] = {}
+        self.__k_m = 0.0
+        self.__start : Optional[int] = None
+        self.__pushes = 0
+
+    def get_goal(self) -> int:
+        return self.__goal
+
+    def get_start(self) -> Optional[int]:
+        return self.__start
+
+    def get_num_settled(self) -> int:
+        """returns the number of nodes whose distance to the goal is known"""
+        return len(self.__g)
+
+    def __key(self, node : int) -> Key:
+        m = min(self.__g.get(node, float('inf')), self.__rhs.get(node, float('inf')))
+        return (m + self.__heuristic(node, self.__start) + self.__k_m, m)
+
+    def __update_queue(self, node : int):
+        """queues the node with its current key if it is inconsistent, dequeues it (lazily) otherwise"""
+        if self.__g.get(node, float('inf')) != self.__rhs.get(node, float('inf')):
+            key = self.__key(node)
+            self.__keys[node] = key
+            heapq.heappush(self.__queue, (key[0], key[1], node))
+            self.__pushes += 1
+        else:
+            self.__keys.pop(node, None)
+
+    def __lookahead(self, node : int) -> float:
+        offsets, targets, weights = self.__graph.get_adjacency()
+        g = self.__g
+        return min((weights[e] + g.get(targets[e], float('inf')) for e in range(offsets[node], offsets[node + 1])),
+                   default=float('inf'))
+
+    def __top(self) -> Optional[Tuple[float, float, int]]:
+        """returns the smallest entry of the queue that is still current, dropping stale ones"""
+        queue, keys = self.__queue, self.__keys
+        while queue:
+            k1, k2, node = queue[0]
+            if keys.get(node) == (k1, k2):
+                return queue[0]
+            heapq.heappop(queue)
+        return None
+
+    def __compute(self, stats : Optional[SearchStats]):
+        offsets, targets, weights = self.__graph.get_reverse_adjacency()
+        g, rhs, keys, queue = self.__g, self.__rhs, self.__keys, self.__queue
+        start, goal, inf = self.__start, self.__goal, float('inf')
+        expanded, pops, pushes_before, peak = 0, 0, self.__pushes, len(queue)
+
+        while True:
+            top = self.__top()
+            if top is None:
+                break
+            start_key = self.__key(start)
+            if (top[0], top[1]) >= start_key and rhs.get(start, inf) == g.get(start, inf):
+                break
+            k1, k2, node = heapq.heappop(queue)
+            pops += 1
+            new_key = self.__key(node)
+            if (k1, k2) < new_key:
+                # Queued before the start moved, requeue with the current key
+                keys[node] = new_key
+                heapq.heappush(queue, (new_key[0], new_key[1], node))
+                self.__pushes += 1
+                continue
+            del keys[node]
+            expanded += 1
+            peak = max(peak, len(queue))
+
+            g_old = g.get(node, inf)
+            if g_old > rhs[node]:
+                # Settled at a shorter distance, it may now be the best next node of its predecessors
+                g[node] = g_node = rhs[node]
+                for e in range(offsets[node], offsets[node + 1]):
+                    predecessor = targets[e]
+                    cost = weights[e] + g_node
+                    if predecessor != goal and cost < rhs.get(predecessor, inf):
+                        rhs[predecessor] = cost
+                        self.__update_queue(predecessor)
+            else:
+                # Its distance went up, the predecessors that went through it need a new lookahead
+                g.pop(node, None)
+                for e in range(offsets[node], offsets[node + 1]):
+                    predecessor = targets[e]
+                    if predecessor != goal and rhs.get(predecessor, inf) == weights[e] + g_old:
+                        rhs[predecessor] = self.__lookahead(predecessor)
+                        self.__update_queue(predecessor)
+                if node != goal:
+                    rhs[node] = self.__lookahead(node)
+                self.__update_queue(node)
+
+        if stats is not None:
+            stats.add_search(expanded, self.__pushes - pushes_before, pops, peak)
+
+    def move_to(self, start : int, stats : Optional[SearchStats] = None) -> Tuple[List[int], float]:
+        """
+        this function moves the user to the start node and returns the node indices of a shortest path from it to the
+        goal and its length, searching only as much as the move requires
+        """
+        if self.__start is None:
+            self.__start = start
+            self.__update_queue(self.__goal)
+        elif start != self.__start:
+            self.__k_m += self.__heuristic(start, self.__start)
+            self.__start = start
+        self.__compute(stats)
+
+        distance = self.__g.get(start, float('inf'))
+        if distance == float('inf'):
+            raise PathNotFoundException("No path found from initial to goal.")
+
+        # Walk from the start to the neighbour that is closest to the goal through its edge
+        offsets, targets, weights = self.__graph.get_adjacency()
+        g, inf = self.__g, float('inf')
+        path = [start]
+        node = start
+        while node != self.__goal:
+            best, best_cost = -1, inf
+            for e in range(offsets[node], offsets[node + 1]):
+                cost = weights[e] + g.get(targets[e], inf)
+                if cost < best_cost:
+                    best, best_cost = targets[e], cost
+            if best < 0 or len(path) > self.__graph.get_num_nodes():
+                raise PathNotFoundException("No path found from initial to goal.")
+            node = best
+            path.append(node)
+        return path, distance
+
+    def update_edges(self, graph : CompiledMap, changed : List[Tuple[int, int, float, float]]):
+        """
+        this function switches to the graph after the given (source, target, old weight, new weight) edge changes,
+        the affected lookaheads are requeued and repaired by the next move_to
+        """
+        self.__graph = graph
+        g, rhs, inf = self.__g, self.__rhs, float('inf')
+        for source, target, old_weight, new_weight in changed:
+            if source == self.__goal:
+                continue
+            if new_weight < old_weight:
+                rhs[source] = min(rhs.get(source, inf), new_weight + g.get(target, inf))
+            elif rhs.get(source, inf) == old_weight + g.get(target, inf):
+                rhs[source] = self.__lookahead(source)
+            if self.__start is not None:
+                self.__update_queue(source)
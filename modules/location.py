@@ -1,4 +1,4 @@
-from typing import List, Tuple
+from typing import Callable, List, Optional, Tuple
 
 class Location:
     """this class represents a location in the map or a node in the graph"""
@@ -63,6 +63,35 @@ class Location:
 
 
 
+class LazyLocation(Location):
+    """
+    this class represents a location whose paths are only created when they are first accessed, load_paths returns
+    the (location, distance) of each of its paths, maps backed by a compiled graph create their locations this way
+    """
+    def __init__(self, name : str, latitude : float, longitude : float, id : str, is_important : bool,
+                 load_paths : Callable[[], List[Tuple[Location, float]]]):
+        super().__init__(name, latitude, longitude, id, is_important)
+        self.__load_paths : Optional[Callable[[], List[Tuple[Location, float]]]] = load_paths
+
+    def __load(self):
+        if self.__load_paths is not None:
+            load_paths, self.__load_paths = self.__load_paths, None
+            for to_loc, distance in load_paths():
+                super().add_neighbouring_path(to_loc, distance)
+
+    def get_neighbouring_path(self) -> List['Path']:
+        self.__load()
+        return super().get_neighbouring_path()
+
+    def get_neighbouring_loc(self) -> List["Location"]:
+        self.__load()
+        return super().get_neighbouring_loc()
+
+    def add_neighbouring_path(self, to_loc : "Location", distance : int):
+        self.__load()
+        super().add_neighbouring_path(to_loc, distance)
+
+
 class Path:
     """this class represents a path between two locations in the map or an edge in the graph"""
 
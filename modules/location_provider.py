@@ -0,0 +1,155 @@
+from typing import Callable, List, Optional, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import json
+import os
+import tempfile
+import threading
+import time
+
+# A source returns the current (latitude, longitude), or None when it has no fix, within the given timeout in seconds
+LocationSource = Callable[[float], Optional[Tuple[float, float]]]
+
+DEFAULT_CACHE_PATH = os.path.join("data", ".cache", "last_location.json")
+
+# Centre of the XMUM campus, shown until a fix arrives when nothing better is known
+CAMPUS_CENTER = (2.8317, 101.7050)
+
+IPINFO_URL = "http://ipinfo.io/json"
+
+
+def ip_location_source(url : str = IPINFO_URL) -> LocationSource:
+    """returns a source that geolocates the public IP address with ipinfo.io"""
+    def fetch(timeout : float) -> Optional[Tuple[float, float]]:
+        # Imported here so the offline sources work without requests installed
+        import requests
+        try:
+            response = requests.get(url, timeout=timeout)
+            loc = response.json().get("loc", "").split(",")
+            if len(loc) == 2:
+                return float(loc[0]), float(loc[1])
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"Error while fetching location: {e}")
+        return None
+    return fetch
+
+
+def file_location_source(path : str) -> LocationSource:
+    """returns an offline source that reads "latitude,longitude" from a local file, e.g. written by a GPS daemon"""
+    def fetch(timeout : float) -> Optional[Tuple[float, float]]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                latitude, longitude = f.read().strip().split(",")
+            return float(latitude), float(longitude)
+        except (OSError, ValueError):
+            return None
+    return fetch
+
+
+def fixed_location_source(coordinate : Tuple[float, float]) -> LocationSource:
+    """returns an offline source that always reports the same coordinate"""
+    return lambda timeout: (float(coordinate[0]), float(coordinate[1]))
+
+
+class LocationProvider:
+    """
+    this class represents the current position of the user, fetched in the background from a list of sources tried in
+    order (each given what is left of a strict overall timeout) and remembered on disk as the last known position
+
+    get_last_known() answers immediately, from memory, the disk cache or the given default, so the UI can render
+    before any network request, and fetch_async() returns a future with the fresh fix (None if no source has one).
+    A source is only given a timeout, which it may not honour for every step (requests does not bound DNS lookups
+    or the whole download with it), so the sources always run on the background thread and get_location() stops
+    waiting for them at the deadline.
+    """
+    def __init__(self, sources : Optional[List[LocationSource]] = None, cache_path : Optional[str] = DEFAULT_CACHE_PATH,
+                 timeout : float = 3.0, default : Optional[Tuple[float, float]] = CAMPUS_CENTER):
+        self.__sources = list(sources) if sources is not None else [ip_location_source()]
+        self.__cache_path = cache_path
+        self.__timeout = timeout
+        self.__default = default
+        self.__last_known : Optional[Tuple[float, float]] = None
+        self.__last_fix_time : Optional[float] = None
+        self.__executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="location")
+        self.__pending : Optional[Future] = None
+        self.__lock = threading.Lock()
+        self.__load_cache()
+
+    def __load_cache(self):
+        if self.__cache_path is None:
+            return
+        try:
+            with open(self.__cache_path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            self.__last_known = (float(cached["latitude"]), float(cached["longitude"]))
+            self.__last_fix_time = float(cached.get("time", 0.0))
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    def __save_cache(self):
+        if self.__cache_path is None:
+            return
+        try:
+            directory = os.path.dirname(os.path.abspath(self.__cache_path))
+            os.makedirs(directory, exist_ok=True)
+            # Write to a temporary file and move it into place so a crash never leaves half a file
+            fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", dir=directory)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"latitude": self.__last_known[0], "longitude": self.__last_known[1], "time": self.__last_fix_time}, f)
+            os.replace(tmp_path, self.__cache_path)
+        except OSError as e:
+            print(f"Could not save last location: {e}")
+
+    def get_last_known(self) -> Optional[Tuple[float, float]]:
+        """returns the last fix, from this run or an earlier one, or the default when there has never been one"""
+        return self.__last_known if self.__last_known is not None else self.__default
+
+    def get_last_fix_time(self) -> Optional[float]:
+        """returns the time.time() of the last fix, None if there has never been one"""
+        return self.__last_fix_time
+
+    def get_location(self) -> Optional[Tuple[float, float]]:
+        """
+        waits for a fetch (see fetch_async) for at most the timeout and returns its fix, None if there is none by then,
+        a fetch still running afterwards keeps going in the background and updates the last known position
+        """
+        try:
+            return self.fetch_async().result(timeout=self.__timeout)
+        except FutureTimeoutError:
+            return None
+
+    def __fetch(self) -> Optional[Tuple[float, float]]:
+        """tries the sources in order within the timeout and returns the first fix, None if there is none"""
+        deadline = time.monotonic() + self.__timeout
+        for source in self.__sources:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                fix = source(remaining)
+            except Exception as e:
+                print(f"Location source failed: {e}")
+                fix = None
+            if fix is not None:
+                self.__last_known = (float(fix[0]), float(fix[1]))
+                self.__last_fix_time = time.time()
+                self.__save_cache()
+                return self.__last_known
+        return None
+
+    def fetch_async(self) -> Future:
+        """starts trying the sources on a background thread, a fetch already running is shared instead of starting another"""
+        with self.__lock:
+            if self.__pending is None or self.__pending.done():
+                self.__pending = self.__executor.submit(self.__fetch)
+            return self.__pending
+
+
+_provider : Optional[LocationProvider] = None
+
+
+def get_location_provider() -> LocationProvider:
+    """returns the provider shared by the app, it geolocates the IP address and caches the fix under data/.cache"""
+    global _provider
+    if _provider is None:
+        _provider = LocationProvider()
+    return _provider
@@ -1,13 +1,16 @@
+import startup_profile
+# python main_screen.py --profile-startup reports where the time to the first window goes, it must start before the
+# imports and only starts when this module is run as a script
+profiler = startup_profile.start_if_requested() if __name__ == "__main__" else None
 import customtkinter as ctk
-import tkintermapview
-import map_with_shortest
-from map import Map
-from data_loader import get_map
-import utils
-from PIL import Image, ImageTk
-
-xmu = Map()
-xmu = get_map()
+from graph_session import get_session
+from route_jobs import RouteJobRunner
+from location_provider import get_location_provider
+import time
+# tkintermapview, PIL, folium and the map modules are imported where they are first used, off the path to the first window
+
+# The map shared with map_with_shortest, it is loaded and warmed up in the background once the app starts
+session = get_session()
 ctk.set_appearance_mode("dark")  # Modes: "dark", "light", or "system"
 ctk.set_default_color_theme("blue")  # Themes: "blue", "green", "dark-blue"
 
@@ -21,6 +24,15 @@ class App(ctk.CTk):
         self.title("Shortest Path App")
         self.geometry("900x600")
 
+        # Load the map and build its search structures while the first screen is showing
+        session.start_prewarm()
+
+        # Routes are computed and drawn in the background, their results come back through the Tk event loop
+        self.route_jobs = RouteJobRunner(timeout=60.0)
+        self.route_jobs.attach(self)
+        # Closing the window stops the route being computed, so it neither delays the exit nor opens a browser after it
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
         # Create two frames
         self.frame1 = Screen1(self)
         self.frame2 = Screen2(self)
@@ -32,6 +44,10 @@ class App(ctk.CTk):
     def show_frame(self, frame):
         frame.tkraise()  # Bring the selected frame to the front
 
+    def on_close(self):
+        self.route_jobs.shutdown()
+        self.destroy()
+
 
 class Screen1(ctk.CTkFrame):
     def __init__(self, parent):
@@ -42,6 +58,7 @@ class Screen1(ctk.CTkFrame):
 
     def show_bg(self, parent):
         # Load and display background image
+        from PIL import Image
         self.bg_image = ctk.CTkImage(Image.open("main.png"), size=(900, 600))
         self.bg_label = ctk.CTkLabel(self, image=self.bg_image, text="")
         self.bg_label.pack(fill="both", expand=True)
@@ -54,7 +71,11 @@ class Screen1(ctk.CTkFrame):
 class Screen2(ctk.CTkFrame):
     def __init__(self, parent):
         super().__init__(parent)
-        self.current_coordinates = utils.get_curr_loc()  # Initial coordinates
+        # Start from the last known position and look up the current one in the background
+        location = get_location_provider()
+        self.current_coordinates = location.get_last_known()  # Initial coordinates
+        self.location_confirmed = False  # Set once the user picks a location, a late fix must not override it
+        location_fix = location.fetch_async()
 
         # Add the frame to the grid
         self.grid(row=0, column=0, sticky="nsew")  # Stretch to fill parent container
@@ -77,7 +98,7 @@ class Screen2(ctk.CTkFrame):
 
         # Variable for live-updating coordinates
         self.current_coords_var = ctk.StringVar()
-        self.current_coords_var.set("Latitude: -\nLongitude: -")  # Initial placeholder text
+        self.current_coords_var.set("Latitude: -\nLongitude: -\nLocating...")  # Initial placeholder text
 
         coords_label = ctk.CTkLabel(left_frame, textvariable=self.current_coords_var, font=("Arial", 15),
                                     justify='left')
@@ -93,17 +114,40 @@ class Screen2(ctk.CTkFrame):
         map_frame.pack(side="right", fill="both", expand=True)  # Aligns map frame to the right
 
         # Create the map widget inside the map frame
+        import tkintermapview
         self.map_widget = tkintermapview.TkinterMapView(map_frame, width=1400, height=600, corner_radius=0)
         self.map_widget.pack(fill="both", expand=True)  # Ensures the map fills its frame
         self.map_widget.set_position(2.8317, 101.7050)
         self.map_widget.set_zoom(18)
 
         # Variable to hold the current location marker
-        self.current_marker = self.map_widget.set_marker(self.current_coordinates[0],self.current_coordinates[1], "Current Location")
+        self.current_marker = None
+        if self.current_coordinates is not None:
+            self.current_marker = self.map_widget.set_marker(self.current_coordinates[0],self.current_coordinates[1], "Current Location")
+
+        # Move the marker once the location lookup finishes, polled so the widgets are only touched from the Tk thread
+        def on_location_fix():
+            if not location_fix.done():
+                self.after(200, on_location_fix)
+                return
+            coords = location_fix.result()
+            if self.location_confirmed:
+                return
+            if coords is None:
+                self.current_coords_var.set("Latitude: -\nLongitude: -\nLocation unavailable")
+                return
+            self.current_coords_var.set(f"Latitude: {coords[0]:.6f}\nLongitude: {coords[1]:.6f}")
+            if self.current_marker:
+                self.current_marker.delete()
+            self.current_marker = self.map_widget.set_marker(coords[0], coords[1], "Current Location")
+            self.current_coordinates = [coords[0], coords[1]]
+
+        self.after(200, on_location_fix)
 
         # Function to change the current location
         def change_current(coords):
             print("Change Current Location to:", coords)
+            self.location_confirmed = True
 
             # Update coordinates text
             self.current_coords_var.set(f"Latitude: {coords[0]:.6f}\nLongitude: {coords[1]:.6f}")
@@ -131,20 +175,33 @@ class Screen3 (ctk.CTkFrame):
 
     def show_bg2(self, parent):
         # Load and display background image
+        from PIL import Image
         self.bg_image = ctk.CTkImage(Image.open("bg_pic.png"), size=(900, 600))
         self.bg_label = ctk.CTkLabel(self, image=self.bg_image, text="")
         self.bg_label.place(relx=0.5, rely=0.5, anchor="center")
 
-        important_locations = xmu.get_important_loc()
-        important_label = sorted([loc.get_name() for loc in important_locations])
-        # Create a dropdown menu (CTkOptionMenu)
+        # Create a dropdown menu (CTkOptionMenu), filled in once the map has loaded
+        # Picking another destination cancels the route still being computed for the previous one
         self.choices = ctk.CTkOptionMenu(self,
-                                    values=important_label, width=200,
-                                    font=('Times New Roman', 16), fg_color="black")
-
-        # Set default value
-        self.choices.set(important_label[0])
+                                    values=["Loading locations..."], width=200,
+                                    font=('Times New Roman', 16), fg_color="black",
+                                    command=lambda choice: cancel_route())
+        self.choices.set("Loading locations...")
         self.choices.place(relx=0.5, rely=0.5, anchor="center")
+
+        def fill_choices():
+            # Poll instead of waiting for the map, the Tk thread must not block while it loads
+            important_label = session.get_important_names()
+            if important_label is None:
+                if session.is_loaded():
+                    self.choices.set("Could not load the map")
+                else:
+                    self.after(100, fill_choices)
+                return
+            self.choices.configure(values=important_label)
+            # Set default value
+            self.choices.set(important_label[0])
+        fill_choices()
         
         # Set dev tools
         new_frame = ctk.CTkFrame(self,fg_color="black",width=10)
@@ -154,8 +211,14 @@ class Screen3 (ctk.CTkFrame):
         text.pack(side="left", padx=(5,0))
 
         # Choosing search algorithms
-        algo_choices = xmu.get_all_search_algorithm()
         def choose_algo():
+            if checkbox.get() != 1:
+                return # Unchecked while the map was loading
+            algo_choices = session.get_search_algorithms()
+            if algo_choices is None:
+                if not session.is_loaded():
+                    self.after(100, choose_algo)
+                return
             self.chosen_algo = ctk.CTkOptionMenu(self,
                                     values=algo_choices, width=30,
                                     font=('Lato', 16), fg_color="black")
@@ -168,7 +231,7 @@ class Screen3 (ctk.CTkFrame):
         def on_check():
             if checkbox.get() == 1:  # If the checkbox is selected
                 choose_algo()
-            else:
+            elif hasattr(self, 'chosen_algo'):
                 self.chosen_algo.place_forget()
 
         checkbox = ctk.CTkCheckBox(new_frame, text="", command=on_check,width=40,hover=True)
@@ -181,12 +244,43 @@ class Screen3 (ctk.CTkFrame):
                 return 'a star'  # Or some default value if no selection is available
 
 
+        # Progress of the route being computed
+        self.status_var = ctk.StringVar(value="")
+        status_label = ctk.CTkLabel(self, textvariable=self.status_var, font=("Lato", 13), fg_color="black")
+        status_label.place(relx=0.5, rely=0.77, anchor="center")
+
+        def cancel_route():
+            if parent.route_jobs.is_busy():
+                parent.route_jobs.cancel()
+                self.status_var.set("Previous route cancelled")
+
+        def on_route_done(map_file):
+            self.status_var.set(f"Route opened in the browser ({map_file})")
+
+        def on_route_error(error):
+            if isinstance(error, TimeoutError):
+                self.status_var.set("The route took too long, try another algorithm")
+            elif isinstance(error, KeyError):
+                self.status_var.set("Unknown destination")
+            else:
+                self.status_var.set(f"No route found: {error}")
+
         # Add a button
+        def route(job, from_location, to_location, chosen_algorithm):
+            import map_with_shortest
+            return map_with_shortest.play(from_location, to_location, chosen_algorithm, progress=job.progress,
+                                          should_stop=job.should_stop)
+
         def button_action():
+            if not session.is_loaded():
+                self.status_var.set("The map is still loading...")
+                return
             to_location = self.choices.get()  # Get selected location from dropdown
             from_location = list(parent.frame2.current_coordinates)
             chosen_algorithm = get_chosen_algo()
-            map_with_shortest.play(from_location,to_location,chosen_algorithm)
+            parent.route_jobs.submit(
+                lambda job: route(job, from_location, to_location, chosen_algorithm),
+                on_done=on_route_done, on_error=on_route_error, on_progress=self.status_var.set)
 
         button = ctk.CTkButton(self, text="Select Location", command=button_action, width=40,
                                 fg_color="black",  # Button's primary color
@@ -201,6 +295,27 @@ class Screen3 (ctk.CTkFrame):
                                     command=lambda: parent.show_frame(parent.frame2))
         back_button.place(relx=0.82, rely=0.9, anchor="center")
 
+def report_startup(app, started):
+    """prints the startup profile once the map has been warmed up in the background"""
+    if not session.is_warm():
+        app.after(100, report_startup, app, started)
+        return
+    profiler.add_phase("map warm up (background, until warm)", time.perf_counter() - started)
+    for phase, seconds in session.get_phase_times().items():
+        profiler.add_phase(f"  warm up: {phase}", seconds)
+    print(profiler.report())
+
+
 if __name__ == "__main__":
-    app = App()
+    if profiler is not None:
+        profiler.add_phase("imports", profiler.get_elapsed())
+        started = time.perf_counter()  # The warm up starts with the window
+        with profiler.phase("create window"):
+            app = App()
+        with profiler.phase("first frame"):
+            app.update()
+        profiler.add_phase("time to first window", profiler.get_elapsed())
+        report_startup(app, started)
+    else:
+        app = App()
     app.mainloop()
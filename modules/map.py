@@ -1,29 +1,131 @@
-from typing import Dict, List, Tuple, Optional, Union
-from location import Location, Path
-from geopy.distance import geodesic
-from queue import PriorityQueue
+from typing import Callable, Dict, Hashable, Iterator, List, Tuple, Optional, Union
+from location import LazyLocation, Location, Path
+from compiled_map import CompiledMap
+from search import PathNotFoundException, Heuristic, OPTIMAL_SEARCH_ALGORITHMS, SearchStats, get_search_algorithm
+from heuristics import HEURISTICS, LandmarkHeuristic, get_heuristic, haversine
+from edge_overlay import CLOSED, EdgeOverlay
+from spatial_index import SpatialIndex
+from route_cache import RouteCache
+from distance_oracle import DistanceOracle
+from route_trees import RouteTreeStore
+from contraction import ContractionHierarchy, get_contraction_hierarchy
+from batch_routing import route_batch
+from live_routing import DStarLite
 import numpy as np
+import time
 
 
 class Map: 
-    """this class represents a map or a graph of locations and paths between them"""
-    def __init__(self):
+    """
+    this class represents a map or a graph of locations and paths between them
+
+    A map rebuilt from a compiled graph (from_compiled) keeps the graph as its only copy of the locations and paths, 
+    the Location and Path objects are created when they are first accessed, so routing on a large map does not hold 
+    an object per node and edge. Changing the map or listing all of its locations creates the remaining ones.
+    """
+    def __init__(self, route_cache_size : int = 256, live_route_sessions : int = 64):
         self.__nodes : Dict[str : Location] = {}
-    
+        # The compiled graph the locations not yet in __nodes are created from, None once they all exist
+        self.__lazy : Optional[CompiledMap] = None
+        self.__compiled : Optional[CompiledMap] = None
+        self.__overlay = EdgeOverlay()
+        self.__effective : Optional[CompiledMap] = None
+        self.__heuristics : Dict[str, Heuristic] = {}
+        self.__spatial_index : Optional[SpatialIndex] = None
+        self.__route_cache = RouteCache(route_cache_size)
+        self.__use_oracle = False
+        self.__oracle : Optional[DistanceOracle] = None
+        self.__route_tree_bytes : Optional[int] = None
+        self.__route_trees : Optional[RouteTreeStore] = None
+        self.__stats_listener : Optional[Callable[[SearchStats], None]] = None
+        # Search state of the moving users of from_curr_shortest_path, least recently updated dropped first
+        self.__live_routes = RouteCache(live_route_sessions)
+
+    @staticmethod
+    def from_compiled(graph : CompiledMap) -> "Map":
+        """
+        this function rebuilds a map from its compiled form and reuses the compiled graph for searching, its 
+        locations and paths are created from the graph on first access
+        """
+        new_map = Map()
+        new_map.__lazy = graph
+        new_map.__compiled = graph
+        return new_map
+
+    def __loc_at(self, graph : CompiledMap, index : int) -> Location:
+        """returns the location of a node of the backing graph, creating it on first access"""
+        id = graph.get_id(index)
+        loc = self.__nodes.get(id)
+        if loc is None:
+            latitude, longitude = graph.get_coordinate(index)
+            # Paths are added in the order of the compiled graph, so compiling the map again numbers them the same
+            loc = LazyLocation(name=graph.get_name(index), latitude=latitude, longitude=longitude, id=id,
+                               is_important=graph.is_important(index),
+                               load_paths=lambda: [(self.__loc_at(graph, target), distance) for target, distance in graph.get_neighbours(index)])
+            self.__nodes[id] = loc
+        return loc
+
+    def __materialize(self):
+        """creates every location and path not created yet, before the map is changed or listed"""
+        graph = self.__lazy
+        if graph is None:
+            return
+        nodes = {}
+        for i in range(graph.get_num_nodes()):
+            nodes[graph.get_id(i)] = self.__loc_at(graph, i)
+        for loc in nodes.values():
+            loc.get_neighbouring_path()
+        self.__nodes = nodes
+        self.__lazy = None
+
+    def __has_loc(self, id : str) -> bool:
+        if id in self.__nodes:
+            return True
+        if self.__lazy is None:
+            return False
+        try:
+            self.__lazy.get_index(id)
+        except KeyError:
+            return False
+        return True
+
     def add_loc(self, loc : Location):
+        self.__materialize()
         self.__nodes[loc.get_id()] = loc
+        if self.__spatial_index is not None:
+            self.__spatial_index.insert(loc.get_id(), loc.get_latitude(), loc.get_longitude())
+        self.__invalidate()
     
     def del_loc(self, id : str):
+        self.__materialize()
         del self.__nodes[id]
+        if self.__spatial_index is not None:
+            self.__spatial_index.remove(id)
+        self.__invalidate()
 
     def add_path(self, id1 : str, id2 : str, distance : float):
+        self.__materialize()
         loc1 : Location = self.__nodes[id1]
         loc2 : Location = self.__nodes[id2]
         loc1.add_neighbouring_path(loc2, distance)
         loc2.add_neighbouring_path(loc1, distance)
+        self.__invalidate()
+
+    def __invalidate(self):
+        """drops every structure derived from the graph, they are rebuilt lazily on the next query"""
+        self.__compiled = None
+        self.__effective = None
+        self.__heuristics = {}
+        self.__route_cache.clear()
+        self.__oracle = None
+        self.__route_trees = None
+        self.__live_routes.clear()
 
     def get_all_search_algorithm(self) -> List[str]:
-        return ["a star", "greedy", "uniform", "dfs", "bfs", "bidirectional heuristic", "iterative deepening a star", "iterative deepening DFS"]
+        return ["a star", "greedy", "uniform", "dfs", "bfs", "bidirectional heuristic", "bidirectional dijkstra", "iterative deepening a star", "iterative deepening DFS", "contraction hierarchies"]
+
+    def get_all_heuristic(self) -> List[str]:
+        return list(HEURISTICS.keys())
     
     def get_imp_loc_id_mapping(self) -> Dict[str, str]:
         """returns a dictionary mapping the name of important locations to their ids"""
@@ -34,364 +136,253 @@ class Map:
         return loc_id
     
     def get_all_loc(self) -> List[Location]:
+        self.__materialize()
         return list(self.__nodes.values())
     
     def get_all_loc_id(self) -> List[str]:
+        if self.__lazy is not None:
+            return self.__lazy.get_ids()
         return list(self.__nodes.keys())
 
     def get_important_loc(self) -> List[Location]:
+        if self.__lazy is not None:
+            return [self.__loc_at(self.__lazy, i) for i in np.flatnonzero(self.__lazy.get_important()).tolist()]
         return [loc for loc in self.__nodes.values() if loc.is_important()]
     
     def get_id_loc_mapping(self) -> Dict[str, str]:
+        self.__materialize()
         return self.__nodes
 
     def get_loc(self, id : str)-> Location:
-        return self.__nodes[id]
+        loc = self.__nodes.get(id)
+        if loc is None:
+            if self.__lazy is None:
+                raise KeyError(id)
+            loc = self.__loc_at(self.__lazy, self.__lazy.get_index(id))
+        return loc
 
     def get_loc_by_name(self, name : str) -> Location:
-        return self.__nodes[self.get_imp_loc_id_mapping()[name.strip().lower()]]
+        return self.get_loc(self.get_imp_loc_id_mapping()[name.strip().lower()])
 
-    def __heuristic(self, from_loc : Location, to_loc : Location) -> int:
-        return geodesic(from_loc.get_coordinate(), to_loc.get_coordinate()).meters
-    
-    def __a_star(self, initial : Location, goal : Location) -> Tuple[Dict[int, Optional[Location]], int]:
-        """this function uses A* Search to find the shortest path between two locations"""
-        node : Location = initial
-        previous = {node.get_id() : None}
-        
-        frontier = PriorityQueue()
-        frontier.put((0.0, node))
-        reached = {node.get_id() : 0}
-        
-        #Start search
-        while not frontier.empty():
-            node = frontier.get()[1] #Get the node with the lowest f(n)
-            if node == goal: #Goal reached
-                return previous, reached[goal.get_id()]
-            #Expand node
-            for path in node.get_neighbouring_path():
-                
-                child = path.get_end_loc() 
-                path_cost_to_child = path.get_distance() + reached[node.get_id()] #g(n)
-
-                #add child to frontier
-                if child.get_id() not in reached or path_cost_to_child < reached[child.get_id()]:
-                    reached[child.get_id()] = path_cost_to_child
-                    f_score = path_cost_to_child + self.__heuristic(child, goal)  # f(n) = g(n) + h(n)
-                    frontier.put((f_score, child))
-                    previous[child.get_id()] = node
-                    try:
-                        print("previous:", [(self.__nodes[id1] , loc.get_name())for id1, loc in previous.items()])
-                    except:
-                        pass
-
-        raise PathNotFoundException("No path found from initial to goal.")
-
-    def __greedy(self, initial : Location, goal : Location) -> List[List[int]]:
-        """this function uses Greedy Search to find the shortest path between two locations"""
-        node : Location = initial
-        previous = {node.get_id() : None}
-        
-        frontier = PriorityQueue()
-        frontier.put((0, node))
-        reached = {node.get_id() : 0}
-        
-        #Start search
-        while not frontier.empty():
-            node = frontier.get()[1]
+    def compile(self) -> CompiledMap:
+        """
+        this function returns the map in compressed-sparse-row form with the path overlay applied (closed paths left 
+        out, reweighted paths at their new distance), the compiled map is cached and only rebuilt after the map has 
+        been changed through add_loc, del_loc or add_path, or its overlay has changed
+        """
+        base = self.get_base_graph()
+        if len(self.__overlay) == 0:
+            return base
+        if self.__effective is None:
+            self.__effective = self.__overlay.apply(base)
+        return self.__effective
+
+    def get_base_graph(self) -> CompiledMap:
+        """returns the compiled map without the path overlay"""
+        if self.__compiled is None:
+            self.__compiled = CompiledMap.from_locations(self.get_all_loc())
+        return self.__compiled
+
+    def get_overlay_version(self) -> int:
+        """returns the version of the path overlay, it goes up with every close_path, reopen_path and set_path_weight"""
+        return self.__overlay.get_version()
+
+    def get_overlay_changes(self) -> List[Tuple[str, str, float]]:
+        """returns the (id1, id2, distance) of every closed or reweighted path, closed paths have an infinite distance"""
+        return self.__overlay.get_changes()
+
+    def get_overlay_changes_since(self, version : int) -> List[Tuple[int, str, str, Optional[float]]]:
+        """returns the (version, id1, id2, distance) overlay changes made after the given version, None means reopened"""
+        return self.__overlay.get_changes_since(version)
+
+    def close_path(self, id1 : str, id2 : str) -> int:
+        """this function closes the paths between two locations in both directions, returns the new overlay version"""
+        return self.__change_path(id1, id2, CLOSED)
+
+    def reopen_path(self, id1 : str, id2 : str) -> int:
+        """this function gives the paths between two locations back their base distance, whether they were closed or reweighted"""
+        return self.__change_path(id1, id2, None)
+
+    def set_path_weight(self, id1 : str, id2 : str, distance : float) -> int:
+        """
+        this function changes the distance of the paths between two locations in both directions, e.g. to make a 
+        flooded path less attractive, it cannot be shorter than the ellipsoidal geodesic between them, the largest 
+        estimate any heuristic backend gives, or the informed searches would lose their optimality, returns the new 
+        overlay version
+        """
+        base = self.get_base_graph()
+        u, v = base.get_index(id1), base.get_index(id2)
+        if not distance >= self.get_heuristic("geodesic")(u, v):
+            raise ValueError("A path cannot be shorter than the geodesic between its locations.")
+        return self.__change_path(id1, id2, distance)
+
+    def clear_overlay(self) -> int:
+        """this function reopens every closed or reweighted path, returns the new overlay version"""
+        for id1, id2, _ in self.__overlay.get_changes():
+            self.reopen_path(id1, id2)
+        return self.__overlay.get_version()
+
+    def __change_path(self, id1 : str, id2 : str, distance : Optional[float]) -> int:
+        """
+        applies one overlay change and repairs what was derived from the old weights instead of dropping it: the 
+        cached routes that are no longer valid or may no longer be shortest, the route trees and the important route 
+        table around the changed path, and the landmark heuristic if a path got shorter (its bounds would overestimate)
+        """
+        base = self.get_base_graph()
+        if distance is None and self.__overlay.get_weight(id1, id2) is None:
+            return self.__overlay.get_version()
+        if distance is not None:
+            u, v = base.get_index(id1), base.get_index(id2)
+            if not base.get_edge_positions(u, v) and not base.get_edge_positions(v, u):
+                raise ValueError(f"There is no path between {id1} and {id2}.")
+        elif not self.__has_loc(id1) or not self.__has_loc(id2):
+            # The locations were deleted since the path was changed, there is nothing left to repair
+            version = self.__overlay.set_weight(id1, id2, None)
+            self.__effective = None
+            return version
+        else:
+            u, v = base.get_index(id1), base.get_index(id2)
+
+        old_graph = self.compile()
+        version = self.__overlay.set_weight(id1, id2, distance)
+        self.__effective = None
+        graph = self.compile()
+
+        changed = []
+        for source, target in ((u, v), (v, u)):
+            old_weight, new_weight = old_graph.get_edge_weight(source, target), graph.get_edge_weight(source, target)
+            if old_weight != new_weight:
+                changed.append((source, target, old_weight, new_weight))
+        if changed:
+            self.__repair(graph, changed)
+        return version
+
+    def __repair(self, graph : CompiledMap, changed : List[Tuple[int, int, float, float]]):
+        shortened = [(source, target, new_weight) for source, target, old_weight, new_weight in changed if new_weight < old_weight]
+        changed_edges = {(source, target) for source, target, _, _ in changed}
+        optimal_searches = {search.__name__ for search in OPTIMAL_SEARCH_ALGORITHMS}
+        latitudes, longitudes = np.radians(graph.get_latitudes()), np.radians(graph.get_longitudes())
+
+        def lower_bound(a : int, b : int) -> float:
+            return float(haversine(latitudes[a], longitudes[a], latitudes[b], longitudes[b]))
+
+        def is_stale(key, value) -> bool:
+            # A route over a changed path has the wrong length, a shortest route may be beaten through a shortened one
+            _, distance, path = value
+            if any((path[i], path[i + 1]) in changed_edges for i in range(len(path) - 1)):
+                return True
+            if key[2] not in optimal_searches:
+                return False
+            return any(lower_bound(path[0], source) + weight + lower_bound(target, path[-1]) < distance
+                       for source, target, weight in shortened)
+
+        self.__route_cache.evict_if(is_stale)
+        if self.__oracle is not None:
+            self.__oracle.repair(graph, changed)
+        if self.__route_trees is not None:
+            self.__route_trees.repair(graph, changed)
+        if shortened:
+            self.__heuristics.pop("alt", None)
+            self.__live_routes.evict_if(lambda session, live : live[1] == "alt")
+        for live, _ in self.__live_routes.values():
+            live.update_edges(graph, changed)
+
+    def get_spatial_index(self) -> SpatialIndex:
+        """returns the spatial index over all locations, it is built on first use and kept up to date by add_loc and del_loc"""
+        if self.__spatial_index is None:
+            if self.__lazy is not None:
+                graph = self.__lazy
+                points = zip(graph.get_ids(), graph.get_latitudes().tolist(), graph.get_longitudes().tolist())
+            else:
+                points = ((loc.get_id(), loc.get_latitude(), loc.get_longitude()) for loc in self.__nodes.values())
+            self.__spatial_index = SpatialIndex.from_points(points)
+        return self.__spatial_index
+
+    def find_nearest_location(self, coord) -> Location:
+        """this function finds the nearest location to the given coordinate, raises ValueError if it is not finite"""
+        return self.get_loc(self.get_spatial_index().nearest(coord))
+
+    def find_k_nearest_locations(self, coord, k : int) -> List[Location]:
+        """this function finds the k nearest locations to the given coordinate, nearest first, raises ValueError if it is not finite"""
+        return [self.get_loc(id) for id, _ in self.get_spatial_index().k_nearest(coord, k)]
+
+    def get_heuristic(self, heuristic : str = "precomputed") -> Heuristic:
+        """returns the heuristic backend bound to the compiled map, backends keep their tables between queries"""
+        heuristic = heuristic.lower()
+        if heuristic not in self.__heuristics:
+            self.__heuristics[heuristic] = get_heuristic(self.compile(), heuristic)
+        return self.__heuristics[heuristic]
+
+    def precompute_landmarks(self, num_landmarks : int = 8) -> LandmarkHeuristic:
+        """
+        this function picks landmarks and computes the distances from and to them for every location, which makes 
+        the "alt" heuristic available to the informed searches without waiting for its first use
+        """
+        self.__heuristics["alt"] = LandmarkHeuristic(self.compile(), num_landmarks)
+        return self.__heuristics["alt"]
 
-            if node == goal: #Goal reached
-                return previous, reached[goal.get_id()]
-            
-            #Expand node
-            for path in node.get_neighbouring_path():
-                child = path.get_end_loc()
-                path_cost_to_child = path.get_distance() + reached[node.get_id()]
+    def get_route_cache(self) -> RouteCache:
+        return self.__route_cache
 
-                #add child to frontier
-                if child.get_id() not in reached or path_cost_to_child < reached[child.get_id()]:
-                    reached[child.get_id()] = path_cost_to_child
-                    frontier.put((self.__heuristic(child, goal), child)) # f(n) =  h(n)
-                    previous[child.get_id()] = node
+    def precompute_important_routes(self) -> DistanceOracle:
+        """
+        this function precomputes the shortest routes between all important locations, afterwards shortest_path answers 
+        important-to-important queries of the optimal searches from the table, the table is rebuilt on the first query 
+        after the map changes
+        """
+        self.__use_oracle = True
+        return self.get_distance_oracle()
 
-        raise PathNotFoundException("No path found from initial to goal.")
+    def get_distance_oracle(self) -> Optional[DistanceOracle]:
+        """returns the important route table, or None if precompute_important_routes has not been called"""
+        if self.__use_oracle and self.__oracle is None:
+            graph = self.compile()
+            self.__oracle = DistanceOracle(graph, [graph.get_index(loc.get_id()) for loc in self.get_important_loc()])
+        return self.__oracle
 
+    def enable_route_trees(self, max_bytes : int = 64 * 2 ** 20) -> RouteTreeStore:
+        """
+        this function makes shortest_path answer the optimal searches from shortest-path trees rooted at the goal, a 
+        tree is built on the first query to its goal and reused for any start, the trees are kept within max_bytes
+        """
+        self.__route_tree_bytes = max_bytes
+        self.__route_trees = None
+        return self.get_route_trees()
+
+    def get_route_trees(self) -> Optional[RouteTreeStore]:
+        """returns the store of destination trees, or None if enable_route_trees has not been called"""
+        if self.__route_tree_bytes is not None and self.__route_trees is None:
+            self.__route_trees = RouteTreeStore(self.compile(), self.__route_tree_bytes)
+        return self.__route_trees
+
+    def get_contraction_hierarchy(self) -> ContractionHierarchy:
+        """returns the Contraction Hierarchy of the compiled map, preprocessing it now instead of on the first query"""
+        return get_contraction_hierarchy(self.compile())
+
+    def set_stats_listener(self, listener : Optional[Callable[[SearchStats], None]]):
+        """this function registers a callback that receives the SearchStats of every shortest_path call, None removes it"""
+        self.__stats_listener = listener
+
+    def shortest_path(self, from_loc : Union[str, list], to_loc : str, search_algorithm = "a star", heuristic = "precomputed",
+                      use_cache : bool = True, stats : Optional[SearchStats] = None) -> List[List[int]]:
+        """
+        this function finds the shortest path between two locations using the specified search algorithm, 
+        informed searches use the given heuristic backend (see get_all_heuristic)
 
-    def __uniform(self, initial : Location, goal : Location) -> List[List[int]]:
-        """this function uses Uniform Cost Search to find the shortest path between two locations"""
+        Results are kept in an LRU route cache keyed on the start location (after snapping a coordinate to it), 
+        the goal, the search algorithm and the heuristic, the cache is cleared whenever the map changes. The optimal 
+        searches are answered without searching when precompute_important_routes or enable_route_trees is in use
 
-        node : Location = initial
-        previous = {node.get_id() : None}
-        
-        frontier = PriorityQueue()
-        frontier.put((0, node))
-        reached = {node.get_id() : 0}
-
-        #Start search
-        while not frontier.empty():
-            # print_queue(frontier)
-            node = frontier.get()[1]
-            
-            if node == goal: #Goal reached
-                return previous, reached[goal.get_id()]
-            #Expand node
-            for path in node.get_neighbouring_path():
-                
-                child = path.get_end_loc()
-                path_cost_to_child = path.get_distance() + reached[node.get_id()]
-
-                #add child to frontier
-                if child.get_id() not in reached or path_cost_to_child < reached[child.get_id()]:
-                    reached[child.get_id()] = path_cost_to_child
-                    frontier.put((path_cost_to_child, child)) # f(n) =  g(n)
-                    previous[child.get_id()] = node
-        raise PathNotFoundException("No path found from initial to goal.")
-    
-    def __dfs(self, initial : Location, goal : Location) -> List[List[int]]:
-        """this function uses Depth-First Search to find the shortest path between two locations"""
-        reached = {initial.get_id() : 0}
-        previous = {initial.get_id() : None}
-
-        node : Location = initial
-
-        #Initialize frontier as a stack
-        frontier = [node]
-
-        #Start search
-        while frontier:
-            node = frontier.pop()
-            
-            #Goal reached
-            if node == goal:
-                return previous, reached[goal.get_id()]
-            
-            #Expand node
-            for path in node.get_neighbouring_path():
-                child = path.get_end_loc() #child
-                path_cost_to_child = path.get_distance() + reached[node.get_id()]
-
-                #add child to frontier
-                if child.get_id() not in reached or path_cost_to_child < reached[child.get_id()]:
-                    reached[child.get_id()] = path_cost_to_child
-                    frontier.append(child) 
-                    previous[child.get_id()] = node
-
-        raise PathNotFoundException("No path found from initial to goal.")
-
-
-    def __bfs(self, initial : Location, goal : Location) -> List[List[int]]:
-        """this function uses Breadth-First Search to find the shortest path between two locations"""
-        reached = {initial.get_id() : 0}
-        previous = {initial.get_id() : None}
-
-        node : Location = initial
-
-        #Initialize frontier as a queue
-        frontier = [node]
-
-        while frontier:
-            node = frontier.pop(0)
-            
-            #Goal reached
-            if node == goal:
-                return previous, reached[goal.get_id()]
-            
-            #Expand node
-            for path in node.get_neighbouring_path():
-                child = path.get_end_loc() #child
-                path_cost_to_child = path.get_distance() + reached[node.get_id()]
-
-                #add child to frontier
-                if child.get_id() not in reached or path_cost_to_child < reached[child.get_id()]:
-                    reached[child.get_id()] = path_cost_to_child
-                    frontier.append(child) # f(n) =  -depth
-                    previous[child.get_id()] = node
-
-        raise PathNotFoundException("No path found from initial to goal.")
-
-    def __bidirectional_heuristic(self, initial : Location, goal : Location) -> List[List[int]]:
-        """this function uses Bidirectional Heuristic Search to find the shortest path between two locations"""
-        node_f : Location = initial
-        node_b : Location = goal
-
-        frontier_f = PriorityQueue()
-        frontier_b = PriorityQueue()
-
-        frontier_f.put((0.0, node_f))
-        frontier_b.put((0.0, node_b))
-
-        reached_f = {initial.get_id() : 0}
-        previous_f = {initial.get_id() : None}
-
-        reached_b = {goal.get_id() : 0}
-        previous_b = {goal.get_id() : None}
-
-        expanded_f = []
-        expanded_b = []
-
-        solution = None
-
-        while not frontier_f.empty() and not frontier_b.empty():
-            if frontier_f.queue[0][0] < frontier_b.queue[0][0]:
-                #Expand node at f
-                node_f = frontier_f.get()[1]
-                expanded_f.append(node_f.get_id())
-
-                #Check if node_f has been expanded by backward search
-                if node_f.get_id() in expanded_b:
-                    solution = node_f
-                    break
-
-                #Expand node at f
-                for path in node_f.get_neighbouring_path():
-                    child = path.get_end_loc()
-                    path_cost_to_child = path.get_distance() + reached_f[node_f.get_id()]
-                    if child.get_id() not in reached_f or path_cost_to_child < reached_f[child.get_id()]:
-                        reached_f[child.get_id()] = path_cost_to_child
-                        f_score = max(2 * path_cost_to_child, path_cost_to_child + self.__heuristic(child, goal))  # f(n) = g(n) + h(n)
-                        frontier_f.put((f_score, child))
-                        previous_f[child.get_id()] = node_f
-            else:
-                #Expand node at b
-                node_b = frontier_b.get()[1]
-                expanded_b.append(node_b.get_id())
-
-                #Check if node_b has been expanded by forward search
-                if node_b.get_id() in expanded_f:
-                    solution = node_b
-                    break
-                
-                #Expand node at b
-                for path in node_b.get_neighbouring_path():
-                    child = path.get_end_loc()
-                    path_cost_to_child = path.get_distance() + reached_b[node_b.get_id()]
-                    if child.get_id() not in reached_b or path_cost_to_child < reached_b[child.get_id()]:
-                        reached_b[child.get_id()] = path_cost_to_child
-                        f_score = max(2 * path_cost_to_child, path_cost_to_child + self.__heuristic(child, initial))
-                        frontier_b.put((f_score, child))
-                        previous_b[child.get_id()] = node_b
-        
-        # Construct the path if a solution is found
-        if solution is not None:
-            path = []
-            n = solution
-            while n is not None:
-                path.insert(0, n.get_coordinate())
-                n = previous_f[n.get_id()]
-            n = solution
-            while n is not None:
-                path.append(n.get_coordinate())
-                n = previous_b[n.get_id()]
-            return path, reached_f[solution.get_id()] + reached_b[solution.get_id()]
-        else:
-            raise PathNotFoundException("No path found from initial to goal.")
-
-    
-    def __iterative_deepening_search(self, initial: Location, goal: Location) -> Tuple[List[List[int]], int]:
+        When a SearchStats is given (or a listener is set with set_stats_listener) it is filled with the work done by
+        the search and the time spent snapping the endpoints, searching and reconstructing the path
         """
-        this function defines Iterative Deepening Depth-First Search to find the shortest path between two locations
-        by recursively exploring paths up to a depth limit and increasing it iteratively
-        """    
-        def dfs_with_depth_limit(node: Location, depth: int, visited: set) -> Tuple[Optional[List[Location]], Optional[int]]:
-            
-            if node == goal:
-                return [node], 0
-            if depth == 0:
-                return None, None
-            if node in visited:
-                return None, None
-            
-            visited.add(node)
-
-            # Explore all neighboring paths from current node
-            for path in node.get_neighbouring_path():
-                child = path.get_end_loc()
-                path_cost = path.get_distance()
-                # Recursively perform DFS on the child node with reduced depth
-                result, cost = dfs_with_depth_limit(child, depth - 1, visited)
-                
-                # Append node if valid path is found
-                if result:
-                        return ([node] + result, path_cost + cost)
-                
-            visited.remove(node)
-            return None, None
-        
-        depth_limit = len(self.__nodes)
-        depth = 0
-
-        # Start the search
-        while depth <= depth_limit:
-            visited = set()
-            result, total_cost = dfs_with_depth_limit(initial, depth, visited)
-            
-            if result:
-                path_coordinates = [[loc.get_latitude(), loc.get_longitude()] for loc in result]
-                return path_coordinates, total_cost
-            depth += 1 # Increment the depth limit for the next iteration
-
-        raise PathNotFoundException("No path found from initial to goal.")
-
-
-
-    def __iterative_deepening_a_star (self, initial : Location, goal : Location) -> Tuple[List[List[int]], int]:
-        """this function defines Iterative Deepening A* Search to find the shortest path between two locations"""
-
-        # threshold limited search
-        def dfs(current: Location, g: float, threshold: float, path: List[Location], visited: set) -> Tuple[Optional[float], Optional[List[Location]]]:
-            f = g + self.__heuristic(current, goal)
-
-            # If f(n) exceeds the threshold, return the value
-            if f > threshold:
-                return f, None
-            if current == goal:
-                return g, path[:]
-            
-            
-            min_threshold = float('inf')
-
-            # Explore all neighboring paths from current node
-            for neighbor_path in current.get_neighbouring_path():
-                neighbor = neighbor_path.get_end_loc()
-                if neighbor in visited:
-                    continue
-
-                visited.add(neighbor)
-                path.append(neighbor)
-                cost_to_neighbor = neighbor_path.get_distance()
-
-                # Recursively perform DFS on the child node
-                result, solution_path = dfs(neighbor, g + cost_to_neighbor, threshold, path, visited)
-                if solution_path is not None:
-                    return result, solution_path
-                
-                min_threshold = min(min_threshold, result)
-                path.pop()
-                visited.remove(neighbor)
-
-            return min_threshold, None
-        
-        threshold = self.__heuristic(initial, goal)
-        path = [initial]
-
-        # Start the search
-        while True:
-            visited = {initial}
-            # Perform DFS with threshold
-            result, solution_path = dfs(initial, 0, threshold, path, visited)
-            if solution_path is not None:
-                return [[loc.get_coordinate() for loc in solution_path], result]
-            if result == float('inf'):
-                raise PathNotFoundException("No path found from initial to goal.")
-            threshold = result
-                           
-        
-    def shortest_path(self, from_loc : Union[str, list], to_loc : str, search_algorithm = "a star") -> List[List[int]]:
-        """this function finds the shortest path between two locations using the specified search algorithm"""
+        if stats is None and self.__stats_listener is not None:
+            stats = SearchStats()
+        start_time = time.perf_counter()
 
         # set the initial and goal locations from the input
         if isinstance(from_loc, list) and len(from_loc) == 2:
-            initial = find_nearest_location(from_loc, self)
+            initial = self.find_nearest_location(from_loc)
         elif isinstance(from_loc, str):
             initial = self.get_loc_by_name(from_loc)
         else:
@@ -399,53 +390,146 @@ class Map:
         
         goal = self.get_loc_by_name(to_loc)
 
-
-        # Call the appropriate search algorithm
-        if search_algorithm.lower() in ["a star", "a*"]:
-            previous, distance = self.__a_star(initial, goal)
-        elif search_algorithm.lower() == "greedy":
-            previous, distance = self.__greedy(initial, goal)
-        elif search_algorithm.lower() in ["uniform", "uni"]:
-            previous, distance = self.__uniform(initial, goal)
-        elif search_algorithm.lower() in ["dfs", "depth first search", "depth first"]:
-            previous, distance = self.__dfs(initial, goal)
-
-        elif search_algorithm.lower() in ["bfs", "breadth first search", "breadth first"]:
-            previous, distance = self.__bfs(initial, goal)
-        elif search_algorithm.lower() in ["bidir", "bidirectional heuristic", "bidirectional"]:
-            previous, distance = self.__bidirectional_heuristic(initial, goal)
-        elif search_algorithm.lower() in ["id a star", "ida*", "iterative deepening a*", "iterative deepening a star", "deepening a*", "deepening a star"]:
-            previous, distance = self.__iterative_deepening_a_star(initial, goal)
-        elif search_algorithm.lower() in ["iterative deepening", "id", "deepening", "iterative deepening dfs"]:
-            previous, distance = self.__iterative_deepening_search(initial, goal)
+        search = get_search_algorithm(search_algorithm)
+        if stats is not None:
+            stats.set_algorithm(search.__name__)
+            snapped_time = time.perf_counter()
+            stats.add_phase_time("snap", snapped_time - start_time)
+
+        # Aliases of an algorithm share cache entries, callers may modify the returned path so hand out copies
+        key = (initial.get_id(), goal.get_id(), search.__name__, heuristic.lower())
+        if use_cache:
+            cached = self.__route_cache.get(key)
+            if cached is not None:
+                if stats is not None:
+                    stats.set_source("cache")
+                    stats.add_phase_time("search", time.perf_counter() - snapped_time)
+                    self.__emit_stats(stats)
+                return list(cached[0]), cached[1]
+
+        # Run the search on the compiled graph using integer node indices
+        graph = self.compile()
+        initial_index, goal_index = graph.get_index(initial.get_id()), graph.get_index(goal.get_id())
+        is_optimal = search in OPTIMAL_SEARCH_ALGORITHMS
+        oracle = self.get_distance_oracle() if is_optimal else None
+        route_trees = self.get_route_trees() if is_optimal else None
+        if oracle is not None and oracle.has_route(initial_index, goal_index):
+            source = "oracle"
+            path, distance = oracle.get_path(initial_index, goal_index), oracle.get_distance(initial_index, goal_index)
+        elif route_trees is not None:
+            source = "route trees"
+            path, distance = route_trees.get_path(initial_index, goal_index), route_trees.get_distance(initial_index, goal_index)
         else:
-            raise ValueError("Invalid search algorithm.")
-        
-        #if the path already constructed, return it
-        if isinstance(previous, list):
-            return previous, distance
-
-
-        # Construct the path from the previous dictionary
-        if previous is not None:
-            path_coordinate = []
-            n = goal
-            while n != None:
-                path_coordinate.insert(0, n.get_coordinate())
-                n = previous[n.get_id()]
-            return path_coordinate, distance
-        else:
-            return None
+            source = "search"
+            try:
+                path, distance = search(graph, initial_index, goal_index, self.get_heuristic(heuristic), stats=stats)
+            except PathNotFoundException:
+                if stats is not None:
+                    stats.set_source(source)
+                    stats.add_phase_time("search", time.perf_counter() - snapped_time)
+                    self.__emit_stats(stats)
+                raise
+        if stats is not None:
+            stats.set_source(source)
+            searched_time = time.perf_counter()
+            stats.add_phase_time("search", searched_time - snapped_time)
+
+        path_coordinate = [graph.get_coordinate(i) for i in path]
+
+        if use_cache:
+            self.__route_cache.put(key, (path_coordinate, distance, path))
+        if stats is not None:
+            stats.add_phase_time("reconstruct", time.perf_counter() - searched_time)
+            self.__emit_stats(stats)
+        return list(path_coordinate), distance
+
+    def __emit_stats(self, stats : SearchStats):
+        if self.__stats_listener is not None:
+            self.__stats_listener(stats)
     
-    def from_curr_shortest_path(self, coor, to_loc):
-        pass
+    def shortest_paths(self, pairs : List[Tuple[Union[str, list], str]], search_algorithm = "a star", heuristic = "precomputed",
+                       max_workers : Optional[int] = None) -> Iterator[Tuple[int, Optional[List[Tuple[float, float]]], float]]:
+        """
+        this function routes many (from_loc, to_loc) pairs, accepted in the same forms as shortest_path, across a 
+        process pool and yields (position of the pair, path coordinates, distance) as the results complete, the path 
+        is None and the distance infinite when there is no route (see batch_routing.route_batch)
+        """
+        graph = self.compile()
+        index_pairs = []
+        for from_loc, to_loc in pairs:
+            if isinstance(from_loc, list) and len(from_loc) == 2:
+                initial = self.find_nearest_location(from_loc)
+            elif isinstance(from_loc, str):
+                initial = self.get_loc_by_name(from_loc)
+            else:
+                raise ValueError("Invalid from_loc.")
+            index_pairs.append((graph.get_index(initial.get_id()), graph.get_index(self.get_loc_by_name(to_loc).get_id())))
+
+        for position, path, distance in route_batch(graph, index_pairs, search_algorithm, heuristic, max_workers):
+            yield position, None if path is None else [graph.get_coordinate(i) for i in path], distance
+
+    def from_curr_shortest_path(self, coor, to_loc : str, session : Hashable = None, heuristic = "haversine",
+                                stats : Optional[SearchStats] = None) -> Tuple[List[Tuple[float, float]], float]:
+        """
+        this function finds the shortest path from the current coordinate of a moving user to a location, like 
+        shortest_path but keeping the search state of the session between calls (D* Lite, see live_routing.DStarLite), 
+        so a position update only repairs the search for the part that changed instead of starting over
+
+        Each session follows one destination, asking for another one starts a new search. Closing or reweighting paths 
+        repairs the sessions too. The per-call heuristic backends suit this best, a table-based one computes a table 
+        every time the user reaches a new location
+        """
+        if stats is None and self.__stats_listener is not None:
+            stats = SearchStats()
+        start_time = time.perf_counter()
+
+        initial = self.find_nearest_location(list(coor))
+        goal = self.get_loc_by_name(to_loc)
+        graph = self.compile()
+        initial_index, goal_index = graph.get_index(initial.get_id()), graph.get_index(goal.get_id())
+        heuristic = heuristic.lower()
+
+        entry = self.__live_routes.get(session)
+        if entry is None or entry[0].get_goal() != goal_index or entry[1] != heuristic:
+            entry = (DStarLite(graph, goal_index, self.get_heuristic(heuristic)), heuristic)
+            self.__live_routes.put(session, entry)
+            source = "live search"
+        else:
+            source = "live repair"
+        live = entry[0]
+
+        if stats is not None:
+            stats.set_algorithm("d star lite")
+            stats.set_source(source)
+            snapped_time = time.perf_counter()
+            stats.add_phase_time("snap", snapped_time - start_time)
+        try:
+            path, distance = live.move_to(initial_index, stats)
+        except PathNotFoundException:
+            if stats is not None:
+                stats.add_phase_time("search", time.perf_counter() - snapped_time)
+                self.__emit_stats(stats)
+            raise
+        if stats is not None:
+            searched_time = time.perf_counter()
+            stats.add_phase_time("search", searched_time - snapped_time)
+
+        path_coordinate = [graph.get_coordinate(i) for i in path]
+        if stats is not None:
+            stats.add_phase_time("reconstruct", time.perf_counter() - searched_time)
+            self.__emit_stats(stats)
+        return path_coordinate, distance
+
+    def end_live_route(self, session : Hashable = None):
+        """this function drops the search state of a session of from_curr_shortest_path"""
+        self.__live_routes.evict_if(lambda key, live : key == session)
 
 def find_nearest_location(coord, map, locs_coor = None):
     """this function finds the nearest location to the given coordinate"""
 
-    # Get the coordinates of all locations if not provided
+    # Use the spatial index of the map unless an explicit coordinate array is given
     if not isinstance(locs_coor, type(np.array([]))):
-        locs_coor = np.array([[loc.get_latitude(), loc.get_longitude()] for loc in map.get_all_loc()])
+        return map.find_nearest_location(coord)
     
     coord = np.array(coord)
     
@@ -456,7 +540,3 @@ def find_nearest_location(coord, map, locs_coor = None):
     index = np.argmin(distances)
     
     return map.get_all_loc()[index]
-
-class PathNotFoundException(Exception):
-    pass
-
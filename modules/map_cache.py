@@ -0,0 +1,107 @@
+from typing import Optional
+from compiled_map import CompiledMap
+import numpy as np
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+# Bump when the layout of the snapshot changes so old snapshots are rebuilt
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_DIR = os.path.join("data", ".cache")
+
+ARRAYS = ["latitudes", "longitudes", "important", "offsets", "targets", "weights"]
+
+
+def fingerprint(file_path : str) -> str:
+    """
+    Computes the content hash of a file.
+
+    Args:
+        file_path (str): The path to the file, usually the KML the map is built from.
+
+    Returns:
+        str: The hex SHA-256 digest of the file contents.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_cache_path(file_path : str, cache_dir : Optional[str] = None) -> str:
+    """returns the snapshot directory used for the given source file"""
+    name = os.path.splitext(os.path.basename(file_path))[0].replace(" ", "_")
+    return os.path.join(cache_dir or DEFAULT_CACHE_DIR, name)
+
+
+def save_compiled_map(graph : CompiledMap, cache_path : str, source_fingerprint : str):
+    """
+    Writes a compiled map to disk as one .npy file per array plus a meta.json with the ids, names and fingerprint.
+
+    The snapshot is written to a temporary directory first and moved into place, so a reader never sees a half
+    written snapshot.
+
+    Args:
+        graph (CompiledMap): The compiled map to save.
+        cache_path (str): The snapshot directory.
+        source_fingerprint (str): The content hash of the file the map was built from.
+    """
+    parent = os.path.dirname(os.path.abspath(cache_path))
+    os.makedirs(parent, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(prefix=".tmp_", dir=parent)
+    try:
+        arrays = {
+            "latitudes": graph.get_latitudes(),
+            "longitudes": graph.get_longitudes(),
+            "important": graph.get_important(),
+            "offsets": graph.get_offsets(),
+            "targets": graph.get_targets(),
+            "weights": graph.get_weights(),
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_path, f"{name}.npy"), np.ascontiguousarray(array))
+
+        meta = {
+            "version": CACHE_VERSION,
+            "fingerprint": source_fingerprint,
+            # numpy integers are not JSON serializable, store plain Python values
+            "ids": [id.item() if isinstance(id, np.generic) else id for id in graph.get_ids()],
+            "names": graph.get_names(),
+        }
+        with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+        if os.path.isdir(cache_path):
+            shutil.rmtree(cache_path)
+        os.replace(tmp_path, cache_path)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+
+def load_compiled_map(cache_path : str, source_fingerprint : str) -> Optional[CompiledMap]:
+    """
+    Loads a compiled map snapshot with its arrays memory-mapped.
+
+    Args:
+        cache_path (str): The snapshot directory.
+        source_fingerprint (str): The content hash of the current source file.
+
+    Returns:
+        Optional[CompiledMap]: The compiled map, or None if there is no snapshot, it is unreadable, or it was built
+                               from a different version of the source file or with an older snapshot layout.
+    """
+    try:
+        with open(os.path.join(cache_path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != CACHE_VERSION or meta.get("fingerprint") != source_fingerprint:
+            return None
+
+        arrays = {name: np.load(os.path.join(cache_path, f"{name}.npy"), mmap_mode="r") for name in ARRAYS}
+        return CompiledMap(ids=meta["ids"], names=meta["names"], **arrays)
+    except (OSError, ValueError, KeyError):
+        return None
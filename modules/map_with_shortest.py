@@ -1,21 +1,37 @@
-from map import Map
-from data_loader import get_map
-import folium
-import webbrowser
-import folium.plugins
-import folium.plugins.antpath
+from graph_session import get_session
+from search import SearchStats
 import math
-from data_loader import find_nearest_location
-from geopy.distance import geodesic
 
 
-def play(from_location,to_location,chosen_algorithm):
-    xmu = Map()
-    xmu = get_map()
-    # Get a list of important locations
-    important_locations = xmu.get_important_loc()
+def play(from_location,to_location,chosen_algorithm, progress=None, open_browser=True, should_stop=None):
+    """
+    finds the route and opens it on a folium map in the browser, progress is called with a message before each step 
+    (a RouteJob.progress when run in the background, which can stop the job between steps) and should_stop is polled
+    during the search (a RouteJob.should_stop, the search raises SearchCancelled once it returns True), returns the map file
+    """
+    progress = progress or (lambda message: None)
+    # Imported on the first route rather than at startup, folium and geopy are slow to import
+    import folium
+    import folium.plugins
+    import folium.plugins.antpath
+    import webbrowser
+    from geopy.distance import geodesic
+
+    # Use the map shared with the UI, it is loaded and warmed up once per process
+    progress("Loading map...")
+    session = get_session()
+    xmu = session.get_map()
+    # Get a list of important locations, the map creates them on first access so hold the session lock
+    with session.get_lock():
+        important_locations = xmu.get_important_loc()
     print(from_location, to_location)
-    shortest_path, distance = xmu.shortest_path(from_location, to_loc=to_location,search_algorithm=chosen_algorithm)
+    progress("Searching for the shortest path...")
+    stats = None
+    if should_stop is not None:
+        stats = SearchStats()
+        stats.set_cancel_check(should_stop)
+    shortest_path, distance = session.shortest_path(from_location, to_loc=to_location,search_algorithm=chosen_algorithm, stats=stats)
+    progress("Drawing the map...")
     shortest_path.insert(0, from_location)
     distance += geodesic(shortest_path[0], shortest_path[1]).meters
     # Create a dictionary mapping names to coordinates
@@ -64,5 +80,8 @@ def play(from_location,to_location,chosen_algorithm):
     # Save Map and Open in Browser
     map_file = "xmum_map.html"
     m.save(map_file)
-    webbrowser.open(map_file)
-    print(f"Map saved as {map_file}")
\ No newline at end of file
+    print(f"Map saved as {map_file}")
+    if open_browser:
+        progress("Opening the browser...")
+        webbrowser.open(map_file)
+    return map_file
\ No newline at end of file
@@ -0,0 +1,264 @@
+import xml.etree.ElementTree as ET
+from array import array
+from typing import Dict, FrozenSet, IO, Iterator, Optional, Tuple
+import numpy as np
+import bz2
+import gzip
+from map import Map
+from compiled_map import CompiledMap
+from heuristics import vincenty
+from map_cache import fingerprint, get_cache_path, load_compiled_map, save_compiled_map
+
+#highway=* values that can be walked on, roads are kept since most of them have sidewalks or verges
+WALKABLE_HIGHWAYS = frozenset({
+    'footway', 'path', 'pedestrian', 'steps', 'corridor', 'living_street', 'residential', 'service', 'track',
+    'unclassified', 'tertiary', 'tertiary_link', 'secondary', 'secondary_link', 'primary', 'primary_link', 'road',
+    'cycleway', 'bridleway',
+})
+
+#foot=* and access=* values that forbid walking
+NO_FOOT_ACCESS = frozenset({'no', 'private'})
+FOOT_ALLOWED = frozenset({'yes', 'designated', 'permissive'})
+
+#Number of nodes read before their ids are matched against the needed ones, and of segments measured at a time
+CHUNK_SIZE = 1 << 18
+
+
+def open_osm(file_path: str) -> IO[bytes]:
+    """opens an OSM XML file, decompressing .bz2 and .gz extracts on the fly"""
+    if file_path.endswith('.bz2'):
+        return bz2.open(file_path, 'rb')
+    if file_path.endswith('.gz'):
+        return gzip.open(file_path, 'rb')
+    return open(file_path, 'rb')
+
+
+def iter_osm_elements(file_path: str, tag: str) -> Iterator[ET.Element]:
+    """
+    Streams the top-level elements of an OSM XML file with iterparse, freeing every element once it has been read so
+    memory does not grow with the size of the file.
+
+    Args:
+        file_path (str): The path to the OSM XML file.
+        tag (str): The elements to yield, 'node' or 'way'.
+
+    Yields:
+        ET.Element: Each matching element, complete with its children. It is cleared after the caller is done with it.
+    """
+    with open_osm(file_path) as f:
+        root = None
+        for event, elem in ET.iterparse(f, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = elem
+                continue
+            if elem.tag == tag:
+                yield elem
+            #Drop every finished top-level element (node, way, relation, bounds...) from the tree
+            if elem.tag in ('node', 'way', 'relation', 'bounds', 'changeset'):
+                elem.clear()
+                root.clear()
+
+
+def is_walkable(tags: Dict[str, str], highways: FrozenSet[str] = WALKABLE_HIGHWAYS) -> bool:
+    """
+    Decides whether a way can be walked on from its tags.
+
+    Args:
+        tags (Dict[str, str]): The tags of the way.
+        highways (FrozenSet[str]): The highway values that are walkable.
+
+    Returns:
+        bool: True for the accepted highway types and for ways explicitly open to pedestrians, unless foot or
+              general access is forbidden.
+    """
+    foot = tags.get('foot')
+    if foot in FOOT_ALLOWED:
+        return True
+    if foot in NO_FOOT_ACCESS or tags.get('access') in NO_FOOT_ACCESS:
+        return False
+    return tags.get('highway') in highways and tags.get('area') != 'yes'
+
+
+def read_osm_ways(file_path: str, highways: FrozenSet[str] = WALKABLE_HIGHWAYS) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Reads the node references of the walkable ways in one streaming pass.
+
+    Args:
+        file_path (str): The path to the OSM XML file.
+        highways (FrozenSet[str]): The highway values that are walkable.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]:
+            - The node ids referenced by all walkable ways, one way after another.
+            - The offsets of each way in the references, way i spans refs[offsets[i]:offsets[i + 1]].
+    """
+    refs = array('q')
+    offsets = array('q', [0])
+    for way in iter_osm_elements(file_path, 'way'):
+        tags = {tag.get('k'): tag.get('v') for tag in way.iter('tag')}
+        if not is_walkable(tags, highways):
+            continue
+        way_refs = [int(nd.get('ref')) for nd in way.iter('nd')]
+        if len(way_refs) < 2:
+            continue
+        refs.extend(way_refs)
+        offsets.append(len(refs))
+    return np.frombuffer(refs, dtype=np.int64), np.frombuffer(offsets, dtype=np.int64)
+
+
+def read_osm_nodes(file_path: str, node_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray, Dict[int, str]]:
+    """
+    Reads the coordinates and names of the given nodes in one streaming pass.
+
+    Args:
+        file_path (str): The path to the OSM XML file.
+        node_ids (np.ndarray): The sorted, unique ids of the nodes to read.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, Dict[int, str]]:
+            - The latitude of each node, NaN for nodes missing from the file (clipped at the edge of an extract).
+            - The longitude of each node, NaN for missing nodes.
+            - The name tag of the named nodes, by position in node_ids.
+    """
+    latitudes = np.full(len(node_ids), np.nan)
+    longitudes = np.full(len(node_ids), np.nan)
+    names = {}
+    chunk_ids, chunk_lats, chunk_lons = array('q'), array('d'), array('d')
+
+    def flush():
+        #Match a whole chunk of ids at once instead of looking each node up
+        ids = np.array(chunk_ids, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(node_ids, ids), max(len(node_ids) - 1, 0))
+        found = node_ids[positions] == ids if len(node_ids) else np.zeros(len(ids), dtype=bool)
+        latitudes[positions[found]] = np.array(chunk_lats, dtype=np.float64)[found]
+        longitudes[positions[found]] = np.array(chunk_lons, dtype=np.float64)[found]
+        del chunk_ids[:], chunk_lats[:], chunk_lons[:]
+
+    for node in iter_osm_elements(file_path, 'node'):
+        node_id = int(node.get('id'))
+        chunk_ids.append(node_id)
+        chunk_lats.append(float(node.get('lat')))
+        chunk_lons.append(float(node.get('lon')))
+        for tag in node.iter('tag'):
+            if tag.get('k') == 'name':
+                position = np.searchsorted(node_ids, node_id)
+                if position < len(node_ids) and node_ids[position] == node_id:
+                    names[int(position)] = tag.get('v').strip()
+        if len(chunk_ids) >= CHUNK_SIZE:
+            flush()
+    if chunk_ids:
+        flush()
+    return latitudes, longitudes, names
+
+
+def build_osm_graph(file_path: str, highways: FrozenSet[str] = WALKABLE_HIGHWAYS, simplify: bool = True) -> CompiledMap:
+    """
+    Builds the walking graph of an OSM XML extract directly as a compiled map, without pandas.
+
+    The file is streamed twice: once for the walkable ways, then for the coordinates of the nodes they reference, so
+    only the node references and the coordinates of walkable nodes are ever held in memory. With simplify, the nodes
+    in the middle of a way that join nothing else are merged into the edges around them, keeping junctions, way ends
+    and named nodes. Named nodes are marked important.
+
+    Args:
+        file_path (str): The path to the OSM XML file, optionally .bz2 or .gz compressed.
+        highways (FrozenSet[str]): The highway values that are walkable.
+        simplify (bool): Whether to merge the nodes that only shape a way.
+
+    Returns:
+        CompiledMap: The walking graph, with the OSM node ids as location ids and geodesic edge lengths in meters.
+    """
+    refs, way_offsets = read_osm_ways(file_path, highways)
+    node_ids, ref_positions, ref_counts = np.unique(refs, return_inverse=True, return_counts=True)
+    del refs
+    latitudes, longitudes, names = read_osm_nodes(file_path, node_ids)
+    missing = np.isnan(latitudes)
+
+    #A segment joins consecutive references of the same way whose nodes are both in the file
+    n_refs = len(ref_positions)
+    way_starts = np.zeros(n_refs, dtype=bool)
+    way_starts[way_offsets[:-1]] = True
+    valid = ~way_starts[1:] & ~missing[ref_positions[:-1]] & ~missing[ref_positions[1:]]
+    segment_lengths = np.zeros(len(valid))
+    segments = np.flatnonzero(valid)
+    for start in range(0, len(segments), CHUNK_SIZE):
+        chunk = segments[start:start + CHUNK_SIZE]
+        u, v = ref_positions[chunk], ref_positions[chunk + 1]
+        segment_lengths[chunk] = vincenty(latitudes[u], longitudes[u], latitudes[v], longitudes[v])
+
+    #Keep junctions, named nodes, way ends and both sides of a gap, every other node only shapes its way
+    kept = ref_counts >= 2 if simplify else np.ones(len(node_ids), dtype=bool)
+    kept[list(names)] = True
+    kept_refs = kept[ref_positions]
+    kept_refs[way_offsets[:-1]] = True
+    kept_refs[way_offsets[1:] - 1] = True
+    gaps = np.flatnonzero(~valid)
+    kept_refs[gaps] = True
+    kept_refs[gaps + 1] = True
+    kept_refs = np.flatnonzero(kept_refs)
+
+    #An edge runs between consecutive kept references as long as no segment between them is invalid
+    cumulative = np.concatenate(([0.0], np.cumsum(segment_lengths)))
+    invalid_before = np.concatenate(([0], np.cumsum(~valid)))
+    a, b = kept_refs[:-1], kept_refs[1:]
+    edge = invalid_before[b] == invalid_before[a]
+    a, b = a[edge], b[edge]
+    sources, targets = ref_positions[a], ref_positions[b]
+    lengths = cumulative[b] - cumulative[a]
+    keep = sources != targets
+    sources, targets, lengths = sources[keep], targets[keep], lengths[keep]
+
+    #Keep the shortest of parallel edges
+    low, high = np.minimum(sources, targets), np.maximum(sources, targets)
+    order = np.lexsort((lengths, high, low))
+    low, high, lengths = low[order], high[order], lengths[order]
+    first = np.ones(len(low), dtype=bool)
+    first[1:] = (low[1:] != low[:-1]) | (high[1:] != high[:-1])
+    low, high, lengths = low[first], high[first], lengths[first]
+
+    #Renumber the nodes that are on an edge or named
+    used = np.zeros(len(node_ids), dtype=bool)
+    used[low] = True
+    used[high] = True
+    used[list(names)] = True
+    used &= ~missing
+    new_index = np.cumsum(used) - 1
+    positions = np.flatnonzero(used)
+
+    ids = node_ids[positions].tolist()
+    graph_names = [names.get(position, f"Location_{node_id}") for position, node_id in zip(positions.tolist(), ids)]
+    important = np.array([position in names for position in positions.tolist()], dtype=bool)
+    return CompiledMap.from_edges(ids, graph_names, latitudes[positions], longitudes[positions], important,
+                                  new_index[low], new_index[high], lengths)
+
+
+def get_osm_map(file_path: str, highways: FrozenSet[str] = WALKABLE_HIGHWAYS, simplify: bool = True,
+                use_cache: bool = True, cache_dir: Optional[str] = None) -> Map:
+    """
+    Generates a walking map from an OSM XML extract, using the same snapshot cache as data_loader.get_map.
+
+    Args:
+        file_path (str): The path to the OSM XML file, optionally .bz2 or .gz compressed.
+        highways (FrozenSet[str]): The highway values that are walkable.
+        simplify (bool): Whether to merge the nodes that only shape a way.
+        use_cache (bool): Whether to read and write the compiled map snapshot.
+        cache_dir (str): The directory for snapshots, defaults to data/.cache.
+
+    Returns:
+        Map: A Map object with the walkable network of the extract.
+    """
+    if not use_cache:
+        return Map.from_compiled(build_osm_graph(file_path, highways, simplify))
+
+    #The snapshot also depends on how the file was filtered
+    osm_fingerprint = f"{fingerprint(file_path)}:{','.join(sorted(highways))}:{simplify}"
+    cache_path = get_cache_path(file_path, cache_dir) + "_osm"
+    graph = load_compiled_map(cache_path, osm_fingerprint)
+    if graph is None:
+        graph = build_osm_graph(file_path, highways, simplify)
+        try:
+            save_compiled_map(graph, cache_path, osm_fingerprint)
+        except OSError as e:
+            print(f"Could not save map cache: {e}")
+    return Map.from_compiled(graph)
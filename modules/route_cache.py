@@ -0,0 +1,63 @@
+from typing import Any, Callable, Dict, Hashable, List, Optional
+from collections import OrderedDict
+
+
+class RouteCache:
+    """this class represents a bounded least-recently-used cache of route results with hit and miss counters"""
+    def __init__(self, max_size : int = 256):
+        self.__max_size = max_size
+        self.__entries : "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.__hits = 0
+        self.__misses = 0
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, key : Hashable):
+        return key in self.__entries
+
+    def get(self, key : Hashable) -> Optional[Any]:
+        """returns the cached value and marks it as recently used, or None on a miss"""
+        value = self.__entries.get(key)
+        if value is None:
+            self.__misses += 1
+            return None
+        self.__entries.move_to_end(key)
+        self.__hits += 1
+        return value
+
+    def put(self, key : Hashable, value : Any):
+        """stores a value, evicting the least recently used entry when the cache is full"""
+        if self.__max_size <= 0:
+            return
+        self.__entries[key] = value
+        self.__entries.move_to_end(key)
+        while len(self.__entries) > self.__max_size:
+            self.__entries.popitem(last=False)
+
+    def values(self) -> List[Any]:
+        """returns the cached values from least to most recently used, without marking them as used"""
+        return list(self.__entries.values())
+
+    def evict_if(self, predicate : Callable[[Hashable, Any], bool]) -> int:
+        """drops the entries for which predicate(key, value) is true, returns how many were dropped"""
+        stale = [key for key, value in self.__entries.items() if predicate(key, value)]
+        for key in stale:
+            del self.__entries[key]
+        return len(stale)
+
+    def clear(self):
+        """drops every entry, the counters are kept"""
+        self.__entries.clear()
+
+    def get_max_size(self) -> int:
+        return self.__max_size
+
+    def get_hits(self) -> int:
+        return self.__hits
+
+    def get_misses(self) -> int:
+        return self.__misses
+
+    def get_stats(self) -> Dict[str, int]:
+        return {"hits": self.__hits, "misses": self.__misses, "size": len(self.__entries), "max_size": self.__max_size}
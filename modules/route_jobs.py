@@ -0,0 +1,180 @@
+from typing import Any, Callable, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+import queue
+import threading
+import time
+
+
+class JobCancelled(Exception):
+    """raised inside a job that has been cancelled or superseded, at its next progress report"""
+    pass
+
+
+class RouteJob:
+    """
+    this class represents one background job, the work function receives the job and calls job.progress(message)
+    between its steps, which reports the step to the UI and stops the job there if it has been cancelled
+
+    Long steps that cannot report progress, like a search, poll should_stop instead (SearchStats.set_cancel_check),
+    which also turns True once the job has run past its timeout. The timeout counts from when the job starts
+    running, not from when it was submitted.
+    """
+    def __init__(self, job_id : int, runner : "RouteJobRunner", timeout : Optional[float] = None):
+        self.__id = job_id
+        self.__runner = runner
+        self.__timeout = timeout
+        self.__cancelled = threading.Event()
+        self.__started : Optional[float] = None
+
+    def get_id(self) -> int:
+        return self.__id
+
+    def start(self):
+        """starts the timeout clock, called by the runner when the job begins running"""
+        self.__started = time.monotonic()
+
+    def get_elapsed(self) -> float:
+        """returns the seconds the job has been running, 0 while it waits in the queue"""
+        return time.monotonic() - self.__started if self.__started is not None else 0.0
+
+    def is_timed_out(self) -> bool:
+        return self.__timeout is not None and self.get_elapsed() > self.__timeout
+
+    def cancel(self):
+        self.__cancelled.set()
+
+    def is_cancelled(self) -> bool:
+        return self.__cancelled.is_set()
+
+    def should_stop(self) -> bool:
+        """returns True once the job has been cancelled or has run past its timeout"""
+        return self.is_cancelled() or self.is_timed_out()
+
+    def progress(self, message : str):
+        """reports a step of the job, raises JobCancelled if the job should stop"""
+        if self.should_stop():
+            raise JobCancelled()
+        self.__runner._post(self, "progress", message)
+
+
+class RouteJobRunner:
+    """
+    this class runs route jobs one at a time on a background thread so the Tk event loop never blocks, and hands
+    their progress, results and errors back to the UI thread
+
+    Tk widgets may only be touched from the thread running mainloop, so the worker never calls the callbacks itself,
+    it queues them and the UI thread runs them from poll(), which attach() schedules with widget.after. Submitting a
+    job supersedes the previous one: a job that has not started is dropped, a running one is cancelled at its next
+    progress report or should_stop check and its result is discarded. A job still running after the timeout is
+    cancelled the same way and reported as a TimeoutError.
+    """
+    def __init__(self, timeout : Optional[float] = 60.0, poll_interval : int = 50):
+        self.__timeout = timeout
+        self.__poll_interval = poll_interval
+        self.__executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="route-job")
+        self.__events : "queue.Queue" = queue.Queue()
+        self.__current : Optional[RouteJob] = None
+        self.__future : Optional[Future] = None
+        self.__callbacks = {}
+        self.__next_id = 0
+
+    def attach(self, widget):
+        """polls the queued callbacks from the Tk event loop of the widget"""
+        def tick():
+            self.poll()
+            widget.after(self.__poll_interval, tick)
+        widget.after(self.__poll_interval, tick)
+
+    def submit(self, work : Callable[[RouteJob], Any], on_done : Callable[[Any], None],
+               on_error : Optional[Callable[[BaseException], None]] = None,
+               on_progress : Optional[Callable[[str], None]] = None) -> RouteJob:
+        """
+        starts a job, superseding the current one
+
+        Args:
+            work: Runs on the worker thread with the job as its argument, returns the result.
+            on_done: Called on the UI thread with the result.
+            on_error: Called on the UI thread with the exception if the job fails or times out.
+            on_progress: Called on the UI thread with each progress message.
+
+        Returns:
+            RouteJob: The new job.
+        """
+        self.cancel()
+        self.__next_id += 1
+        job = RouteJob(self.__next_id, self, self.__timeout)
+        self.__callbacks[job.get_id()] = (on_done, on_error, on_progress)
+        self.__current = job
+        self.__future = self.__executor.submit(self.__run, job, work)
+        return job
+
+    def __run(self, job : RouteJob, work : Callable[[RouteJob], Any]):
+        if job.is_cancelled():
+            return # Superseded while queued
+        job.start()
+        try:
+            result = work(job)
+        except JobCancelled:
+            return
+        except BaseException as e:
+            if job.should_stop():
+                return # Stopped inside a long step (SearchCancelled), poll reports a timeout
+            self._post(job, "error", e)
+            return
+        self._post(job, "done", result)
+
+    def _post(self, job : RouteJob, kind : str, value : Any):
+        self.__events.put((job, kind, value))
+
+    def cancel(self):
+        """cancels the current job, if any, without reporting it"""
+        if self.__current is not None:
+            self.__current.cancel()
+            if self.__future is not None:
+                self.__future.cancel()
+            self.__callbacks.pop(self.__current.get_id(), None)
+            self.__current = None
+
+    def is_busy(self) -> bool:
+        return self.__current is not None
+
+    def poll(self):
+        """runs the queued callbacks of the current job, on the UI thread"""
+        while True:
+            try:
+                job, kind, value = self.__events.get_nowait()
+            except queue.Empty:
+                break
+            callbacks = self.__callbacks.get(job.get_id())
+            if callbacks is None or job.is_cancelled():
+                continue # Superseded or cancelled
+            on_done, on_error, on_progress = callbacks
+            if kind == "progress":
+                if on_progress is not None:
+                    on_progress(value)
+                continue
+
+            self.__finish(job)
+            if kind == "done":
+                on_done(value)
+            elif on_error is not None:
+                on_error(value)
+
+        job = self.__current
+        if job is not None and job.is_timed_out():
+            _, on_error, _ = self.__callbacks[job.get_id()]
+            job.cancel()
+            self.__finish(job)
+            if on_error is not None:
+                on_error(TimeoutError(f"The route took longer than {self.__timeout:g} s."))
+
+    def __finish(self, job : RouteJob):
+        self.__callbacks.pop(job.get_id(), None)
+        if self.__current is job:
+            self.__current = None
+            self.__future = None
+
+    def shutdown(self):
+        """cancels the current job, which stops at its next progress report or should_stop check, and drops queued ones"""
+        self.cancel()
+        self.__executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,88 @@
+from typing import List, Tuple
+from collections import OrderedDict
+from compiled_map import CompiledMap
+from search import PathNotFoundException, dijkstra_tree, repair_tree
+import numpy as np
+
+
+class RouteTreeStore:
+    """
+    this class represents a memory-bounded store of shortest-path trees rooted at destinations
+
+    The tree of a destination is built with a reverse Dijkstra the first time the destination is asked for. It holds
+    the distance of every node to the destination and its parent, the next node towards the destination, so a route
+    from any start node is read off by following parents. When the trees take more than max_bytes the least recently
+    used ones are dropped.
+    """
+    def __init__(self, graph : CompiledMap, max_bytes : int = 64 * 2 ** 20):
+        self.__graph = graph
+        self.__max_bytes = max_bytes
+        self.__trees : "OrderedDict[int, Tuple[np.ndarray, np.ndarray]]" = OrderedDict()
+        self.__nbytes = 0
+
+    def __len__(self):
+        return len(self.__trees)
+
+    def __contains__(self, destination : int):
+        return destination in self.__trees
+
+    def get_nbytes(self) -> int:
+        return self.__nbytes
+
+    def get_max_bytes(self) -> int:
+        return self.__max_bytes
+
+    def get_tree(self, destination : int) -> Tuple[np.ndarray, np.ndarray]:
+        """returns the (distance, parent) arrays of the tree rooted at the destination, building it if needed"""
+        tree = self.__trees.get(destination)
+        if tree is not None:
+            self.__trees.move_to_end(destination)
+            return tree
+
+        distance, parent = dijkstra_tree(self.__graph, destination, reverse=True)
+        tree = (np.array(distance, dtype=np.float64), np.array(parent, dtype=np.int32))
+        for array in tree:
+            array.setflags(write=False)
+        self.__trees[destination] = tree
+        self.__nbytes += tree[0].nbytes + tree[1].nbytes
+
+        # Always keep the tree just built, even if it alone is over the budget
+        while self.__nbytes > self.__max_bytes and len(self.__trees) > 1:
+            _, (old_distance, old_parent) = self.__trees.popitem(last=False)
+            self.__nbytes -= old_distance.nbytes + old_parent.nbytes
+        return tree
+
+    def get_distance(self, initial : int, destination : int) -> float:
+        return float(self.get_tree(destination)[0][initial])
+
+    def get_path(self, initial : int, destination : int) -> List[int]:
+        """returns the node indices of a shortest path from the start node to the destination"""
+        distance, parent = self.get_tree(destination)
+        if distance[initial] == np.inf:
+            raise PathNotFoundException("No path found from initial to goal.")
+
+        path = [initial]
+        node = initial
+        while node != destination:
+            node = int(parent[node])
+            path.append(node)
+        return path
+
+    def repair(self, graph : CompiledMap, changed : List[Tuple[int, int, float, float]]) -> int:
+        """
+        updates every stored tree to the graph after the given (source, target, old weight, new weight) edge changes,
+        recomputing only the nodes whose route to the destination changes, returns the number of those nodes
+        """
+        self.__graph = graph
+        touched = 0
+        for destination, (distance, parent) in list(self.__trees.items()):
+            distance, parent = distance.copy(), parent.copy()
+            touched += repair_tree(graph, distance, parent, changed, reverse=True)
+            for array in (distance, parent):
+                array.setflags(write=False)
+            self.__trees[destination] = (distance, parent)
+        return touched
+
+    def clear(self):
+        self.__trees.clear()
+        self.__nbytes = 0
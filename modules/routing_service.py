@@ -0,0 +1,357 @@
+import startup_profile
+# --profile-startup reports where the time to the first request goes, it must start before the imports and only
+# starts when this module is run as a script, importing it has no side effects
+profiler = startup_profile.start_if_requested() if __name__ == "__main__" else None
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode, urlsplit
+from map import Map
+from search import PathNotFoundException
+from data_loader import KML_PATH, get_map
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import urllib.error
+import urllib.request
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Largest request body accepted, route queries are a few hundred bytes
+MAX_BODY_SIZE = 1 << 16
+
+STATUS_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+                  500: "Internal Server Error"}
+
+
+class RequestError(Exception):
+    """an error in a request, answered with the given HTTP status"""
+    def __init__(self, status : int, message : str):
+        super().__init__(message)
+        self.status = status
+
+
+class RoutingService:
+    """
+    this class represents a long-lived routing service that keeps one warm map and answers route, nearest-location
+    and important-location queries over a small JSON/HTTP API on asyncio
+
+    Queries run one at a time on a single worker thread, since the map and its caches are not thread-safe, so the
+    event loop stays free to accept connections. Identical queries that arrive while one is being computed wait for
+    that computation instead of starting their own.
+
+    Endpoints (GET with query parameters, or POST with a JSON object of the same fields):
+        /route       from (a location name or "lat,lon"), to, algorithm, heuristic
+        /live        session, lat, lon, to and optionally heuristic, re-routes a moving user incrementally
+        /nearest     lat, lon and optionally k
+        /important   the important locations
+        /algorithms  the search algorithms and heuristics
+        /health      whether the service is up
+    """
+    def __init__(self, city_map : Map, default_algorithm : str = "a star", default_heuristic : str = "precomputed"):
+        self.__map = city_map
+        self.__default_algorithm = default_algorithm
+        self.__default_heuristic = default_heuristic
+        self.__executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="routing")
+        self.__in_flight : Dict[Hashable, asyncio.Future] = {}
+        self.__queries = 0
+        self.__collapsed = 0
+        self.__server : Optional[asyncio.AbstractServer] = None
+        self.__handlers : Dict[str, Callable[[Dict], Awaitable[Dict]]] = {
+            "/route": self.route, "/live": self.live, "/nearest": self.nearest, "/important": self.important,
+            "/algorithms": self.algorithms, "/health": self.health,
+        }
+
+    def get_map(self) -> Map:
+        return self.__map
+
+    def get_stats(self) -> Dict[str, int]:
+        """returns the number of queries computed and of those answered by a computation already in flight"""
+        return {"queries": self.__queries, "collapsed": self.__collapsed, "in_flight": len(self.__in_flight)}
+
+    async def __compute(self, key : Hashable, function : Callable, *args):
+        """runs function on the worker thread, or waits for the identical computation already running"""
+        future = self.__in_flight.get(key)
+        if future is not None:
+            self.__collapsed += 1
+            return await asyncio.shield(future)
+
+        self.__queries += 1
+        future = asyncio.get_running_loop().run_in_executor(self.__executor, function, *args)
+        self.__in_flight[key] = future
+        try:
+            return await asyncio.shield(future)
+        finally:
+            self.__in_flight.pop(key, None)
+
+    @staticmethod
+    def __parse_coordinate(lat, lon) -> Tuple[float, float]:
+        """a coordinate is a finite latitude within [-90, 90] and a finite longitude within [-180, 180]"""
+        try:
+            lat, lon = float(lat), float(lon)
+        except (TypeError, ValueError):
+            raise RequestError(400, "Invalid coordinate.")
+        if not (math.isfinite(lat) and math.isfinite(lon) and -90 <= lat <= 90 and -180 <= lon <= 180):
+            raise RequestError(400, "Coordinate out of range.")
+        return lat, lon
+
+    @staticmethod
+    def __parse_from(value) -> object:
+        """a start is a location name, a [lat, lon] list or a "lat,lon" string"""
+        if isinstance(value, (list, tuple)) and len(value) == 2:
+            return list(RoutingService.__parse_coordinate(value[0], value[1]))
+        if isinstance(value, str):
+            parts = value.split(",")
+            if len(parts) == 2:
+                try:
+                    float(parts[0]), float(parts[1])
+                except ValueError:
+                    return value
+                return list(RoutingService.__parse_coordinate(parts[0], parts[1]))
+            return value
+        raise RequestError(400, "Invalid from.")
+
+    def __route(self, from_loc, to_loc : str, algorithm : str, heuristic : str) -> Dict:
+        try:
+            path, distance = self.__map.shortest_path(from_loc, to_loc, search_algorithm=algorithm, heuristic=heuristic)
+        except KeyError as e:
+            raise RequestError(400, f"Unknown location {e}.")
+        except PathNotFoundException as e:
+            raise RequestError(404, str(e))
+        except ValueError as e:
+            raise RequestError(400, str(e))
+        return {"path": [list(coordinate) for coordinate in path], "distance": distance, "algorithm": algorithm, "heuristic": heuristic}
+
+    async def route(self, params : Dict) -> Dict:
+        if "from" not in params or "to" not in params:
+            raise RequestError(400, "Missing from or to.")
+        from_loc = self.__parse_from(params["from"])
+        to_loc = str(params["to"])
+        algorithm = str(params.get("algorithm", self.__default_algorithm)).lower()
+        heuristic = str(params.get("heuristic", self.__default_heuristic)).lower()
+        key = ("route", tuple(from_loc) if isinstance(from_loc, list) else from_loc.strip().lower(), to_loc.strip().lower(), algorithm, heuristic)
+        return await self.__compute(key, self.__route, from_loc, to_loc, algorithm, heuristic)
+
+    def __live(self, session : str, coordinate : Tuple[float, float], to_loc : str, heuristic : str) -> Dict:
+        try:
+            path, distance = self.__map.from_curr_shortest_path(list(coordinate), to_loc, session=session, heuristic=heuristic)
+        except KeyError as e:
+            raise RequestError(400, f"Unknown location {e}.")
+        except PathNotFoundException as e:
+            raise RequestError(404, str(e))
+        except ValueError as e:
+            raise RequestError(400, str(e))
+        return {"path": [list(coordinate) for coordinate in path], "distance": distance, "session": session}
+
+    async def live(self, params : Dict) -> Dict:
+        try:
+            session = str(params["session"])
+            coordinate = (float(params["lat"]), float(params["lon"]))
+            to_loc = str(params["to"])
+        except (KeyError, TypeError, ValueError):
+            raise RequestError(400, "Invalid session, lat, lon or to.")
+        coordinate = self.__parse_coordinate(*coordinate)
+        heuristic = str(params.get("heuristic", "haversine")).lower()
+        return await self.__compute(("live", session, coordinate, to_loc.strip().lower(), heuristic), self.__live,
+                                    session, coordinate, to_loc, heuristic)
+
+    def __nearest(self, coordinate : Tuple[float, float], k : int) -> Dict:
+        locations = self.__map.find_k_nearest_locations(list(coordinate), k)
+        return {"locations": [{"id": loc.get_id(), "name": loc.get_name(), "coordinate": list(loc.get_coordinate()),
+                               "important": loc.is_important()} for loc in locations]}
+
+    async def nearest(self, params : Dict) -> Dict:
+        try:
+            coordinate = (float(params["lat"]), float(params["lon"]))
+            k = int(params.get("k", 1))
+        except (KeyError, TypeError, ValueError):
+            raise RequestError(400, "Invalid lat, lon or k.")
+        coordinate = self.__parse_coordinate(*coordinate)
+        if k < 1:
+            raise RequestError(400, "k must be at least 1.")
+        return await self.__compute(("nearest", coordinate, k), self.__nearest, coordinate, k)
+
+    def __important(self) -> Dict:
+        return {"locations": [{"id": loc.get_id(), "name": loc.get_name(), "coordinate": list(loc.get_coordinate())}
+                              for loc in sorted(self.__map.get_important_loc(), key=lambda loc: loc.get_name())]}
+
+    async def important(self, params : Dict) -> Dict:
+        return await self.__compute(("important",), self.__important)
+
+    async def algorithms(self, params : Dict) -> Dict:
+        return {"algorithms": self.__map.get_all_search_algorithm(), "heuristics": self.__map.get_all_heuristic()}
+
+    async def health(self, params : Dict) -> Dict:
+        return {"status": "ok", **self.get_stats()}
+
+    async def handle(self, method : str, target : str, body : bytes) -> Tuple[int, Dict]:
+        """answers one request, returns the HTTP status and the JSON response"""
+        url = urlsplit(target)
+        handler = self.__handlers.get(url.path.rstrip("/") or "/")
+        if handler is None:
+            return 404, {"error": f"Unknown endpoint {url.path}."}
+        try:
+            if method == "GET":
+                params = dict(parse_qsl(url.query))
+            elif method == "POST":
+                params = json.loads(body or b"{}")
+                if not isinstance(params, dict):
+                    raise RequestError(400, "The body must be a JSON object.")
+            else:
+                raise RequestError(405, f"Method {method} is not allowed.")
+            return 200, await handler(params)
+        except RequestError as e:
+            return e.status, {"error": str(e)}
+        except json.JSONDecodeError as e:
+            return 400, {"error": f"Invalid JSON: {e}"}
+        except Exception as e:
+            return 500, {"error": f"{type(e).__name__}: {e}"}
+
+    async def __handle_connection(self, reader : asyncio.StreamReader, writer : asyncio.StreamWriter):
+        """serves HTTP/1.1 requests on one connection, keeping it open unless the client asks to close it"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self.__respond(writer, 400, {"error": "Malformed request line."}, close=True)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    length = int(headers.get("content-length", "0") or "0")
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self.__respond(writer, 400, {"error": "Invalid Content-Length."}, close=True)
+                    break
+                if length > MAX_BODY_SIZE:
+                    await self.__respond(writer, 413, {"error": "Request body too large."}, close=True)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                close = headers.get("connection", "").lower() == "close" or version == "HTTP/1.0"
+                status, response = await self.handle(method.upper(), target, body)
+                await self.__respond(writer, status, response, close)
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def __respond(writer : asyncio.StreamWriter, status : int, response : Dict, close : bool):
+        payload = json.dumps(response).encode("utf-8")
+        head = (f"HTTP/1.1 {status} {STATUS_REASONS.get(status, '')}\r\n"
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + payload)
+        await writer.drain()
+
+    async def start(self, host : str = DEFAULT_HOST, port : int = DEFAULT_PORT) -> asyncio.AbstractServer:
+        """starts listening, port 0 picks a free port (see the sockets of the returned server)"""
+        self.__server = await asyncio.start_server(self.__handle_connection, host, port)
+        return self.__server
+
+    async def serve_forever(self, host : str = DEFAULT_HOST, port : int = DEFAULT_PORT):
+        server = await self.start(host, port)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        if self.__server is not None:
+            self.__server.close()
+        self.__executor.shutdown(wait=False)
+
+
+def request_route(from_loc, to_loc : str, search_algorithm : str = "a star", heuristic : str = "precomputed",
+                  host : str = DEFAULT_HOST, port : int = DEFAULT_PORT, timeout : float = 30.0) -> Tuple[List[Tuple[float, float]], float]:
+    """
+    Asks a running routing service for a route, for clients that should share its warm map instead of loading their own.
+
+    Args:
+        from_loc: The start, a location name or a [lat, lon] coordinate as accepted by Map.shortest_path.
+        to_loc (str): The name of the destination.
+        search_algorithm (str): The search algorithm.
+        heuristic (str): The heuristic backend.
+        host (str): The address of the service.
+        port (int): The port of the service.
+        timeout (float): Seconds to wait for the answer.
+
+    Returns:
+        Tuple[List[Tuple[float, float]], float]: The path coordinates and its length in meters.
+
+    Raises:
+        PathNotFoundException: If the service found no route.
+        ValueError: If the service rejected the request.
+        OSError: If the service cannot be reached.
+    """
+    query = urlencode({"from": from_loc if isinstance(from_loc, str) else f"{from_loc[0]},{from_loc[1]}", "to": to_loc,
+                       "algorithm": search_algorithm, "heuristic": heuristic})
+    try:
+        with urllib.request.urlopen(f"http://{host}:{port}/route?{query}", timeout=timeout) as response:
+            result = json.load(response)
+    except urllib.error.HTTPError as e:
+        error = json.load(e).get("error", str(e))
+        if e.code == 404:
+            raise PathNotFoundException(error)
+        raise ValueError(error)
+    return [tuple(coordinate) for coordinate in result["path"]], result["distance"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve routes on a warm map over JSON/HTTP.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--kml", default=KML_PATH, help="the KML file of the map")
+    parser.add_argument("--algorithm", default="a star", help="the default search algorithm")
+    parser.add_argument("--heuristic", default="precomputed", help="the default heuristic")
+    parser.add_argument(startup_profile.PROFILE_FLAG, action="store_true",
+                        help="print the time spent on each import and startup phase before serving")
+    args = parser.parse_args()
+
+    # Called from another module the imports are done already, only the startup phases are profiled then
+    active_profiler = profiler
+    if active_profiler is None and args.profile_startup:
+        active_profiler = startup_profile.StartupProfiler().start()
+    phase = active_profiler.phase if active_profiler is not None else lambda name: contextlib.nullcontext()
+    if active_profiler is not None:
+        active_profiler.add_phase("imports", active_profiler.get_elapsed())
+    with phase("load map"):
+        city_map = get_map(args.kml)
+    # Build the derived structures now instead of on the first query
+    with phase("compile"):
+        city_map.compile()
+    with phase("spatial index"):
+        city_map.get_spatial_index()
+    with phase("heuristic"):
+        city_map.get_heuristic(args.heuristic)
+
+    service = RoutingService(city_map, args.algorithm, args.heuristic)
+    if active_profiler is not None:
+        print(active_profiler.report())
+    print(f"Routing service listening on http://{args.host}:{args.port}")
+    try:
+        asyncio.run(service.serve_forever(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
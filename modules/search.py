@@ -0,0 +1,666 @@
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from collections import deque
+from compiled_map import CompiledMap
+import heapq
+import time
+
+# A heuristic takes the index of a node and the index of the goal and returns an estimate in meters
+Heuristic = Callable[[int, int], float]
+
+# Largest number of nodes an iterative deepening search remembers per iteration
+TRANSPOSITION_TABLE_SIZE = 1 << 20
+
+# Number of expansions between two checks of the deadline and cancel check of a SearchStats, a power of two minus one
+CANCEL_CHECK_MASK = 1023
+
+
+class PathNotFoundException(Exception):
+    pass
+
+
+class SearchCancelled(Exception):
+    """raised inside a search whose SearchStats has been cancelled or has passed its deadline"""
+    pass
+
+
+class SearchStats:
+    """
+    this class records what a single query did: the work of the search (nodes expanded, frontier pushes and pops,
+    peak frontier size and heuristic evaluations), what answered it and the time spent in each phase
+
+    The searches count in local variables and add their counters once when they finish, so passing a stats object
+    costs next to nothing. The depth-first iterative deepening searches count every node put on the current path as 
+    an expansion, a push and a pop, and their peak frontier is the longest path.
+
+    A stats object can also stop the search it is passed to: with a deadline (in time.monotonic seconds) or a cancel
+    check set, the searches call check_cancelled every CANCEL_CHECK_MASK + 1 expansions, which raises SearchCancelled.
+    """
+    def __init__(self):
+        self.__algorithm : Optional[str] = None
+        self.__source : Optional[str] = None
+        self.__nodes_expanded = 0
+        self.__pushes = 0
+        self.__pops = 0
+        self.__peak_frontier = 0
+        self.__heuristic_evaluations = 0
+        self.__phase_times : Dict[str, float] = {}
+        self.__deadline : Optional[float] = None
+        self.__cancel_check : Optional[Callable[[], bool]] = None
+
+    def set_deadline(self, deadline : Optional[float]):
+        """stops the search once time.monotonic() passes the deadline, None removes it"""
+        self.__deadline = deadline
+
+    def set_cancel_check(self, cancel_check : Optional[Callable[[], bool]]):
+        """stops the search once cancel_check returns True, None removes it"""
+        self.__cancel_check = cancel_check
+
+    def is_cancellable(self) -> bool:
+        return self.__deadline is not None or self.__cancel_check is not None
+
+    def check_cancelled(self):
+        """raises SearchCancelled if the deadline has passed or the cancel check returns True"""
+        if self.__deadline is not None and time.monotonic() > self.__deadline:
+            raise SearchCancelled("The search ran past its deadline.")
+        if self.__cancel_check is not None and self.__cancel_check():
+            raise SearchCancelled("The search has been cancelled.")
+
+    def add_search(self, nodes_expanded : int, pushes : int, pops : int, peak_frontier : int, heuristic_evaluations : int = 0):
+        """adds the counters of a finished search, a query may run several (the iterations of IDA*, ...)"""
+        self.__nodes_expanded += nodes_expanded
+        self.__pushes += pushes
+        self.__pops += pops
+        self.__peak_frontier = max(self.__peak_frontier, peak_frontier)
+        self.__heuristic_evaluations += heuristic_evaluations
+
+    def add_phase_time(self, phase : str, seconds : float):
+        self.__phase_times[phase] = self.__phase_times.get(phase, 0.0) + seconds
+
+    def set_algorithm(self, algorithm : str):
+        self.__algorithm = algorithm
+
+    def set_source(self, source : str):
+        """sets what answered the query: "search", "cache", "oracle" or "route trees\""""
+        self.__source = source
+
+    def get_algorithm(self) -> Optional[str]:
+        return self.__algorithm
+
+    def get_source(self) -> Optional[str]:
+        return self.__source
+
+    def get_nodes_expanded(self) -> int:
+        return self.__nodes_expanded
+
+    def get_pushes(self) -> int:
+        return self.__pushes
+
+    def get_pops(self) -> int:
+        return self.__pops
+
+    def get_peak_frontier(self) -> int:
+        return self.__peak_frontier
+
+    def get_heuristic_evaluations(self) -> int:
+        return self.__heuristic_evaluations
+
+    def get_phase_times(self) -> Dict[str, float]:
+        """returns the seconds spent in each phase of the query (snap, search, reconstruct)"""
+        return dict(self.__phase_times)
+
+    def get_total_time(self) -> float:
+        return sum(self.__phase_times.values())
+
+    def as_dict(self) -> Dict[str, object]:
+        return {"algorithm" : self.__algorithm, "source" : self.__source, "nodes_expanded" : self.__nodes_expanded,
+                "pushes" : self.__pushes, "pops" : self.__pops, "peak_frontier" : self.__peak_frontier,
+                "heuristic_evaluations" : self.__heuristic_evaluations, "phase_times" : dict(self.__phase_times)}
+
+    def __repr__(self):
+        phases = ", ".join(f"{phase}={seconds * 1000:.3f}ms" for phase, seconds in self.__phase_times.items())
+        return (f"SearchStats(algorithm={self.__algorithm}, source={self.__source}, expanded={self.__nodes_expanded}, "
+                f"pushes={self.__pushes}, pops={self.__pops}, peak_frontier={self.__peak_frontier}, "
+                f"heuristic_evaluations={self.__heuristic_evaluations}, {phases})")
+
+
+def get_cancel_check(stats : Optional[SearchStats]) -> Optional[Callable[[], None]]:
+    """returns the check_cancelled of the stats if it can stop a search, None otherwise, so loops test it cheaply"""
+    return stats.check_cancelled if stats is not None and stats.is_cancellable() else None
+
+
+def reconstruct_path(previous : Dict[int, Optional[int]], goal : int) -> List[int]:
+    """this function follows the previous pointers back from the goal and returns the node indices in order"""
+    path = []
+    n = goal
+    while n is not None:
+        path.append(n)
+        n = previous[n]
+    path.reverse()
+    return path
+
+
+def dijkstra_tree(graph : CompiledMap, root : int, reverse : bool = False, stop_at : Optional[Set[int]] = None) -> Tuple[List[float], List[int]]:
+    """
+    this function runs Dijkstra's algorithm from the root over the whole graph and returns the distance and parent of 
+    every node, unreachable nodes have an infinite distance and the root and unreachable nodes have parent -1
+
+    With reverse=True the search follows edges backwards, so the distances are to the root and the parent of a node 
+    is the next node on its shortest path towards the root. With stop_at the search ends as soon as all of those nodes 
+    are settled, only their entries (and the nodes on their paths) are final then.
+    """
+    offsets, targets, weights = graph.get_reverse_adjacency() if reverse else graph.get_adjacency()
+    distance = [float('inf')] * graph.get_num_nodes()
+    parent = [-1] * graph.get_num_nodes()
+    distance[root] = 0.0
+    remaining = set(stop_at) if stop_at is not None else None
+
+    frontier = [(0.0, root)]
+    while frontier:
+        d, node = heapq.heappop(frontier)
+        if d > distance[node]: #Stale entry
+            continue
+        if remaining is not None:
+            remaining.discard(node)
+            if not remaining:
+                break
+        for e in range(offsets[node], offsets[node + 1]):
+            child = targets[e]
+            path_cost_to_child = d + weights[e]
+            if path_cost_to_child < distance[child]:
+                distance[child] = path_cost_to_child
+                parent[child] = node
+                heapq.heappush(frontier, (path_cost_to_child, child))
+    return distance, parent
+
+
+def repair_tree(graph : CompiledMap, distance, parent, changed : List[Tuple[int, int, float, float]], reverse : bool = False) -> int:
+    """
+    this function updates in place a (distance, parent) tree built by dijkstra_tree after some edge weights changed,
+    graph has the new weights (a closed edge is simply missing) and changed lists each edge (source, target, old weight,
+    new weight) in the direction it is stored in the graph, returns the number of nodes whose entries were recomputed
+
+    Only the region whose distances change is touched: the subtrees hanging below edges that got longer or closed lose
+    their distances and are reattached from their neighbours outside the subtree, and the nodes that an edge which got
+    shorter or reopened now serves better are improved, then both are propagated with Dijkstra until nothing improves.
+    """
+    # Edges are relaxed from a node to its children along expand, and the candidate parents of a node are its lookup edges
+    expand_offsets, expand_targets, expand_weights = graph.get_reverse_adjacency() if reverse else graph.get_adjacency()
+    lookup_offsets, lookup_targets, lookup_weights = graph.get_adjacency() if reverse else graph.get_reverse_adjacency()
+    inf = float('inf')
+
+    # The subtrees below tree edges that got longer or closed
+    affected = set()
+    improved = []
+    for source, target, old_weight, new_weight in changed:
+        child, tree_parent = (source, target) if reverse else (target, source)
+        if new_weight < old_weight:
+            improved.append((child, tree_parent, new_weight))
+        elif parent[child] == tree_parent and child not in affected:
+            stack = [child]
+            affected.add(child)
+            while stack:
+                node = stack.pop()
+                for e in range(expand_offsets[node], expand_offsets[node + 1]):
+                    descendant = expand_targets[e]
+                    if parent[descendant] == node and descendant not in affected:
+                        affected.add(descendant)
+                        stack.append(descendant)
+
+    for node in affected:
+        distance[node] = inf
+        parent[node] = -1
+
+    # Reattach the affected nodes to their best neighbour outside the subtrees
+    frontier = []
+    for node in affected:
+        best, best_parent = inf, -1
+        for e in range(lookup_offsets[node], lookup_offsets[node + 1]):
+            candidate = lookup_targets[e]
+            cost = distance[candidate] + lookup_weights[e]
+            if cost < best:
+                best, best_parent = cost, candidate
+        if best < inf:
+            distance[node] = best
+            parent[node] = best_parent
+            frontier.append((best, node))
+
+    for child, tree_parent, weight in improved:
+        cost = distance[tree_parent] + weight
+        if cost < distance[child]:
+            distance[child] = cost
+            parent[child] = tree_parent
+            frontier.append((cost, child))
+
+    heapq.heapify(frontier)
+    touched = set(affected)
+    while frontier:
+        d, node = heapq.heappop(frontier)
+        if d > distance[node]: #Stale entry
+            continue
+        touched.add(node)
+        for e in range(expand_offsets[node], expand_offsets[node + 1]):
+            child = expand_targets[e]
+            path_cost_to_child = d + expand_weights[e]
+            if path_cost_to_child < distance[child]:
+                distance[child] = path_cost_to_child
+                parent[child] = node
+                heapq.heappush(frontier, (path_cost_to_child, child))
+    return len(touched)
+
+
+class HeapFrontier:
+    """
+    this class represents a priority queue frontier on a plain heapq list, entries are (priority, counter, node) so 
+    equal priorities pop in insertion order and nodes are never compared, an improved entry is pushed again and the 
+    outdated one is left in place to be skipped when it is popped (lazy deletion)
+    """
+    def __init__(self):
+        self.__heap : List[Tuple[float, int, int]] = []
+        self.__counter = 0
+
+    def __len__(self):
+        return len(self.__heap)
+
+    def push(self, node : int, priority : float):
+        self.__counter += 1
+        heapq.heappush(self.__heap, (priority, self.__counter, node))
+
+    def pop(self) -> int:
+        return heapq.heappop(self.__heap)[2]
+
+
+class QueueFrontier:
+    """this class represents a first-in first-out frontier on a deque, the priority is ignored"""
+    def __init__(self):
+        self.__queue : deque = deque()
+
+    def __len__(self):
+        return len(self.__queue)
+
+    def push(self, node : int, priority : float):
+        self.__queue.append(node)
+
+    def pop(self) -> int:
+        return self.__queue.popleft()
+
+
+class StackFrontier:
+    """this class represents a last-in first-out frontier on a list, the priority is ignored"""
+    def __init__(self):
+        self.__stack : List[int] = []
+
+    def __len__(self):
+        return len(self.__stack)
+
+    def push(self, node : int, priority : float):
+        self.__stack.append(node)
+
+    def pop(self) -> int:
+        return self.__stack.pop()
+
+
+def graph_search(graph : CompiledMap, initial : int, goal : int, frontier, priority : Optional[Callable[[float, int], float]] = None,
+                 uses_heuristic : bool = False, stats : Optional[SearchStats] = None) -> Tuple[List[int], float]:
+    """
+    this function is the search kernel shared by the uniform, A*, greedy, breadth-first and depth-first searches, 
+    which only differ in their frontier and in the priority of a node reached with path cost g
+
+    Every node is expanded at most once: expanded nodes go into a closed set, entries of closed nodes still in the 
+    frontier are skipped when popped, and a child is (re)pushed only if it is not closed and was reached more cheaply.
+
+    Args:
+        frontier: A HeapFrontier, QueueFrontier or StackFrontier (anything with push(node, priority), pop() and len).
+        priority: Maps (g, node) to the priority of the node, None for frontiers that ignore it.
+        uses_heuristic: Whether priority evaluates the heuristic once per call, for the statistics.
+    """
+    offsets, targets, weights = graph.get_adjacency()
+    previous = {initial : None}
+    reached = {initial : 0.0}
+    closed = set()
+    push, pop = frontier.push, frontier.pop
+
+    push(initial, 0.0)
+    pushes, pops, peak = 1, 0, 1
+    check_cancelled = get_cancel_check(stats)
+
+    #Start search
+    while frontier:
+        if len(frontier) > peak:
+            peak = len(frontier)
+        node = pop()
+        pops += 1
+        if node in closed: #Stale entry
+            continue
+        if check_cancelled is not None and not len(closed) & CANCEL_CHECK_MASK:
+            check_cancelled()
+
+        if node == goal: #Goal reached
+            if stats is not None:
+                stats.add_search(len(closed), pushes, pops, peak, pushes - 1 if uses_heuristic else 0)
+            return reconstruct_path(previous, goal), reached[goal]
+
+        #Expand node
+        closed.add(node)
+        g_node = reached[node]
+        for e in range(offsets[node], offsets[node + 1]):
+            child = targets[e]
+            if child in closed:
+                continue
+            path_cost_to_child = weights[e] + g_node
+
+            #add child to frontier
+            if child not in reached or path_cost_to_child < reached[child]:
+                reached[child] = path_cost_to_child
+                previous[child] = node
+                push(child, priority(path_cost_to_child, child) if priority is not None else 0.0)
+                pushes += 1
+
+    if stats is not None:
+        stats.add_search(len(closed), pushes, pops, peak, pushes - 1 if uses_heuristic else 0)
+    raise PathNotFoundException("No path found from initial to goal.")
+
+
+def a_star(graph : CompiledMap, initial : int, goal : int, heuristic : Heuristic, stats : Optional[SearchStats] = None) -> Tuple[List[int], float]:
+    """this function uses A* Search to find the shortest path between two nodes of a compiled map"""
+    # f(n) = g(n) + h(n)
+    return graph_search(graph, initial, goal, HeapFrontier(), lambda g, node: g + heuristic(node, goal), True, stats)
+
+
+def greedy(graph : CompiledMap, initial : int, goal : int, heuristic : Heuristic, stats : Optional[SearchStats] = None) -> Tuple[List[int], float]:
+    """this function uses Greedy Search to find the shortest path between two nodes of a compiled map"""
+    # f(n) = h(n)
+    return graph_search(graph, initial, goal, HeapFrontier(), lambda g, node: heuristic(node, goal), True, stats)
+
+
+def uniform(graph : CompiledMap, initial : int, goal : int, heuristic : Heuristic = None, stats : Optional[SearchStats] = None) -> Tuple[List[int], float]:
+    """this function uses Uniform Cost Search to find the shortest path between two nodes of a compiled map"""
+    # f(n) = g(n)
+    return graph_search(graph, initial, goal, HeapFrontier(), lambda g, node: g, False, stats)
+
+
+def dfs(graph : CompiledMap, initial : int, goal : int, heuristic : Heuristic = None, stats : Optional[SearchStats] = None) -> Tuple[List[int], float]:
+    """this function uses Depth-First Search to find a path between two nodes of a compiled map"""
+    return graph_search(graph, initial, goal, StackFrontier(), stats=stats)
+
+
+def bfs(graph : CompiledMap, initial : int, goal : int, heuristic : Heuristic = None, stats : Optional[SearchStats] = None) -> Tuple[List[int], float]:
+    """this function uses Breadth-First Search to find a path between two nodes of a compiled map"""
+    return graph_search(graph, initial, goal, QueueFrontier(), stats=stats)
+
+
+def bidirectional_heuristic(graph : CompiledMap, initial : int, goal : int, heuristic : Optional[Heuristic], stats : Optional[SearchStats] = None) -> Tuple[List[int], float]:
+    """
+    this function uses Bidirectional A* Search to find the shortest path between two nodes of a compiled map, a 
+    forward search from the initial node over the edges and a backward search from the goal over the reversed edges
+
+    Both directions use the average potential p(v) = (h(v, goal) - h(v, initial)) / 2, forward keys are g + p and 
+    backward keys g - p, which keeps the reduced edge costs of both searches non-negative for a consistent heuristic. 
+    Every relaxed edge that reaches a node the other direction has reached updates mu, the best path found so far, 
+    and the search stops once the two smallest keys add up to at least mu, at which point mu is optimal. Without a 
+    heuristic the potential is zero and this is bidirectional Dijkstra.
+    """
+    if initial == goal:
+        if stats is not None:
+            stats.add_search(0, 0, 0, 0)
+        return [initial], 0.0
+
+    adjacency = (graph.get_adjacency(), graph.get_reverse_adjacency())
+    distance = ({initial : 0.0}, {goal : 0.0})
+    parent = ({initial : None}, {goal : None})
+    closed = (set(), set())
+    potentials = {}
+
+    def potential(node : int) -> float:
+        p = potentials.get(node)
+        if p is None:
+            p = potentials[node] = (heuristic(node, goal) - heuristic(node, initial)) / 2 if heuristic is not None else 0.0
+        return p
+
+    frontier = ([(potential(initial), initial)], [(-potential(goal), goal)])
+    best, meeting = float('inf'), None
+    pushes, pops, peak = 2, 0, 2
+    check_cancelled = get_cancel_check(stats)
+
+    while frontier[0] and frontier[1]:
+        peak = max(peak, len(frontier[0]) + len(frontier[1]))
+        if frontier[0][0][0] + frontier[1][0][0] >= best: #No unexplored path can be shorter than mu
+            break
+
+        # Advance the direction with the smaller frontier
+        side = 0 if len(frontier[0]) <= len(frontier[1]) else 1
+        node = heapq.heappop(frontier[side])[1]
+        pops += 1
+        if node in closed[side]: #Stale entry
+            continue
+        if check_cancelled is not None and not pops & CANCEL_CHECK_MASK:
+            check_cancelled()
+        closed[side].add(node)
+
+        offsets, targets, weights = adjacency[side]
+        sign = 1.0 if side == 0 else -1.0
+        g_node = distance[side][node]
+        for e in range(offsets[node], offsets[node + 1]):
+            child = targets[e]
+            path_cost_to_child = g_node + weights[e]
+            if path_cost_to_child < distance[side].get(child, float('inf')):
+                distance[side][child] = path_cost_to_child
+                parent[side][child] = node
+                heapq.heappush(frontier[side], (path_cost_to_child + sign * potential(child), child))
+                pushes += 1
+
+            # Meeting check, a dictionary lookup per relaxed edge
+            other = distance[1 - side].get(child)
+            if other is not None and distance[side][child] + other < best:
+                best, meeting = distance[side][child] + other, child
+
+    if stats is not None:
+        stats.add_search(len(closed[0]) + len(closed[1]), pushes, pops, peak, 2 * len(potentials) if heuristic is not None else 0)
+    if meeting is None:
+        raise PathNotFoundException("No path found from initial to goal.")
+
+    # initial ... meeting from the forward parents, then meeting ... goal from the backward parents
+    path = reconstruct_path(parent[0], meeting)
+    n = parent[1][meeting]
+    while n is not None:
+        path.append(n)
+        n = parent[1][n]
+    return path, best
+
+
+def bidirectional_dijkstra(graph : CompiledMap, initial : int, goal : int, heuristic : Heuristic = None, stats : Optional[SearchStats] = None) -> Tuple[List[int], float]:
+    """this function uses Bidirectional Dijkstra to find the shortest path between two nodes of a compiled map"""
+    return bidirectional_heuristic(graph, initial, goal, None, stats)
+
+
+def iterative_deepening_search(graph : CompiledMap, initial : int, goal : int, heuristic : Heuristic = None, stats : Optional[SearchStats] = None,
+                               max_table_size : int = TRANSPOSITION_TABLE_SIZE) -> Tuple[List[int], float]:
+    """
+    this function defines Iterative Deepening Depth-First Search to find a path between two nodes of a compiled map
+    by exploring paths up to a depth limit and increasing it iteratively
+
+    A transposition table keeps the smallest depth at which each node has been reached. A node reached deeper, in 
+    this or an earlier iteration, cannot be on a path with the fewest edges and is skipped, and a node reached again 
+    at the same depth in the same iteration has already been explored. The table holds up to max_table_size nodes, 
+    beyond that only the nodes on the current path are checked. The search gives up once an iteration is not cut off 
+    by the depth limit anywhere, which means every reachable node has been explored.
+    """
+    offsets, targets, weights = graph.get_adjacency()
+    if initial == goal:
+        if stats is not None:
+            stats.add_search(0, 0, 0, 0)
+        return [initial], 0.0
+
+    expanded, peak = 0, 0
+    check_cancelled = get_cancel_check(stats)
+    depth_limit = 1
+    table = {initial : 0}
+    try:
+        while True:
+            explored = {initial}
+            path, costs, edges = [initial], [0.0], [offsets[initial]]
+            on_path = {initial}
+            expanded += 1
+            cutoff = False
+
+            while path:
+                node = path[-1]
+                e = edges[-1]
+                if e == offsets[node + 1]: #All children explored, backtrack
+                    path.pop()
+                    costs.pop()
+                    edges.pop()
+                    on_path.discard(node)
+                    continue
+                edges[-1] = e + 1
+
+                child = targets[e]
+                depth = len(path)
+                best = table.get(child, depth + 1)
+                if child in on_path or depth > best or (depth == best and child in explored):
+                    continue
+                if child == goal:
+                    return path + [child], costs[-1] + weights[e]
+                if depth >= depth_limit:
+                    cutoff = True
+                    continue
+
+                if depth < best and (len(table) < max_table_size or child in table):
+                    table[child] = depth
+                explored.add(child)
+                path.append(child)
+                costs.append(costs[-1] + weights[e])
+                edges.append(offsets[child])
+                on_path.add(child)
+                expanded += 1
+                if len(path) > peak:
+                    peak = len(path)
+                if check_cancelled is not None and not expanded & CANCEL_CHECK_MASK:
+                    check_cancelled()
+
+            if not cutoff:
+                raise PathNotFoundException("No path found from initial to goal.")
+            depth_limit += 1 # Increment the depth limit for the next iteration
+    finally:
+        if stats is not None:
+            stats.add_search(expanded, expanded, expanded, peak)
+
+
+def iterative_deepening_a_star(graph : CompiledMap, initial : int, goal : int, heuristic : Heuristic, stats : Optional[SearchStats] = None,
+                               max_table_size : int = TRANSPOSITION_TABLE_SIZE) -> Tuple[List[int], float]:
+    """
+    this function defines Iterative Deepening A* Search to find the shortest path between two nodes of a compiled map
+
+    The heuristic is memoized across iterations, and a transposition table keeps the smallest g with which each node
+    has been reached. A node reached with a greater g, in this or an earlier iteration, cannot be on a shortest path 
+    and is skipped, and a node reached again with the same g in the same iteration has already been explored. The 
+    table holds up to max_table_size nodes, beyond that only the nodes on the current path are checked.
+    """
+    offsets, targets, weights = graph.get_adjacency()
+    h_cache : Dict[int, float] = {}
+
+    def h(node : int) -> float:
+        value = h_cache.get(node)
+        if value is None:
+            value = h_cache[node] = heuristic(node, goal)
+        return value
+
+    expanded, peak = 0, 0
+    check_cancelled = get_cancel_check(stats)
+    threshold = h(initial)
+    table = {initial : 0.0}
+    try:
+        if initial == goal:
+            return [initial], 0.0
+
+        # Start the search
+        while True:
+            # Threshold limited depth-first search
+            explored = {initial}
+            path, costs, edges = [initial], [0.0], [offsets[initial]]
+            on_path = {initial}
+            expanded += 1
+            next_threshold = float('inf')
+
+            while path:
+                node = path[-1]
+                e = edges[-1]
+                if e == offsets[node + 1]: #All children explored, backtrack
+                    path.pop()
+                    costs.pop()
+                    edges.pop()
+                    on_path.discard(node)
+                    continue
+                edges[-1] = e + 1
+
+                child = targets[e]
+                g = costs[-1] + weights[e]
+                best = table.get(child, float('inf'))
+                if child in on_path or g > best or (g == best and child in explored):
+                    continue
+                if g < best and (len(table) < max_table_size or child in table):
+                    table[child] = g
+
+                # If f(n) exceeds the threshold, it bounds the next one
+                f = g + h(child)
+                if f > threshold:
+                    if f < next_threshold:
+                        next_threshold = f
+                    continue
+                if child == goal:
+                    return path + [child], g
+
+                explored.add(child)
+                path.append(child)
+                costs.append(g)
+                edges.append(offsets[child])
+                on_path.add(child)
+                expanded += 1
+                if len(path) > peak:
+                    peak = len(path)
+                if check_cancelled is not None and not expanded & CANCEL_CHECK_MASK:
+                    check_cancelled()
+
+            if next_threshold == float('inf'):
+                raise PathNotFoundException("No path found from initial to goal.")
+            threshold = next_threshold
+    finally:
+        if stats is not None:
+            stats.add_search(expanded, expanded, expanded, peak, len(h_cache))
+
+
+def contraction_hierarchies(graph : CompiledMap, initial : int, goal : int, heuristic : Heuristic = None, stats : Optional[SearchStats] = None) -> Tuple[List[int], float]:
+    """
+    this function uses a Contraction Hierarchy to find the shortest path between two nodes of a compiled map, the 
+    hierarchy is preprocessed on the first query and kept as long as the compiled map
+    """
+    # Imported here because contraction imports this module
+    from contraction import get_contraction_hierarchy
+    return get_contraction_hierarchy(graph).query(initial, goal, stats)
+
+
+SEARCH_ALGORITHMS : Dict[str, Callable[..., Tuple[List[int], float]]] = {
+    "a star" : a_star, "a*" : a_star,
+    "greedy" : greedy,
+    "uniform" : uniform, "uni" : uniform,
+    "dfs" : dfs, "depth first search" : dfs, "depth first" : dfs,
+    "bfs" : bfs, "breadth first search" : bfs, "breadth first" : bfs,
+    "bidir" : bidirectional_heuristic, "bidirectional heuristic" : bidirectional_heuristic, "bidirectional" : bidirectional_heuristic,
+    "bidirectional a star" : bidirectional_heuristic, "bidirectional a*" : bidirectional_heuristic,
+    "bidirectional dijkstra" : bidirectional_dijkstra, "bidir dijkstra" : bidirectional_dijkstra,
+    "id a star" : iterative_deepening_a_star, "ida*" : iterative_deepening_a_star, "iterative deepening a*" : iterative_deepening_a_star,
+    "iterative deepening a star" : iterative_deepening_a_star, "deepening a*" : iterative_deepening_a_star, "deepening a star" : iterative_deepening_a_star,
+    "iterative deepening" : iterative_deepening_search, "id" : iterative_deepening_search, "deepening" : iterative_deepening_search,
+    "iterative deepening dfs" : iterative_deepening_search,
+    "contraction hierarchies" : contraction_hierarchies, "contraction hierarchy" : contraction_hierarchies, "ch" : contraction_hierarchies,
+}
+
+# The searches that always return a shortest path, precomputed shortest routes may answer for them
+OPTIMAL_SEARCH_ALGORITHMS = (a_star, uniform, bidirectional_heuristic, bidirectional_dijkstra, iterative_deepening_a_star, contraction_hierarchies)
+
+
+def get_search_algorithm(search_algorithm : str) -> Callable[..., Tuple[List[int], float]]:
+    """returns the search function registered under the given name or alias"""
+    try:
+        return SEARCH_ALGORITHMS[search_algorithm.lower()]
+    except KeyError:
+        raise ValueError("Invalid search algorithm.")
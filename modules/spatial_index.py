@@ -0,0 +1,141 @@
+from typing import Dict, Hashable, Iterable, List, Tuple
+import numpy as np
+import heapq
+import math
+
+# Average number of points per cell the automatic cell size aims for
+POINTS_PER_CELL = 2.0
+
+# Cell size used when there are too few points to derive one, in degrees (about 50 m)
+DEFAULT_CELL_SIZE = 0.0005
+
+
+class SpatialIndex:
+    """
+    this class represents a uniform grid over (latitude, longitude) points that answers nearest and k-nearest
+    queries by searching rings of cells outwards from the query, distances are euclidean in degrees
+
+    Points can be inserted and removed at any time. A lookup visits the few cells around the query, so its cost
+    depends on the local density instead of the total number of points.
+    """
+    def __init__(self, cell_size : float = DEFAULT_CELL_SIZE):
+        self.__cell_size = cell_size
+        self.__cells : Dict[Tuple[int, int], List[Hashable]] = {}
+        self.__points : Dict[Hashable, Tuple[float, float, int]] = {}
+        self.__sequence = 0
+
+    @staticmethod
+    def from_points(points : Iterable[Tuple[Hashable, float, float]]) -> "SpatialIndex":
+        """this function builds an index over (id, latitude, longitude) points with a cell size fitted to their extent"""
+        points = list(points)
+        cell_size = DEFAULT_CELL_SIZE
+        if len(points) > 1:
+            coords = np.array([[lat, lon] for _, lat, lon in points], dtype=np.float64)
+            height, width = np.ptp(coords, axis=0)
+            area = max(height, cell_size) * max(width, cell_size)
+            cell_size = math.sqrt(area * POINTS_PER_CELL / len(points))
+
+        index = SpatialIndex(cell_size)
+        for id, lat, lon in points:
+            index.insert(id, lat, lon)
+        return index
+
+    def __len__(self):
+        return len(self.__points)
+
+    def __contains__(self, id : Hashable):
+        return id in self.__points
+
+    def get_cell_size(self) -> float:
+        return self.__cell_size
+
+    def __cell(self, lat : float, lon : float) -> Tuple[int, int]:
+        return (math.floor(lat / self.__cell_size), math.floor(lon / self.__cell_size))
+
+    def insert(self, id : Hashable, lat : float, lon : float):
+        """adds a point to the index, a point with the same id is replaced"""
+        if id in self.__points:
+            self.remove(id)
+        self.__points[id] = (lat, lon, self.__sequence)
+        self.__sequence += 1
+        self.__cells.setdefault(self.__cell(lat, lon), []).append(id)
+
+    def remove(self, id : Hashable):
+        """removes a point from the index, unknown ids are ignored"""
+        point = self.__points.pop(id, None)
+        if point is None:
+            return
+        cell = self.__cell(point[0], point[1])
+        bucket = self.__cells[cell]
+        bucket.remove(id)
+        if not bucket:
+            del self.__cells[cell]
+
+    def nearest(self, coord : Tuple[float, float]) -> Hashable:
+        """returns the id of the point nearest to the coordinate, raises ValueError if the index is empty or the coordinate is not finite"""
+        result = self.k_nearest(coord, 1)
+        if not result:
+            raise ValueError("The spatial index is empty.")
+        return result[0][0]
+
+    def k_nearest(self, coord : Tuple[float, float], k : int) -> List[Tuple[Hashable, float]]:
+        """
+        returns up to k (id, distance) pairs ordered from nearest to farthest, ties go to the earlier inserted point,
+        raises ValueError if the coordinate is not finite
+        """
+        lat, lon = float(coord[0]), float(coord[1])
+        if not (math.isfinite(lat) and math.isfinite(lon)):
+            raise ValueError("The coordinate must be finite.")
+        k = min(k, len(self.__points))
+        if k <= 0:
+            return []
+
+        center_x, center_y = self.__cell(lat, lon)
+
+        # Max-heap of the best k candidates so far, stored as (-distance, -sequence, id)
+        best : List[Tuple[float, int, Hashable]] = []
+        visited_cells = 0
+        ring = 0
+        while True:
+            for cell in self.__ring_cells(center_x, center_y, ring):
+                bucket = self.__cells.get(cell)
+                visited_cells += 1
+                if bucket is None:
+                    continue
+                for id in bucket:
+                    p_lat, p_lon, sequence = self.__points[id]
+                    candidate = (-math.hypot(p_lat - lat, p_lon - lon), -sequence, id)
+                    if len(best) < k:
+                        heapq.heappush(best, candidate)
+                    elif candidate > best[0]:
+                        heapq.heapreplace(best, candidate)
+
+            # Every point outside the rings searched so far is at least ring * cell_size away
+            if len(best) == k and -best[0][0] <= ring * self.__cell_size:
+                break
+
+            # The query is far from the points, searching ever larger rings would cost more than a full scan
+            if visited_cells > len(self.__cells) + 8:
+                return self.__scan(lat, lon, k)
+            ring += 1
+
+        return [(id, -neg_distance) for neg_distance, _, id in sorted(best, reverse=True)]
+
+    def __ring_cells(self, center_x : int, center_y : int, ring : int) -> Iterable[Tuple[int, int]]:
+        if ring == 0:
+            yield (center_x, center_y)
+            return
+        for dx in range(-ring, ring + 1):
+            yield (center_x + dx, center_y - ring)
+            yield (center_x + dx, center_y + ring)
+        for dy in range(-ring + 1, ring):
+            yield (center_x - ring, center_y + dy)
+            yield (center_x + ring, center_y + dy)
+
+    def __scan(self, lat : float, lon : float, k : int) -> List[Tuple[Hashable, float]]:
+        """brute-force fallback used when the query lies far outside the indexed area"""
+        ids = list(self.__points.keys())
+        values = np.array(list(self.__points.values()), dtype=np.float64)
+        distances = np.hypot(values[:, 0] - lat, values[:, 1] - lon)
+        order = np.lexsort((values[:, 2], distances))[:k]
+        return [(ids[i], float(distances[i])) for i in order]
@@ -0,0 +1,109 @@
+from typing import List, Optional, Tuple
+from contextlib import contextmanager
+import builtins
+import sys
+import threading
+import time
+
+# Command line flag of the entry points that turns the profiler on
+PROFILE_FLAG = "--profile-startup"
+
+
+class StartupProfiler:
+    """
+    this class represents a breakdown of where the startup of an entry point goes: how long each module took to
+    import the first time, with and without the modules it imported itself, and how long each named phase took
+
+    Imports are timed by wrapping builtins.__import__, so it has to be started before the imports it should see, at
+    the very top of the entry point. Imports on other threads (the map warm up) are recorded too, under their thread.
+    """
+    def __init__(self):
+        self.__start = time.perf_counter()
+        self.__imports : List[Tuple[str, str, float, float]] = []  # module, thread, cumulative, self
+        self.__phases : List[Tuple[str, float]] = []
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+        self.__original_import = None
+
+    def start(self) -> "StartupProfiler":
+        """starts timing imports"""
+        if self.__original_import is None:
+            self.__original_import = builtins.__import__
+            builtins.__import__ = self.__import
+        return self
+
+    def stop(self):
+        """stops timing imports"""
+        if self.__original_import is not None:
+            builtins.__import__ = self.__original_import
+            self.__original_import = None
+
+    def __import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        module = name
+        if level > 0:
+            package = (globals or {}).get("__package__") or ""
+            module = f"{package.rsplit('.', level - 1)[0]}.{name}" if name else package
+        if module in sys.modules:
+            return self.__original_import(name, globals, locals, fromlist, level)
+
+        # Time spent importing the modules this one imports is subtracted from its self time
+        children = getattr(self.__local, "children", None)
+        if children is None:
+            children = self.__local.children = [0.0]
+        children.append(0.0)
+        start = time.perf_counter()
+        try:
+            return self.__original_import(name, globals, locals, fromlist, level)
+        finally:
+            cumulative = time.perf_counter() - start
+            own = cumulative - children.pop()
+            children[-1] += cumulative
+            with self.__lock:
+                self.__imports.append((module, threading.current_thread().name, cumulative, own))
+
+    def get_elapsed(self) -> float:
+        """returns the seconds since the profiler was created"""
+        return time.perf_counter() - self.__start
+
+    def add_phase(self, phase : str, seconds : float):
+        with self.__lock:
+            self.__phases.append((phase, seconds))
+
+    @contextmanager
+    def phase(self, phase : str):
+        """times the block as the given phase"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(phase, time.perf_counter() - start)
+
+    def get_phases(self) -> List[Tuple[str, float]]:
+        return list(self.__phases)
+
+    def get_imports(self) -> List[Tuple[str, str, float, float]]:
+        """returns (module, thread, cumulative seconds, self seconds) of every module imported, in import order"""
+        return list(self.__imports)
+
+    def report(self, top : int = 25) -> str:
+        """returns the phases in order and the slowest imports by cumulative time, as a table"""
+        lines = [f"Startup profile ({self.get_elapsed() * 1000:.1f} ms since start)", "", "Phases:"]
+        for phase, seconds in self.get_phases():
+            lines.append(f"  {seconds * 1000:10.1f} ms  {phase}")
+
+        imports = self.get_imports()
+        total_self = sum(own for _, _, _, own in imports)
+        lines += ["", f"Imports ({len(imports)} modules, {total_self * 1000:.1f} ms in total), slowest {min(top, len(imports))}:",
+                  f"  {'cumulative':>13}  {'self':>10}  module"]
+        for module, thread, cumulative, own in sorted(imports, key=lambda entry: -entry[2])[:top]:
+            where = "" if thread == "MainThread" else f"  [{thread}]"
+            lines.append(f"  {cumulative * 1000:10.1f} ms  {own * 1000:7.1f} ms  {module}{where}")
+        return "\n".join(lines)
+
+
+def start_if_requested(argv : Optional[List[str]] = None) -> Optional[StartupProfiler]:
+    """returns a started profiler if the command line has --profile-startup, None otherwise"""
+    if PROFILE_FLAG in (sys.argv if argv is None else argv):
+        return StartupProfiler().start()
+    return None
+
@@ -1,26 +1,13 @@
-import requests
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 from location import Location
+from location_provider import get_location_provider
 
-def get_curr_loc() -> Tuple[float, float]:
-    """this function fetches the current geolocation of the user based on their public IP address."""
-    # Send a GET request to ipinfo.io to get geolocation data based on the public IP
-    try:
-        response = requests.get('http://ipinfo.io/json')
-        data = response.json()
-
-        # Extract the location (latitude and longitude)
-        loc = data.get('loc', '').split(',')
-        if len(loc) == 2:
-            latitude = float(loc[0])
-            longitude = float(loc[1])
-            return latitude, longitude
-        else:
-            raise ValueError("Location data is incomplete or invalid.")
-
-    except requests.exceptions.RequestException as e:
-        print(f"Error while fetching location: {e}")
-        return None
+def get_curr_loc() -> Optional[Tuple[float, float]]:
+    """this function fetches the current geolocation of the user, falling back to the last known one if it times out."""
+    # Blocks for at most the provider timeout, the UI uses get_location_provider().fetch_async() instead
+    provider = get_location_provider()
+    location = provider.get_location()
+    return location if location is not None else provider.get_last_known()
 
 
 def main():